@@ -2,6 +2,7 @@
 Конфигурация бота
 """
 import os
+import socket
 from datetime import timedelta
 from typing import List, Optional
 
@@ -30,6 +31,26 @@ MANAGER_GROUP_CHAT_ID: Optional[int] = int(os.getenv("MANAGER_GROUP_CHAT_ID", "0
 # Установите переменную окружения MAX_CROSSPOST_CHAT_ID (например, числовой ID чата или канала)
 MAX_CROSSPOST_CHAT_ID: Optional[int] = int(os.getenv("MAX_CROSSPOST_CHAT_ID", "0")) or None
 
+# ==================== ПУЛ СОЕДИНЕНИЙ С БД ====================
+
+# Постоянные соединения пула и допустимое превышение при пиковой нагрузке
+DB_POOL_SIZE: int = max(1, int(os.getenv("DB_POOL_SIZE", "10")))
+DB_MAX_OVERFLOW: int = max(0, int(os.getenv("DB_MAX_OVERFLOW", "20")))
+# Сколько секунд ждать свободного соединения, прежде чем выдать ошибку
+DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Пересоздавать соединения старше N секунд (защита от обрыва прокси/балансировщиком)
+DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Проверять соединение перед выдачей из пула (SELECT 1)
+DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Кэш подготовленных выражений asyncpg (0 — выключить, нужно для pgbouncer в режиме transaction)
+DB_STATEMENT_CACHE_SIZE: int = max(0, int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100")))
+# Таймаут выполнения одной команды на стороне клиента (секунды)
+DB_COMMAND_TIMEOUT: float = float(os.getenv("DB_COMMAND_TIMEOUT", "60"))
+# statement_timeout на стороне сервера (миллисекунды, 0 — без ограничения)
+DB_STATEMENT_TIMEOUT_MS: int = max(0, int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0")))
+# Имя приложения в pg_stat_activity
+DB_APPLICATION_NAME: str = os.getenv("DB_APPLICATION_NAME", "ad-crm-bot")
+
 # ==================== ЧАСОВОЙ ПОЯС ====================
 
 # Смещение локального времени относительно UTC (в часах).
@@ -67,11 +88,129 @@ CLAUDE_MODEL = "claude-3-haiku-20240307"
 
 TELEMETR_API_TOKEN = os.getenv("TELEMETR_API_TOKEN", "")
 TELEMETR_API_URL = "https://api.telemetr.io"
+# Одновременных соединений с Telemetr API (одна долгоживущая сессия)
+TELEMETR_MAX_CONNECTIONS: int = max(1, int(os.getenv("TELEMETR_MAX_CONNECTIONS", "5")))
+# Запросов к Telemetr API в секунду
+TELEMETR_RATE: float = max(0.1, float(os.getenv("TELEMETR_RATE", "5")))
+# Сколько секунд статистика канала из Telemetr отдаётся из памяти
+TELEMETR_STATS_TTL_SECONDS: float = max(0.0, float(os.getenv("TELEMETR_STATS_TTL_SECONDS", "3600")))
+# Пауза всех запросов после ответа 426 (квота исчерпана); удваивается
+# при повторных 426 до TELEMETR_QUOTA_BACKOFF_MAX_SECONDS
+TELEMETR_QUOTA_BACKOFF_SECONDS: float = max(1.0, float(os.getenv("TELEMETR_QUOTA_BACKOFF_SECONDS", "60")))
+TELEMETR_QUOTA_BACKOFF_MAX_SECONDS: float = max(1.0, float(os.getenv("TELEMETR_QUOTA_BACKOFF_MAX_SECONDS", "3600")))
+# Как часто (в часах) аналитика всех каналов синхронизируется с Telemetr (0 — выключено)
+TELEMETR_SYNC_HOURS: float = max(0.0, float(os.getenv("TELEMETR_SYNC_HOURS", "12")))
 
 # ==================== АВТОПОСТИНГ ====================
 
 AUTOPOST_ENABLED = os.getenv("AUTOPOST_ENABLED", "true").lower() == "true"
 
+# Число параллельных воркеров публикации: посты разных каналов
+# публикуются одновременно, посты одного канала — по очереди.
+PUBLISH_WORKERS: int = max(1, int(os.getenv("PUBLISH_WORKERS", "8")))
+
+# Сколько наступивших постов захватывается одним запросом к БД.
+PUBLISH_CLAIM_BATCH: int = max(1, int(os.getenv("PUBLISH_CLAIM_BATCH", "50")))
+
+# Захваченный пост остаётся в статусе pending с пометкой владельца
+# (claimed_by/claimed_at) и переводится в publishing только перед отправкой.
+# Захват, не завершённый за PUBLISH_CLAIM_LEASE_SECONDS секунд (экземпляр
+# бота упал), истекает: пост снова может взять любой экземпляр.
+PUBLISH_CLAIM_LEASE_SECONDS: int = max(60, int(os.getenv("PUBLISH_CLAIM_LEASE_SECONDS", "600")))
+
+# Имя экземпляра бота — владелец захваченных постов. Должно быть постоянным
+# между перезапусками одного экземпляра и разным у реплик (по умолчанию — имя хоста).
+INSTANCE_ID: str = (os.getenv("INSTANCE_ID") or socket.gethostname())[:64]
+# Посты публикуются событийно — точно ко времени ближайшего поста.
+# Раз в PUBLISH_SAFETY_POLL_MINUTES минут очередь перечитывается из БД
+# (подхватывает посты, созданные другим экземпляром бота или вручную).
+PUBLISH_SAFETY_POLL_MINUTES: int = max(1, int(os.getenv("PUBLISH_SAFETY_POLL_MINUTES", "10")))
+
+# Сколько просроченных постов удаляется из каналов за одну пачку.
+DELETE_BATCH_SIZE: int = max(1, int(os.getenv("DELETE_BATCH_SIZE", "100")))
+# Сколько сообщений удаляется из каналов одновременно. Удаления учитываются
+# только в общем лимите бота, не в лимите канала, — публикации не ждут их.
+DELETE_WORKERS: int = max(1, int(os.getenv("DELETE_WORKERS", "4")))
+
+# Период освобождения слотов с истёкшей резервацией (в секундах).
+SLOT_CLEANUP_INTERVAL_SECONDS: int = max(5, int(os.getenv("SLOT_CLEANUP_INTERVAL_SECONDS", "30")))
+
+# ==================== ЛИМИТЫ TELEGRAM ====================
+
+# Глобальный лимит отправки сообщений ботом (сообщений в секунду).
+# Telegram допускает ~30 msg/s; оставляем запас.
+TG_GLOBAL_RATE: float = float(os.getenv("TG_GLOBAL_RATE", "25"))
+# Лимит сообщений в минуту в одну группу/канал (Telegram допускает ~20).
+TG_GROUP_RATE_PER_MIN: float = float(os.getenv("TG_GROUP_RATE_PER_MIN", "20"))
+# Сколько каналов плановое обновление опрашивает одновременно
+CHANNEL_REFRESH_CONCURRENCY: int = max(1, int(os.getenv("CHANNEL_REFRESH_CONCURRENCY", "10")))
+
+# Рассылка об обновлении: предельный темп (сообщений в секунду, снижается
+# автоматически при ответах 429) и число одновременных отправок
+BROADCAST_RATE: float = max(1.0, float(os.getenv("BROADCAST_RATE", "20")))
+BROADCAST_CONCURRENCY: int = max(1, int(os.getenv("BROADCAST_CONCURRENCY", "10")))
+# Сколько получателей забирается за раз (и фиксируется в БД после отправки)
+BROADCAST_CHUNK: int = max(1, int(os.getenv("BROADCAST_CHUNK", "200")))
+# Как часто (секунд) писать в лог прогресс рассылки
+BROADCAST_PROGRESS_SECONDS: float = max(1.0, float(os.getenv("BROADCAST_PROGRESS_SECONDS", "30")))
+
+# ==================== УВЕДОМЛЕНИЯ ====================
+
+# Окно (в секундах), за которое однотипные уведомления склеиваются в дайджест.
+NOTIFY_COALESCE_SECONDS: float = float(os.getenv("NOTIFY_COALESCE_SECONDS", "2"))
+# Число повторных попыток отправки уведомления при сбое.
+NOTIFY_MAX_RETRIES: int = max(0, int(os.getenv("NOTIFY_MAX_RETRIES", "3")))
+
+# ==================== КРОССПОСТИНГ В MAX ====================
+
+# Кросспосты отправляются в фоне из таблицы crosspost_outbox.
+# Сколько записей забирается за один проход и сколько отправляется одновременно
+CROSSPOST_OUTBOX_BATCH: int = max(1, int(os.getenv("CROSSPOST_OUTBOX_BATCH", "20")))
+CROSSPOST_OUTBOX_CONCURRENCY: int = max(1, int(os.getenv("CROSSPOST_OUTBOX_CONCURRENCY", "3")))
+# Период проверки очереди (секунд), если новых кросспостов не поступало
+CROSSPOST_OUTBOX_POLL_SECONDS: float = max(1.0, float(os.getenv("CROSSPOST_OUTBOX_POLL_SECONDS", "30")))
+# Повторы при сбое Max API: задержка удваивается с каждой попыткой
+CROSSPOST_MAX_ATTEMPTS: int = max(1, int(os.getenv("CROSSPOST_MAX_ATTEMPTS", "6")))
+CROSSPOST_RETRY_BASE_SECONDS: float = max(1.0, float(os.getenv("CROSSPOST_RETRY_BASE_SECONDS", "30")))
+
+# ==================== КЭШ НАСТРОЕК ====================
+
+# Настройки bot_settings читаются из памяти; раз в это время (секунд)
+# кэш перечитывается из БД как страховка от изменений в обход set_setting.
+SETTINGS_CACHE_TTL_SECONDS: float = max(1.0, float(os.getenv("SETTINGS_CACHE_TTL_SECONDS", "300")))
+# Слушать LISTEN bot_settings_changed, чтобы изменения с других экземпляров
+# бота применялись сразу (нужно при нескольких репликах).
+SETTINGS_LISTEN_NOTIFY = os.getenv("SETTINGS_LISTEN_NOTIFY", "false").lower() == "true"
+
+# ==================== КЭШ МЕТРИК ====================
+
+# Сколько секунд экраны метрик отдаются из памяти (0 — без кэша).
+# Подтверждение оплаты и запись аналитики сбрасывают кэш досрочно.
+METRICS_CACHE_TTL_SECONDS: float = max(0.0, float(os.getenv("METRICS_CACHE_TTL_SECONDS", "60")))
+
+# ==================== ДНЕВНЫЕ СВОДКИ ====================
+
+# Задержка (в секундах), с которой изменённые дни пересчитываются в
+# daily_order_stats / daily_post_stats: частые изменения склеиваются.
+ROLLUP_FLUSH_SECONDS: float = max(0.0, float(os.getenv("ROLLUP_FLUSH_SECONDS", "5")))
+
+# ==================== ПРОСМОТРЫ ПОСТОВ ====================
+
+# Как часто (в секундах) буфер просмотров из channel_post-обновлений
+# записывается в post_analytics / post_view_snapshots.
+VIEW_FLUSH_SECONDS: float = max(1.0, float(os.getenv("VIEW_FLUSH_SECONDS", "10")))
+
+# Сколько дней снимки просмотров хранятся с почасовой точностью;
+# более старые прореживаются до одной точки в день.
+SNAPSHOT_HOURLY_DAYS: int = max(1, int(os.getenv("SNAPSHOT_HOURLY_DAYS", "7")))
+
+# ==================== ПРОФИЛЬ ЗАПУСКА ====================
+
+# Записать в лог время импорта модулей при запуске (самые медленные
+# STARTUP_IMPORT_PROFILE_TOP модулей) — для поиска причин медленного старта.
+STARTUP_IMPORT_PROFILE = os.getenv("STARTUP_IMPORT_PROFILE", "false").lower() == "true"
+STARTUP_IMPORT_PROFILE_TOP: int = max(1, int(os.getenv("STARTUP_IMPORT_PROFILE_TOP", "20")))
+
 # ==================== ВЕРСИЯ ОБНОВЛЕНИЯ ====================
 
 # Увеличивайте UPDATE_VERSION и обновляйте UPDATE_NOTES перед каждым деплоем.
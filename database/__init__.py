@@ -3,14 +3,15 @@ Database package
 """
 from database.models import (
     Base, Channel, CategoryCPM, Slot, Client, Manager, 
-    Order, ManagerPayout, ScheduledPost, Competition, AIInsight, PostAnalytics,
-    PostViewSnapshot, PromoCode, BotSetting
+    Order, ManagerPayout, ScheduledPost, CrosspostOutbox, Competition, AIInsight, PostAnalytics,
+    PostViewSnapshot, PromoCode, BotSetting, BroadcastDelivery, DailyOrderStats, DailyPostStats
 )
-from database.session import async_session_maker, init_db
+from database.session import async_session_maker, init_db, get_pool_stats
 
 __all__ = [
     "Base", "Channel", "CategoryCPM", "Slot", "Client", "Manager",
-    "Order", "ManagerPayout", "ScheduledPost", "Competition", "AIInsight",
-    "PostAnalytics", "PostViewSnapshot", "PromoCode", "BotSetting",
-    "async_session_maker", "init_db"
+    "Order", "ManagerPayout", "ScheduledPost", "CrosspostOutbox", "Competition", "AIInsight",
+    "PostAnalytics", "PostViewSnapshot", "PromoCode", "BotSetting", "BroadcastDelivery",
+    "DailyOrderStats", "DailyPostStats",
+    "async_session_maker", "init_db", "get_pool_stats"
 ]
@@ -0,0 +1,346 @@
+"""
+Версионные миграции схемы БД.
+
+Каждый шаг миграции имеет номер версии и применяется ровно один раз;
+номер последнего применённого шага хранится в таблице ``schema_version``.
+При обычном перезапуске бота выполняется единственный запрос — проверка
+версии схемы, — а ALTER/UPDATE/CREATE INDEX не повторяются.
+
+Правила добавления миграций:
+ - новый шаг добавляется в конец MIGRATIONS со следующим номером версии;
+ - уже выпущенные шаги не изменяются (их версия записана в рабочих БД);
+ - выражения пишутся идемпотентно (IF NOT EXISTS и т.п.): шаг, прерванный
+   на середине, повторяется целиком при следующем запуске;
+ - индексы создаются через CREATE INDEX CONCURRENTLY, чтобы не блокировать
+   запись в таблицу на время построения индекса;
+ - новые таблицы создаёт Base.metadata.create_all (он выполняется перед
+   применением ожидающих шагов), но для них всё равно нужен новый шаг —
+   иначе быстрый путь при старте не заметит изменений схемы.
+"""
+import logging
+import re
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки: несколько экземпляров бота не мигрируют одновременно
+MIGRATION_LOCK_KEY = 7_351_002
+
+_CREATE_SCHEMA_VERSION = (
+    "CREATE TABLE IF NOT EXISTS schema_version ("
+    "version INTEGER PRIMARY KEY, "
+    "description VARCHAR(255) NOT NULL, "
+    "applied_at TIMESTAMP NOT NULL DEFAULT NOW())"
+)
+
+_CONCURRENT_INDEX_RE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)",
+    re.IGNORECASE,
+)
+
+# Шаги миграций по возрастанию версии.
+# best_effort=True — ошибки отдельных выражений только логируются (так
+# работали миграции до введения версий); иначе шаг считается неприменённым,
+# и следующие шаги откладываются до следующего запуска.
+MIGRATIONS = [
+    {
+        "version": 1,
+        "description": "Базовая схема: колонки и индексы, добавленные до версионных миграций",
+        "best_effort": True,
+        "statements": [
+            "ALTER TABLE channels ADD COLUMN IF NOT EXISTS avg_reach_24h INTEGER DEFAULT 0",
+            "ALTER TABLE channels ADD COLUMN IF NOT EXISTS avg_reach_48h INTEGER DEFAULT 0",
+            "ALTER TABLE channels ADD COLUMN IF NOT EXISTS avg_reach_72h INTEGER DEFAULT 0",
+            "ALTER TABLE channels ADD COLUMN IF NOT EXISTS err_percent NUMERIC(5, 2) DEFAULT 0",
+            "ALTER TABLE channels ADD COLUMN IF NOT EXISTS err24_percent NUMERIC(5, 2) DEFAULT 0",
+            "ALTER TABLE channels ADD COLUMN IF NOT EXISTS ci_index NUMERIC(8, 2) DEFAULT 0",
+            "ALTER TABLE channels ADD COLUMN IF NOT EXISTS cpm NUMERIC(10, 2) DEFAULT 0",
+            "ALTER TABLE channels ADD COLUMN IF NOT EXISTS telemetr_id VARCHAR(20)",
+            "ALTER TABLE channels ADD COLUMN IF NOT EXISTS analytics_updated TIMESTAMP",
+            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS ad_content TEXT",
+            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS ad_file_id VARCHAR(500)",
+            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS ad_file_type VARCHAR(20)",
+            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS format_type VARCHAR(20) DEFAULT '1/24'",
+            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS payment_method VARCHAR(50)",
+            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS payment_screenshot VARCHAR(500)",
+            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS paid_at TIMESTAMP",
+            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS posted_at TIMESTAMP",
+            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS promo_code VARCHAR(50)",
+            "ALTER TABLE managers ADD COLUMN IF NOT EXISTS experience_points INTEGER DEFAULT 0",
+            "ALTER TABLE managers ADD COLUMN IF NOT EXISTS total_earned NUMERIC(12, 2) DEFAULT 0",
+            "ALTER TABLE managers ADD COLUMN IF NOT EXISTS training_score INTEGER DEFAULT 0",
+            "ALTER TABLE managers ADD COLUMN IF NOT EXISTS current_lesson INTEGER DEFAULT 1",
+            "ALTER TABLE clients ADD COLUMN IF NOT EXISTS referrer_id INTEGER REFERENCES managers(id)",
+            "ALTER TABLE managers ADD COLUMN IF NOT EXISTS max_id BIGINT",
+            "ALTER TABLE clients ADD COLUMN IF NOT EXISTS max_id BIGINT",
+            "ALTER TABLE scheduled_posts ALTER COLUMN order_id DROP NOT NULL",
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS scheduled_time TIMESTAMP",
+            "DO $$ BEGIN IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='scheduled_posts' AND column_name='scheduled_at') THEN UPDATE scheduled_posts SET scheduled_time = scheduled_at WHERE scheduled_time IS NULL AND scheduled_at IS NOT NULL; END IF; END $$",
+            "DO $$ BEGIN IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='scheduled_posts' AND column_name='scheduled_at') THEN ALTER TABLE scheduled_posts ALTER COLUMN scheduled_at DROP NOT NULL; END IF; END $$",
+            # Миграции для scheduled_posts (добавлены позже)
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS inline_buttons TEXT",
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS delete_after_hours INTEGER DEFAULT 24",
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS message_id BIGINT",
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP",
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS created_by BIGINT",
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS payment_screenshot VARCHAR(500)",
+            # Миграции для post_analytics (добавлены позже)
+            "ALTER TABLE post_analytics ADD COLUMN IF NOT EXISTS channel_id INTEGER REFERENCES channels(id) ON DELETE CASCADE",
+            "ALTER TABLE post_analytics ADD COLUMN IF NOT EXISTS saves INTEGER DEFAULT 0",
+            "ALTER TABLE post_analytics ADD COLUMN IF NOT EXISTS comments INTEGER DEFAULT 0",
+            "ALTER TABLE post_analytics ADD COLUMN IF NOT EXISTS ai_recommendation TEXT",
+            "ALTER TABLE post_analytics ADD COLUMN IF NOT EXISTS recorded_by BIGINT",
+            "ALTER TABLE post_analytics ADD COLUMN IF NOT EXISTS order_id INTEGER REFERENCES orders(id) ON DELETE SET NULL",
+            "ALTER TABLE post_analytics ADD COLUMN IF NOT EXISTS recorded_at TIMESTAMP DEFAULT NOW()",
+            "ALTER TABLE managers ADD COLUMN IF NOT EXISTS timezone_offset INTEGER DEFAULT 3",
+            "ALTER TABLE managers ADD COLUMN IF NOT EXISTS role VARCHAR(20)",
+            "ALTER TABLE channels ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE",
+            "UPDATE channels SET is_active = TRUE WHERE is_active IS NULL",
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS signature VARCHAR(255)",
+            # Заполняем channel_id для записей post_analytics, у которых он не задан,
+            # беря значение из связанного scheduled_post
+            "UPDATE post_analytics pa SET channel_id = sp.channel_id FROM scheduled_posts sp WHERE pa.scheduled_post_id = sp.id AND pa.channel_id IS NULL",
+            # Индексы для ускорения частых запросов (планировщик, бронирование, статистика)
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_scheduled_posts_status_time ON scheduled_posts(status, scheduled_time)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_scheduled_posts_status_posted ON scheduled_posts(status, posted_at, deleted_at, message_id)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_slots_channel_status_date ON slots(channel_id, status, slot_date)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_client_id ON orders(client_id)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_manager_id ON orders(manager_id)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_channel_status ON orders(slot_id, status)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_managers_telegram_id ON managers(telegram_id)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_clients_telegram_id ON clients(telegram_id)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_promo_codes_code ON promo_codes(code) WHERE is_active = TRUE",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_post_analytics_channel ON post_analytics(channel_id)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_post_analytics_order ON post_analytics(order_id)",
+            # Кросспостинг в сеть Max
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS crosspost_to_max BOOLEAN DEFAULT FALSE",
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS max_post_id VARCHAR(100)",
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS max_posted_at TIMESTAMP",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_scheduled_posts_max_posted ON scheduled_posts(crosspost_to_max, max_posted_at)",
+            # Цена и формат для прямой подачи постов менеджером
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS price NUMERIC(12, 2)",
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS format_type VARCHAR(20)",
+            # Аренда захвата постов на публикацию
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(64)",
+            "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP",
+        ],
+    },
+    {
+        "version": 2,
+        "description": "Индексы для освобождения резерваций и удаления опубликованных постов",
+        "statements": [
+            # Частичный индекс для освобождения просроченных резерваций (cleanup_expired_slots)
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_slots_reserved_until ON slots(reserved_until) WHERE status = 'reserved'",
+            # Индекс по моменту удаления поста (delete_posted_posts вычисляет срок в SQL)
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_scheduled_posts_delete_due ON scheduled_posts ((posted_at + delete_after_hours * INTERVAL '1 hour')) WHERE status = 'posted' AND deleted_at IS NULL AND message_id IS NOT NULL AND delete_after_hours > 0",
+        ],
+    },
+    {
+        "version": 3,
+        "description": "Дневные сводки daily_order_stats / daily_post_stats и индексы для их пересчёта",
+        "statements": [
+            # Таблицы сводок создаёт create_all; заполняет их services/rollups.py при старте
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_created_at ON orders(created_at)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_paid_at_confirmed ON orders(paid_at) WHERE status = 'payment_confirmed'",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_scheduled_posts_posted_at ON scheduled_posts(posted_at)",
+        ],
+    },
+    {
+        "version": 4,
+        "description": "Уникальная запись post_analytics на пост (для INSERT … ON CONFLICT)",
+        "statements": [
+            # Сливаем дубликаты в самую раннюю запись: счётчики — по максимуму
+            "UPDATE post_analytics pa SET views = d.views, reactions = d.reactions, forwards = d.forwards, "
+            "saves = d.saves, comments = d.comments, recorded_at = d.recorded_at "
+            "FROM (SELECT scheduled_post_id, MIN(id) AS keep_id, MAX(views) AS views, MAX(reactions) AS reactions, "
+            "MAX(forwards) AS forwards, MAX(saves) AS saves, MAX(comments) AS comments, MAX(recorded_at) AS recorded_at "
+            "FROM post_analytics WHERE scheduled_post_id IS NOT NULL GROUP BY scheduled_post_id HAVING COUNT(*) > 1) d "
+            "WHERE pa.id = d.keep_id",
+            "DELETE FROM post_analytics pa USING post_analytics keep "
+            "WHERE pa.scheduled_post_id = keep.scheduled_post_id AND pa.id > keep.id",
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_post_analytics_scheduled_post ON post_analytics(scheduled_post_id)",
+        ],
+    },
+    {
+        "version": 5,
+        "description": "Помесячное секционирование post_view_snapshots",
+        "statements": [
+            # Обычную таблицу откладываем в сторону (имена индексов глобальны в схеме)
+            """
+            DO $$
+            BEGIN
+                IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('post_view_snapshots')) = 'r' THEN
+                    ALTER TABLE post_view_snapshots RENAME TO post_view_snapshots_legacy;
+                    ALTER INDEX IF EXISTS post_view_snapshots_pkey RENAME TO post_view_snapshots_legacy_pkey;
+                    ALTER INDEX IF EXISTS idx_post_view_snapshots_post RENAME TO idx_post_view_snapshots_legacy_post;
+                END IF;
+            END $$
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS post_view_snapshots (
+                scheduled_post_id INTEGER NOT NULL REFERENCES scheduled_posts(id),
+                recorded_at TIMESTAMP NOT NULL,
+                channel_id INTEGER NOT NULL REFERENCES channels(id),
+                views INTEGER DEFAULT 0,
+                reactions INTEGER DEFAULT 0,
+                forwards INTEGER DEFAULT 0,
+                PRIMARY KEY (scheduled_post_id, recorded_at)
+            ) PARTITION BY RANGE (recorded_at)
+            """,
+            # Создание недостающих месячных секций; вызывается также из
+            # services/view_snapshots.py
+            """
+            CREATE OR REPLACE FUNCTION ensure_post_view_snapshot_partitions(from_ts TIMESTAMP, to_ts TIMESTAMP)
+            RETURNS INTEGER LANGUAGE plpgsql AS $$
+            DECLARE
+                month_start DATE := date_trunc('month', from_ts)::date;
+                partition_name TEXT;
+                created INTEGER := 0;
+            BEGIN
+                WHILE month_start <= to_ts LOOP
+                    partition_name := 'post_view_snapshots_' || to_char(month_start, 'YYYY_MM');
+                    IF to_regclass(partition_name) IS NULL THEN
+                        EXECUTE format(
+                            'CREATE TABLE %I PARTITION OF post_view_snapshots FOR VALUES FROM (%L) TO (%L)',
+                            partition_name, month_start, (month_start + INTERVAL '1 month')::date
+                        );
+                        created := created + 1;
+                    END IF;
+                    month_start := (month_start + INTERVAL '1 month')::date;
+                END LOOP;
+                RETURN created;
+            END $$
+            """,
+            # Секции под историю и два месяца вперёд, перенос старых снимков
+            # (одной транзакцией с удалением старой таблицы)
+            """
+            DO $$
+            DECLARE
+                first_ts TIMESTAMP;
+            BEGIN
+                IF to_regclass('post_view_snapshots_legacy') IS NOT NULL THEN
+                    EXECUTE 'SELECT MIN(recorded_at) FROM post_view_snapshots_legacy' INTO first_ts;
+                END IF;
+                PERFORM ensure_post_view_snapshot_partitions(
+                    COALESCE(first_ts, NOW()::timestamp), (NOW() + INTERVAL '2 months')::timestamp
+                );
+                IF to_regclass('post_view_snapshots_legacy') IS NOT NULL THEN
+                    EXECUTE 'INSERT INTO post_view_snapshots '
+                            '(scheduled_post_id, recorded_at, channel_id, views, reactions, forwards) '
+                            'SELECT scheduled_post_id, recorded_at, channel_id, '
+                            'COALESCE(views, 0), COALESCE(reactions, 0), COALESCE(forwards, 0) '
+                            'FROM post_view_snapshots_legacy '
+                            'WHERE scheduled_post_id IS NOT NULL AND recorded_at IS NOT NULL '
+                            'ON CONFLICT DO NOTHING';
+                    DROP TABLE post_view_snapshots_legacy;
+                END IF;
+            END $$
+            """,
+        ],
+    },
+    {
+        "version": 6,
+        "description": "Очередь кросспостов в Max crosspost_outbox",
+        "statements": [
+            # Таблицу создаёт create_all; индекс — для выборки ожидающих отправки
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_crosspost_outbox_due ON crosspost_outbox(next_attempt_at) WHERE status = 'pending'",
+        ],
+    },
+    {
+        "version": 7,
+        "description": "Курсор доставки рассылок broadcast_deliveries",
+        "statements": [
+            # Таблицу создаёт create_all; индекс — для выборки недоставленных
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_broadcast_deliveries_open ON broadcast_deliveries(version, telegram_id) WHERE status IN ('pending', 'sending')",
+        ],
+    },
+]
+
+LATEST_VERSION = MIGRATIONS[-1]["version"]
+
+
+def _index_name(statement: str):
+    """Имя индекса из CREATE INDEX CONCURRENTLY IF NOT EXISTS или None."""
+    match = _CONCURRENT_INDEX_RE.search(statement)
+    return match.group(1) if match else None
+
+
+async def get_schema_version(conn: AsyncConnection) -> int:
+    """Версия схемы БД (0 — таблица schema_version ещё не создана).
+
+    ``conn`` должен работать в режиме AUTOCOMMIT: ошибка запроса к
+    отсутствующей таблице не должна оставлять соединение в прерванной
+    транзакции.
+    """
+    try:
+        result = await conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version"))
+    except DBAPIError:
+        return 0
+    return int(result.scalar() or 0)
+
+
+async def _drop_invalid_index(conn: AsyncConnection, name: str) -> None:
+    """Удалить индекс, оставшийся невалидным после неудачного CREATE INDEX CONCURRENTLY.
+
+    Иначе IF NOT EXISTS при повторе пропустит его, и индекс так и останется
+    неиспользуемым.
+    """
+    result = await conn.execute(
+        text(
+            "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ),
+        {"name": name},
+    )
+    if result.first() is not None:
+        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+async def _apply_step(conn: AsyncConnection, step: dict) -> bool:
+    """Выполнить выражения шага; вернуть True, если шаг можно считать применённым."""
+    ok = True
+    for statement in step["statements"]:
+        try:
+            await conn.execute(text(statement))
+        except Exception as e:
+            index_name = _index_name(statement)
+            if index_name:
+                try:
+                    await _drop_invalid_index(conn, index_name)
+                except Exception as drop_error:
+                    logger.warning(f"Не удалось удалить невалидный индекс {index_name}: {drop_error}")
+            if step.get("best_effort"):
+                logger.warning(f"Migration skipped ({statement!r}): {e}")
+                continue
+            logger.error(f"Миграция v{step['version']} не применена ({statement!r}): {e}")
+            ok = False
+            break
+    return ok
+
+
+async def apply_migrations(conn: AsyncConnection, current_version: int) -> int:
+    """Применить шаги с версией больше ``current_version``; вернуть новую версию.
+
+    Выполняется в режиме AUTOCOMMIT: каждое выражение фиксируется отдельно
+    (CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции).
+    """
+    await conn.execute(text(_CREATE_SCHEMA_VERSION))
+    version = current_version
+    for step in MIGRATIONS:
+        if step["version"] <= version:
+            continue
+        if not await _apply_step(conn, step):
+            break
+        await conn.execute(
+            text(
+                "INSERT INTO schema_version (version, description) VALUES (:version, :description) "
+                "ON CONFLICT (version) DO NOTHING"
+            ),
+            {"version": step["version"], "description": step["description"]},
+        )
+        version = step["version"]
+        logger.info(f"Применена миграция v{version}: {step['description']}")
+    return version
@@ -7,7 +7,7 @@ from typing import Optional, List
 
 from sqlalchemy import (
     Column, Integer, String, BigInteger, Boolean, DateTime, Date, Time,
-    Numeric, Text, ForeignKey, JSON
+    Numeric, Text, ForeignKey, JSON, Index
 )
 from sqlalchemy.orm import DeclarativeBase, relationship
 
@@ -213,6 +213,9 @@ class ScheduledPost(Base):
     format_type = Column(String(20))
 
     status = Column(String(20), default="pending")
+    # Захват поста на публикацию: экземпляр бота и время (аренда, см. PUBLISH_CLAIM_LEASE_SECONDS)
+    claimed_by = Column(String(64))
+    claimed_at = Column(DateTime)
     payment_screenshot = Column(String(500))
     message_id = Column(BigInteger)
     posted_at = Column(DateTime)
@@ -227,6 +230,27 @@ class ScheduledPost(Base):
     created_by = Column(BigInteger)
 
 
+class CrosspostOutbox(Base):
+    """Очередь кросспостов в сеть Max (transactional outbox).
+
+    Строка добавляется в одной транзакции с публикацией поста в Telegram;
+    отправляет её фоновый обработчик services/crosspost_outbox.py.
+    """
+    __tablename__ = "crosspost_outbox"
+
+    id = Column(Integer, primary_key=True)
+    scheduled_post_id = Column(Integer, ForeignKey("scheduled_posts.id"), nullable=False, unique=True)
+    text = Column(Text, nullable=False)
+
+    status = Column(String(20), default="pending")  # pending / sent / skipped / failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
+
 class Competition(Base):
     """Соревнования менеджеров"""
     __tablename__ = "competitions"
@@ -258,6 +282,10 @@ class AIInsight(Base):
 class PostAnalytics(Base):
     """Аналитика размещённых рекламных постов"""
     __tablename__ = "post_analytics"
+    __table_args__ = (
+        # Одна запись на пост: писатели используют INSERT … ON CONFLICT
+        Index("uq_post_analytics_scheduled_post", "scheduled_post_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     scheduled_post_id = Column(Integer, ForeignKey("scheduled_posts.id"), nullable=True)
@@ -280,16 +308,23 @@ class PostAnalytics(Base):
 
 
 class PostViewSnapshot(Base):
-    """Снимки просмотров рекламного поста для построения динамики"""
+    """Снимки просмотров рекламного поста для построения динамики
+
+    Таблица секционирована по месяцам recorded_at; секции создаёт и
+    прореживает services/view_snapshots.py.
+    """
     __tablename__ = "post_view_snapshots"
+    __table_args__ = {"postgresql_partition_by": "RANGE (recorded_at)"}
 
-    id = Column(Integer, primary_key=True)
-    scheduled_post_id = Column(Integer, ForeignKey("scheduled_posts.id"), nullable=False)
+    # Ключ секционирования обязан входить в первичный ключ
+    scheduled_post_id = Column(Integer, ForeignKey("scheduled_posts.id"), primary_key=True)
+    recorded_at = Column(
+        DateTime, primary_key=True, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None)
+    )
     channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False)
     views = Column(Integer, default=0)
     reactions = Column(Integer, default=0)
     forwards = Column(Integer, default=0)
-    recorded_at = Column(DateTime, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
 
 
 class PromoCode(Base):
@@ -315,3 +350,61 @@ class BotSetting(Base):
     value = Column(Text, nullable=True)
     updated_at = Column(DateTime, default=datetime.utcnow)
     updated_by = Column(BigInteger, nullable=True)
+
+
+class BroadcastDelivery(Base):
+    """Доставка рассылки об обновлении конкретному пользователю.
+
+    Строки создаются при запуске рассылки версии ``version``; по ним
+    services/broadcast.py продолжает прерванную рассылку с того же места.
+    """
+    __tablename__ = "broadcast_deliveries"
+
+    version = Column(String(50), primary_key=True)
+    telegram_id = Column(BigInteger, primary_key=True)
+    status = Column(String(20), default="pending")  # pending / sending / sent / blocked / failed
+    error = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class DailyOrderStats(Base):
+    """Дневная сводка заказов (день × канал × менеджер × формат).
+
+    Поддерживается services/rollups.py. Счётчики по статусам относятся ко дню
+    создания заказа (created_at), выручка и число оплат — ко дню оплаты
+    (paid_at). Отсутствующие канал/менеджер/формат хранятся как 0 / ''.
+    """
+    __tablename__ = "daily_order_stats"
+
+    day = Column(Date, primary_key=True)
+    channel_id = Column(Integer, primary_key=True, default=0)
+    manager_id = Column(Integer, primary_key=True, default=0)
+    format_type = Column(String(20), primary_key=True, default="")
+
+    orders_created = Column(Integer, default=0)
+    orders_pending = Column(Integer, default=0)
+    orders_payment_uploaded = Column(Integer, default=0)
+    orders_confirmed = Column(Integer, default=0)
+    orders_cancelled = Column(Integer, default=0)
+
+    paid_orders = Column(Integer, default=0)
+    revenue = Column(Numeric(14, 2), default=0)
+
+
+class DailyPostStats(Base):
+    """Дневная сводка аналитики постов (день публикации × канал).
+
+    Поддерживается services/rollups.py по данным post_analytics.
+    """
+    __tablename__ = "daily_post_stats"
+
+    day = Column(Date, primary_key=True)
+    channel_id = Column(Integer, primary_key=True)
+
+    posts = Column(Integer, default=0)
+    posts_with_views = Column(Integer, default=0)
+    views = Column(BigInteger, default=0)
+    reactions = Column(BigInteger, default=0)
+    forwards = Column(BigInteger, default=0)
+    saves = Column(BigInteger, default=0)
+    comments = Column(BigInteger, default=0)
@@ -3,14 +3,72 @@
 """
 import logging
 import os
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING, DB_STATEMENT_CACHE_SIZE, DB_COMMAND_TIMEOUT,
+    DB_STATEMENT_TIMEOUT_MS, DB_APPLICATION_NAME,
+)
 
 
 logger = logging.getLogger(__name__)
 
 
+class PoolMetrics:
+    """Накопительная статистика ожидания соединений из пула."""
+
+    # Ожидание дольше этого порога считается «медленным» (признак нехватки пула)
+    SLOW_WAIT_SECONDS = 0.1
+
+    def __init__(self):
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.slow_waits = 0
+        self.timeouts = 0
+
+    def record_wait(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+        if seconds >= self.SLOW_WAIT_SECONDS:
+            self.slow_waits += 1
+
+    def record_timeout(self) -> None:
+        self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        avg = self.total_wait / self.checkouts if self.checkouts else 0.0
+        return {
+            "checkouts": self.checkouts,
+            "avg_wait_ms": round(avg * 1000, 2),
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "slow_waits": self.slow_waits,
+            "timeouts": self.timeouts,
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """Пул соединений, замеряющий время получения соединения."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.record_timeout()
+            raise
+        pool_metrics.record_wait(time.perf_counter() - started)
+        return conn
+
+
 # Исправляем URL для asyncpg
 db_url = DATABASE_URL
 if db_url.startswith("postgresql://"):
@@ -18,8 +76,26 @@ if db_url.startswith("postgresql://"):
 elif db_url.startswith("postgres://"):
     db_url = db_url.replace("postgres://", "postgresql+asyncpg://", 1)
 
+_server_settings = {"application_name": DB_APPLICATION_NAME}
+if DB_STATEMENT_TIMEOUT_MS:
+    _server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+
 # Создаём движок
-engine = create_async_engine(db_url, echo=False)
+engine = create_async_engine(
+    db_url,
+    echo=False,
+    poolclass=InstrumentedAsyncPool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "command_timeout": DB_COMMAND_TIMEOUT,
+        "server_settings": _server_settings,
+    },
+)
 
 # Создаём фабрику сессий
 async_session_maker = async_sessionmaker(
@@ -29,103 +105,56 @@ async_session_maker = async_sessionmaker(
 )
 
 
+def get_pool_stats() -> dict:
+    """Текущее состояние пула соединений и статистика ожидания.
+
+    Ключи: size, checked_out, checked_in, overflow, max_overflow,
+    checkouts, avg_wait_ms, max_wait_ms, slow_waits, timeouts.
+    """
+    pool = engine.sync_engine.pool
+    stats = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # QueuePool ведёт overflow от -pool_size; наружу отдаём только превышение
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": DB_MAX_OVERFLOW,
+    }
+    stats.update(pool_metrics.snapshot())
+    return stats
+
+
 async def init_db():
-    """Инициализация базы данных"""
+    """Инициализация базы данных.
+
+    Если схема уже на последней версии, выполняется один запрос (проверка
+    версии). Иначе под advisory-блокировкой создаются недостающие таблицы и
+    применяются ожидающие шаги из database/migrations.py.
+    """
     from database.models import Base
+    from database.migrations import (
+        LATEST_VERSION, MIGRATION_LOCK_KEY, get_schema_version, apply_migrations,
+    )
     from sqlalchemy import text
 
-    # Создаём таблицы в отдельной транзакции, чтобы они были зафиксированы
-    # независимо от результата миграций ниже.
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-
-    # Добавляем новые колонки в существующие таблицы (миграция).
-    # Каждая миграция выполняется в отдельной транзакции: если одна из них
-    # завершается ошибкой (например, UPDATE с несуществующим столбцом), это
-    # не откатывает остальные миграции и не затрагивает уже созданные таблицы.
-    migrations = [
-        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS avg_reach_24h INTEGER DEFAULT 0",
-        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS avg_reach_48h INTEGER DEFAULT 0",
-        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS avg_reach_72h INTEGER DEFAULT 0",
-        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS err_percent NUMERIC(5, 2) DEFAULT 0",
-        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS err24_percent NUMERIC(5, 2) DEFAULT 0",
-        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS ci_index NUMERIC(8, 2) DEFAULT 0",
-        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS cpm NUMERIC(10, 2) DEFAULT 0",
-        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS telemetr_id VARCHAR(20)",
-        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS analytics_updated TIMESTAMP",
-        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS ad_content TEXT",
-        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS ad_file_id VARCHAR(500)",
-        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS ad_file_type VARCHAR(20)",
-        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS format_type VARCHAR(20) DEFAULT '1/24'",
-        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS payment_method VARCHAR(50)",
-        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS payment_screenshot VARCHAR(500)",
-        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS paid_at TIMESTAMP",
-        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS posted_at TIMESTAMP",
-        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS promo_code VARCHAR(50)",
-        "ALTER TABLE managers ADD COLUMN IF NOT EXISTS experience_points INTEGER DEFAULT 0",
-        "ALTER TABLE managers ADD COLUMN IF NOT EXISTS total_earned NUMERIC(12, 2) DEFAULT 0",
-        "ALTER TABLE managers ADD COLUMN IF NOT EXISTS training_score INTEGER DEFAULT 0",
-        "ALTER TABLE managers ADD COLUMN IF NOT EXISTS current_lesson INTEGER DEFAULT 1",
-        "ALTER TABLE clients ADD COLUMN IF NOT EXISTS referrer_id INTEGER REFERENCES managers(id)",
-        "ALTER TABLE managers ADD COLUMN IF NOT EXISTS max_id BIGINT",
-        "ALTER TABLE clients ADD COLUMN IF NOT EXISTS max_id BIGINT",
-        "ALTER TABLE scheduled_posts ALTER COLUMN order_id DROP NOT NULL",
-        "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS scheduled_time TIMESTAMP",
-        "DO $$ BEGIN IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='scheduled_posts' AND column_name='scheduled_at') THEN UPDATE scheduled_posts SET scheduled_time = scheduled_at WHERE scheduled_time IS NULL AND scheduled_at IS NOT NULL; END IF; END $$",
-        "DO $$ BEGIN IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='scheduled_posts' AND column_name='scheduled_at') THEN ALTER TABLE scheduled_posts ALTER COLUMN scheduled_at DROP NOT NULL; END IF; END $$",
-        # Миграции для scheduled_posts (добавлены позже)
-        "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS inline_buttons TEXT",
-        "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS delete_after_hours INTEGER DEFAULT 24",
-        "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS message_id BIGINT",
-        "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP",
-        "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS created_by BIGINT",
-        "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS payment_screenshot VARCHAR(500)",
-        # Миграции для post_analytics (добавлены позже)
-        "ALTER TABLE post_analytics ADD COLUMN IF NOT EXISTS channel_id INTEGER REFERENCES channels(id) ON DELETE CASCADE",
-        "ALTER TABLE post_analytics ADD COLUMN IF NOT EXISTS saves INTEGER DEFAULT 0",
-        "ALTER TABLE post_analytics ADD COLUMN IF NOT EXISTS comments INTEGER DEFAULT 0",
-        "ALTER TABLE post_analytics ADD COLUMN IF NOT EXISTS ai_recommendation TEXT",
-        "ALTER TABLE post_analytics ADD COLUMN IF NOT EXISTS recorded_by BIGINT",
-        "ALTER TABLE post_analytics ADD COLUMN IF NOT EXISTS order_id INTEGER REFERENCES orders(id) ON DELETE SET NULL",
-        "ALTER TABLE post_analytics ADD COLUMN IF NOT EXISTS recorded_at TIMESTAMP DEFAULT NOW()",
-        "ALTER TABLE managers ADD COLUMN IF NOT EXISTS timezone_offset INTEGER DEFAULT 3",
-        "ALTER TABLE managers ADD COLUMN IF NOT EXISTS role VARCHAR(20)",
-        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE",
-        "UPDATE channels SET is_active = TRUE WHERE is_active IS NULL",
-        "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS signature VARCHAR(255)",
-        # Заполняем channel_id для записей post_analytics, у которых он не задан,
-        # беря значение из связанного scheduled_post
-        "UPDATE post_analytics pa SET channel_id = sp.channel_id FROM scheduled_posts sp WHERE pa.scheduled_post_id = sp.id AND pa.channel_id IS NULL",
-        # Индексы для ускорения частых запросов (планировщик, бронирование, статистика)
-        "CREATE INDEX IF NOT EXISTS idx_scheduled_posts_status_time ON scheduled_posts(status, scheduled_time)",
-        "CREATE INDEX IF NOT EXISTS idx_scheduled_posts_status_posted ON scheduled_posts(status, posted_at, deleted_at, message_id)",
-        "CREATE INDEX IF NOT EXISTS idx_slots_channel_status_date ON slots(channel_id, status, slot_date)",
-        "CREATE INDEX IF NOT EXISTS idx_orders_client_id ON orders(client_id)",
-        "CREATE INDEX IF NOT EXISTS idx_orders_manager_id ON orders(manager_id)",
-        "CREATE INDEX IF NOT EXISTS idx_orders_channel_status ON orders(slot_id, status)",
-        "CREATE INDEX IF NOT EXISTS idx_managers_telegram_id ON managers(telegram_id)",
-        "CREATE INDEX IF NOT EXISTS idx_clients_telegram_id ON clients(telegram_id)",
-        "CREATE INDEX IF NOT EXISTS idx_promo_codes_code ON promo_codes(code) WHERE is_active = TRUE",
-        "CREATE INDEX IF NOT EXISTS idx_post_analytics_channel ON post_analytics(channel_id)",
-        "CREATE INDEX IF NOT EXISTS idx_post_analytics_order ON post_analytics(order_id)",
-        # Индекс для снимков просмотров
-        "CREATE INDEX IF NOT EXISTS idx_post_view_snapshots_post ON post_view_snapshots(scheduled_post_id, recorded_at)",
-        # Кросспостинг в сеть Max
-        "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS crosspost_to_max BOOLEAN DEFAULT FALSE",
-        "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS max_post_id VARCHAR(100)",
-        "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS max_posted_at TIMESTAMP",
-        "CREATE INDEX IF NOT EXISTS idx_scheduled_posts_max_posted ON scheduled_posts(crosspost_to_max, max_posted_at)",
-        # Цена и формат для прямой подачи постов менеджером
-        "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS price NUMERIC(12, 2)",
-        "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS format_type VARCHAR(20)",
-    ]
-
-    for migration in migrations:
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        version = await get_schema_version(conn)
+        if version >= LATEST_VERSION:
+            logger.info(f"Схема БД актуальна (v{version})")
+            return
+
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
         try:
-            async with engine.begin() as conn:
-                await conn.execute(text(migration))
-        except Exception as e:
-            logger.warning(f"Migration skipped ({migration!r}): {e}")
+            # Пока ждали блокировку, миграции мог применить другой экземпляр
+            version = await get_schema_version(conn)
+            if version >= LATEST_VERSION:
+                return
+            await conn.run_sync(Base.metadata.create_all)
+            new_version = await apply_migrations(conn, version)
+            logger.info(f"Схема БД: v{version} → v{new_version} (последняя v{LATEST_VERSION})")
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
 
 
 async def get_session() -> AsyncSession:
@@ -14,9 +14,10 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.exceptions import TelegramBadRequest
 from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from config import ADMIN_IDS, ADMIN_PASSWORD, CHANNEL_CATEGORIES, AUTOPOST_ENABLED, CLAUDE_API_KEY, TELEMETR_API_TOKEN, MAX_BOT_TOKEN, MANAGER_LEVELS, MANAGER_GROUP_CHAT_ID, LOCAL_TZ_OFFSET, LOCAL_TZ_LABEL
-from database import async_session_maker, Channel, Manager, Order, ScheduledPost, Competition, Slot, Client, CategoryCPM, PostAnalytics, PostViewSnapshot, PromoCode
+from database import async_session_maker, Channel, Manager, Order, ScheduledPost, Competition, Slot, Client, CategoryCPM, PostAnalytics, PromoCode
 from keyboards import get_admin_panel_menu, get_channel_settings_keyboard, get_category_keyboard
 from keyboards.menus import get_cpm_categories_keyboard, get_autoposting_menu, get_post_analytics_keyboard, get_post_analytics_actions_keyboard, get_free_calendar_keyboard, get_time_picker_keyboard, get_content_plan_week_keyboard, get_content_plan_day_keyboard
 from utils import AdminChannelStates, AdminPasswordState, AdminCompetitionStates, AdminPromoStates, format_channel_stats_for_group, format_daily_schedule, format_slot_booking, AdminSettingsStates, channel_link
@@ -24,11 +25,14 @@ from utils.states import AdminCPMStates, AdminAutopostingStates, AdminCreatePost
 from utils.helpers import escape_md, utc_now
 from utils.constants import MSG_AUTH_REQUIRED, FMT_DATETIME
 from services import gamification_service, get_manager_group_chat_id, set_setting, MANAGER_GROUP_CHAT_ID_KEY, get_setting, PAYMENT_LINK_KEY, CROSSPOST_ENABLED_KEY, CROSSPOST_DAILY_LIMIT_KEY, MAX_CROSSPOST_CHAT_ID_KEY
-from services.crosspost import is_crosspost_enabled, get_crosspost_daily_limit, get_daily_crosspost_count, get_max_crosspost_chat_id
-from services.ai_trainer import ai_trainer_service
-from services.diagnostics import run_diagnostics, run_deep_diagnostics, gather_business_metrics, get_improvement_suggestions
-from services.error_library import KNOWN_ERRORS, get_error_log, format_known_error
+from services.crosspost import crosspost_governor, get_crosspost_config, get_crosspost_daily_limit, is_crosspost_enabled
 from services.improvement_log import get_recent_improvements, get_improvement_stats, format_improvement_entry, log_improvement
+from services.publish_scheduler import publish_scheduler
+from services.notifications import notification_dispatcher
+from services.metrics_cache import invalidate_metrics, TAG_ORDERS, TAG_ANALYTICS
+from services.rollups import rollup_refresher
+from services.ad_index import ad_message_index
+from services.view_snapshots import fetch_view_series, views_at
 
 
 logger = logging.getLogger(__name__)
@@ -143,12 +147,9 @@ async def get_channel_card(channel_id: int) -> tuple:
 
 async def _notify_manager_group(bot: Bot, channel, order_id: int = None):
     """Отправить карточку статистики канала в чат менеджеров (если настроен)."""
-    chat_id = await get_manager_group_chat_id()
-    if not chat_id:
-        return
     try:
         text = format_channel_stats_for_group(channel, order_id)
-        await bot.send_message(chat_id, text, parse_mode="Markdown")
+        await notification_dispatcher.notify_manager_group(text, parse_mode="Markdown")
     except Exception:
         logger.warning(
             f"Не удалось отправить статистику канала в чат менеджеров "
@@ -1290,108 +1291,39 @@ async def adm_moderation(callback: CallbackQuery):
 
 async def _build_crm_stats_text() -> str:
     """Собрать сводную статистику CRM и вернуть готовый текст."""
-    now = datetime.now(timezone.utc).replace(tzinfo=None)
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_start = today_start - timedelta(days=7)
-    month_start = today_start - timedelta(days=30)
-    prev_month_start = month_start - timedelta(days=30)
+    from services.metrics import get_dashboard_snapshot
+    s = await get_dashboard_snapshot()
 
-    async with async_session_maker() as session:
-        total_orders = (await session.execute(select(func.count(Order.id)))).scalar() or 0
-        pending_orders = (await session.execute(
-            select(func.count(Order.id)).where(Order.status == "pending")
-        )).scalar() or 0
-        payment_uploaded = (await session.execute(
-            select(func.count(Order.id)).where(Order.status == "payment_uploaded")
-        )).scalar() or 0
-        confirmed_orders = (await session.execute(
-            select(func.count(Order.id)).where(Order.status == "payment_confirmed")
-        )).scalar() or 0
-        cancelled_orders = (await session.execute(
-            select(func.count(Order.id)).where(Order.status == "cancelled")
-        )).scalar() or 0
-
-        total_revenue = float((await session.execute(
-            select(func.sum(Order.final_price)).where(Order.status == "payment_confirmed")
-        )).scalar() or 0)
-        revenue_today = float((await session.execute(
-            select(func.sum(Order.final_price)).where(
-                Order.status == "payment_confirmed",
-                Order.paid_at >= today_start,
-            )
-        )).scalar() or 0)
-        revenue_week = float((await session.execute(
-            select(func.sum(Order.final_price)).where(
-                Order.status == "payment_confirmed",
-                Order.paid_at >= week_start,
-            )
-        )).scalar() or 0)
-        revenue_month = float((await session.execute(
-            select(func.sum(Order.final_price)).where(
-                Order.status == "payment_confirmed",
-                Order.paid_at >= month_start,
-            )
-        )).scalar() or 0)
-        revenue_prev_month = float((await session.execute(
-            select(func.sum(Order.final_price)).where(
-                Order.status == "payment_confirmed",
-                Order.paid_at >= prev_month_start,
-                Order.paid_at < month_start,
-            )
-        )).scalar() or 0)
-
-        orders_today = (await session.execute(
-            select(func.count(Order.id)).where(Order.created_at >= today_start)
-        )).scalar() or 0
-        orders_week = (await session.execute(
-            select(func.count(Order.id)).where(Order.created_at >= week_start)
-        )).scalar() or 0
-        orders_month = (await session.execute(
-            select(func.count(Order.id)).where(Order.created_at >= month_start)
-        )).scalar() or 0
-
-        total_managers = (await session.execute(select(func.count(Manager.id)))).scalar() or 0
-        active_managers = (await session.execute(
-            select(func.count(Manager.id)).where(Manager.is_active == True)
-        )).scalar() or 0
-        total_channels = (await session.execute(select(func.count(Channel.id)))).scalar() or 0
-        active_channels = (await session.execute(
-            select(func.count(Channel.id)).where(Channel.is_active == True)
-        )).scalar() or 0
-        total_clients = (await session.execute(select(func.count(Client.id)))).scalar() or 0
-        new_clients_month = (await session.execute(
-            select(func.count(Client.id)).where(Client.created_at >= month_start)
-        )).scalar() or 0
-
-    if revenue_prev_month > 0:
-        rev_change = (revenue_month - revenue_prev_month) / revenue_prev_month * 100
+    if s["revenue_prev_month"] > 0:
+        rev_change = (s["revenue_month"] - s["revenue_prev_month"]) / s["revenue_prev_month"] * 100
         rev_trend = f" ({'▲' if rev_change >= 0 else '▼'}{abs(rev_change):.1f}%)"
     else:
         rev_trend = ""
 
-    conversion = round(confirmed_orders / total_orders * 100, 1) if total_orders > 0 else 0
-    cancel_rate = round(cancelled_orders / total_orders * 100, 1) if total_orders > 0 else 0
+    total_orders = s["total_orders"]
+    conversion = round(s["confirmed_orders"] / total_orders * 100, 1) if total_orders > 0 else 0
+    cancel_rate = round(s["cancelled_orders"] / total_orders * 100, 1) if total_orders > 0 else 0
 
     return (
         "📊 **Метрики CRM**\n\n"
         "💰 **Выручка:**\n"
-        f"• Сегодня: **{revenue_today:,.0f}₽**\n"
-        f"• За 7 дней: **{revenue_week:,.0f}₽**\n"
-        f"• За 30 дней: **{revenue_month:,.0f}₽**{rev_trend}\n"
-        f"• Всего: **{total_revenue:,.0f}₽**\n\n"
+        f"• Сегодня: **{s['revenue_today']:,.0f}₽**\n"
+        f"• За 7 дней: **{s['revenue_week']:,.0f}₽**\n"
+        f"• За 30 дней: **{s['revenue_month']:,.0f}₽**{rev_trend}\n"
+        f"• Всего: **{s['total_revenue']:,.0f}₽**\n\n"
         "📦 **Заказы:**\n"
-        f"• Сегодня: **{orders_today}** | Неделя: **{orders_week}** | Месяц: **{orders_month}**\n"
+        f"• Сегодня: **{s['orders_today']}** | Неделя: **{s['orders_week']}** | Месяц: **{s['orders_month']}**\n"
         f"• Всего: **{total_orders}** | Конверсия: **{conversion}%** | Отмены: **{cancel_rate}%**\n\n"
         "📋 **Статусы:**\n"
-        f"• ⏳ Ожидают: **{pending_orders}** | 💳 На проверке: **{payment_uploaded}**\n"
-        f"• ✅ Подтверждены: **{confirmed_orders}** | ❌ Отменены: **{cancelled_orders}**\n\n"
+        f"• ⏳ Ожидают: **{s['pending_orders']}** | 💳 На проверке: **{s['payment_uploaded']}**\n"
+        f"• ✅ Подтверждены: **{s['confirmed_orders']}** | ❌ Отменены: **{s['cancelled_orders']}**\n\n"
         "📢 **Каналы:** **{ac}** активных из **{tc}**\n"
         "👥 **Менеджеры:** **{am}** активных из **{tm}**\n"
         "🧑‍💼 **Клиенты:** **{tcl}** всего | +**{ncl}** за месяц"
     ).format(
-        ac=active_channels, tc=total_channels,
-        am=active_managers, tm=total_managers,
-        tcl=total_clients, ncl=new_clients_month,
+        ac=s["active_channels"], tc=s["total_channels"],
+        am=s["active_managers"], tm=s["total_managers"],
+        tcl=s["total_clients"], ncl=s["new_clients_month"],
     )
 
 
@@ -2161,6 +2093,7 @@ async def autopost_delete_from_channel(callback: CallbackQuery, bot: Bot):
             post.deleted_at = utc_now()
             post.status = "deleted"
             await session.commit()
+            ad_message_index.remove_post(post.channel_id, post.message_id)
 
         result_text = (
             f"🗑 **Пост #{post_id} удалён**\n\n"
@@ -2241,14 +2174,11 @@ async def pa_view(callback: CallbackQuery):
             )
             scheduled_post_id = analytics.scheduled_post_id
 
-            # Загружаем снимки динамики просмотров
+            # Ряд динамики просмотров: [(recorded_at, views), ...]
             snapshots = []
             if analytics.scheduled_post_id:
-                snapshots = (await session.execute(
-                    select(PostViewSnapshot)
-                    .where(PostViewSnapshot.scheduled_post_id == analytics.scheduled_post_id)
-                    .order_by(PostViewSnapshot.recorded_at.asc())
-                )).scalars().all()
+                series = await fetch_view_series(session, [analytics.scheduled_post_id])
+                snapshots = series.get(analytics.scheduled_post_id, [])
 
         ch_name = channel.name if channel else "—"
         subscribers = (channel.subscribers or 0) if channel else 0
@@ -2281,14 +2211,8 @@ async def pa_view(callback: CallbackQuery):
         views_24h = None
         views_1h = None
         if snapshots and posted_at:
-            cutoff_24h = posted_at + timedelta(hours=24)
-            cutoff_1h = posted_at + timedelta(hours=1)
-            snaps_24h = [s for s in snapshots if s.recorded_at <= cutoff_24h]
-            snaps_1h = [s for s in snapshots if s.recorded_at <= cutoff_1h]
-            if snaps_24h:
-                views_24h = snaps_24h[-1].views
-            if snaps_1h:
-                views_1h = snaps_1h[-1].views
+            views_24h = views_at(snapshots, posted_at + timedelta(hours=24))
+            views_1h = views_at(snapshots, posted_at + timedelta(hours=1))
 
         if views_24h is not None:
             text += f"📊 Просмотры за 24ч: **{views_24h:,}**\n"
@@ -2312,7 +2236,7 @@ async def pa_view(callback: CallbackQuery):
 
         # Динамика просмотров — текстовый мини-график
         if snapshots and posted_at and len(snapshots) >= 2:
-            max_views = max(s.views for s in snapshots) or 1
+            max_views = max(v for _, v in snapshots) or 1
             bar_width = 10
 
             def views_bar(v):
@@ -2323,10 +2247,8 @@ async def pa_view(callback: CallbackQuery):
             milestones = [1, 3, 6, 12, 24]
             milestone_lines = []
             for hours in milestones:
-                cutoff = posted_at + timedelta(hours=hours)
-                relevant = [s for s in snapshots if s.recorded_at <= cutoff]
-                if relevant:
-                    v = relevant[-1].views
+                v = views_at(snapshots, posted_at + timedelta(hours=hours))
+                if v is not None:
                     milestone_lines.append(f"  +{hours}ч: {v:,} {views_bar(v)}")
             # Текущее значение
             milestone_lines.append(f"  Сейчас: {views:,} {views_bar(views)}")
@@ -2339,10 +2261,8 @@ async def pa_view(callback: CallbackQuery):
         if snapshots and posted_at:
             first_hours_lines = []
             for hours in [1, 3, 6, 12, 24]:
-                cutoff = posted_at + timedelta(hours=hours)
-                relevant = [s for s in snapshots if s.recorded_at <= cutoff]
-                if relevant:
-                    v = relevant[-1].views
+                v = views_at(snapshots, posted_at + timedelta(hours=hours))
+                if v is not None:
                     first_hours_lines.append(f"  {hours}ч: {v:,} просмотров")
             if first_hours_lines:
                 text += "\n⏰ **Первые часы после публикации:**\n"
@@ -2535,37 +2455,32 @@ async def pa_receive_comments(message: Message, state: FSMContext):
 
     try:
         async with async_session_maker() as session:
-            # Проверяем, есть ли уже запись для этого поста
-            existing = (await session.execute(
-                select(PostAnalytics).where(PostAnalytics.scheduled_post_id == post_id)
-            )).scalar_one_or_none()
-
-            if existing:
-                existing.views = views
-                existing.reactions = reactions
-                existing.forwards = forwards
-                existing.saves = saves
-                existing.comments = comments
-                existing.recorded_at = utc_now()
-                existing.recorded_by = message.from_user.id
-                existing.ai_recommendation = None  # Сбрасываем старую рекомендацию
-                analytics = existing
-            else:
-                analytics = PostAnalytics(
-                    scheduled_post_id=post_id,
-                    channel_id=channel_id,
-                    views=views,
-                    reactions=reactions,
-                    forwards=forwards,
-                    saves=saves,
-                    comments=comments,
-                    recorded_by=message.from_user.id,
-                )
-                session.add(analytics)
-
+            # Один upsert: ручной ввод администратора заменяет значения
+            # (в том числе исправляет ошибочно завышенные)
+            metrics = {
+                "views": views,
+                "reactions": reactions,
+                "forwards": forwards,
+                "saves": saves,
+                "comments": comments,
+                "recorded_at": utc_now(),
+                "recorded_by": message.from_user.id,
+            }
+            stmt = pg_insert(PostAnalytics).values(
+                scheduled_post_id=post_id, channel_id=channel_id, **metrics,
+            )
+            analytics_id = (await session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[PostAnalytics.scheduled_post_id],
+                    # Сбрасываем старую AI-рекомендацию
+                    set_={**metrics, "ai_recommendation": None},
+                ).returning(PostAnalytics.id)
+            )).scalar_one()
             await session.commit()
-            await session.refresh(analytics)
-            analytics_id = analytics.id
+            post = await session.get(ScheduledPost, post_id)
+
+        invalidate_metrics(TAG_ANALYTICS)
+        rollup_refresher.mark_post(post.posted_at if post else None)
 
         total_engage = reactions + forwards + saves + comments
         er = round(total_engage / views * 100, 2) if views > 0 else 0
@@ -2618,6 +2533,7 @@ async def pa_ai_recommend(callback: CallbackQuery):
             avg_views = int(channel.avg_reach or channel.avg_reach_24h or 0) if channel else 0
             cpm = float(channel.cpm or 0) if channel else 0
 
+        from services.ai_trainer import ai_trainer_service
         recommendation = await ai_trainer_service.get_post_recommendations(
             channel_name=ch_name,
             views=a_views,
@@ -3568,6 +3484,7 @@ async def autopost_create_confirm(callback: CallbackQuery, state: FSMContext):
             await session.commit()
             post_id = post.id
 
+        publish_scheduler.notify(post_id, scheduled_time)
         await state.clear()
 
         channel_name = data.get("create_channel_name", "—")
@@ -3877,11 +3794,7 @@ async def on_bot_added_to_group(event: ChatMemberUpdated, bot: Bot):
         f"Скопируйте ID и вставьте его в:\n"
         f"⚙️ Настройки → 💬 Чат менеджеров → ✏️ Изменить ID чата"
     )
-    for admin_id in ADMIN_IDS:
-        try:
-            await bot.send_message(admin_id, notify_text, parse_mode=ParseMode.MARKDOWN)
-        except Exception:
-            pass
+    notification_dispatcher.notify_admins(notify_text, parse_mode=ParseMode.MARKDOWN)
 
 
 @router.callback_query(F.data == "adm_max_settings")
@@ -3910,10 +3823,12 @@ async def adm_max_settings(callback: CallbackQuery):
             "• Управлять своим профилем менеджера"
         )
 
-    crosspost_on = await is_crosspost_enabled()
-    crosspost_limit = await get_crosspost_daily_limit()
-    crosspost_chat_id = await get_max_crosspost_chat_id()
-    daily_count = await get_daily_crosspost_count()
+    crosspost_on, crosspost_limit, crosspost_chat_id = await get_crosspost_config()
+    try:
+        daily_count = await crosspost_governor.count_today()
+    except Exception:
+        logger.warning("Не удалось получить число кросспостов за сегодня", exc_info=True)
+        daily_count = "н/д"
 
     crosspost_status = "🟢 Включён" if crosspost_on else "🔴 Выключен"
     limit_str = "без ограничений" if crosspost_limit == 0 else str(crosspost_limit)
@@ -4076,6 +3991,7 @@ async def adm_diagnostics(callback: CallbackQuery):
     )
 
     try:
+        from services.diagnostics import run_diagnostics
         results = await run_diagnostics()
 
         db_icon, db_msg = results.get("db", ("❓", "Нет данных"))
@@ -4109,6 +4025,18 @@ async def adm_diagnostics(callback: CallbackQuery):
         else:
             text += "\n⚠️ Не удалось проверить очередь.\n"
 
+        pool = results.get("db_pool")
+        if pool:
+            pool_icon = "🔴" if pool["timeouts"] else ("🟡" if pool["overflow"] else "🟢")
+            text += (
+                f"\n**Пул соединений БД:**\n"
+                f"{pool_icon} Занято: **{pool['checked_out']}** из {pool['size']} "
+                f"(+{pool['overflow']}/{pool['max_overflow']} сверх пула)\n"
+                f"⏱ Ожидание соединения: ср. {pool['avg_wait_ms']} мс, макс. {pool['max_wait_ms']} мс\n"
+            )
+            if pool["slow_waits"] or pool["timeouts"]:
+                text += f"⚠️ Медленных ожиданий: {pool['slow_waits']}, таймаутов: {pool['timeouts']}\n"
+
         text += f"\n🕐 Проверено: {datetime.now(timezone.utc).strftime(FMT_DATETIME)} UTC"
 
         buttons = [
@@ -4148,6 +4076,7 @@ async def adm_ai_improve(callback: CallbackQuery):
     )
 
     try:
+        from services.diagnostics import gather_business_metrics, get_improvement_suggestions
         metrics = await gather_business_metrics()
         suggestion = await get_improvement_suggestions(metrics)
 
@@ -4206,6 +4135,7 @@ async def adm_error_library(callback: CallbackQuery):
     show_unknown = data.endswith(":unknown")
 
     try:
+        from services.error_library import KNOWN_ERRORS, get_error_log
         if show_unknown:
             # Журнал неизвестных ошибок (runtime)
             entries = get_error_log(limit=10)
@@ -4380,6 +4310,7 @@ async def adm_deep_diagnostics(callback: CallbackQuery):
     )
 
     try:
+        from services.diagnostics import run_deep_diagnostics
         report = await run_deep_diagnostics()
         total, ok, warn, error = report["summary"]
 
@@ -4598,6 +4529,8 @@ async def adm_confirm_payment(callback: CallbackQuery, bot: Bot):
             booking_payment = order.payment_method
 
             await session.commit()
+            invalidate_metrics(TAG_ORDERS)
+            rollup_refresher.mark_order(order.created_at, order.paid_at)
 
             # Получаем канал для уведомления в чат менеджеров
             channel_for_notify = None
@@ -4646,24 +4579,22 @@ async def adm_confirm_payment(callback: CallbackQuery, bot: Bot):
 
         # Уведомляем менеджеров о занятом слоте
         if channel_for_notify:
-            mgr_chat_id = await get_manager_group_chat_id()
-            if mgr_chat_id:
-                try:
-                    booking_text = format_slot_booking(
-                        channel_name=channel_for_notify.name or "Канал",
-                        channel_category=getattr(channel_for_notify, "category", None),
-                        slot_time=slot_time_for_notify,
-                        price=booking_price,
-                        payment_method=booking_payment,
-                        manager_name=manager_first_name,
-                    )
-                    await bot.send_message(mgr_chat_id, booking_text, parse_mode=None)
-                except Exception:
-                    logger.warning(
-                        f"Не удалось отправить уведомление о занятом слоте в чат менеджеров "
-                        f"(order_id={order_id})",
-                        exc_info=True,
-                    )
+            try:
+                booking_text = format_slot_booking(
+                    channel_name=channel_for_notify.name or "Канал",
+                    channel_category=getattr(channel_for_notify, "category", None),
+                    slot_time=slot_time_for_notify,
+                    price=booking_price,
+                    payment_method=booking_payment,
+                    manager_name=manager_first_name,
+                )
+                await notification_dispatcher.notify_manager_group(booking_text)
+            except Exception:
+                logger.warning(
+                    f"Не удалось отправить уведомление о занятом слоте в чат менеджеров "
+                    f"(order_id={order_id})",
+                    exc_info=True,
+                )
 
         await safe_edit_message(
             callback.message,
@@ -4704,6 +4635,7 @@ async def adm_reject_payment(callback: CallbackQuery, bot: Bot):
                     slot.reserved_until = None
 
             await session.commit()
+            rollup_refresher.mark_order(order.created_at, order.paid_at)
 
             client = await session.get(Client, order.client_id)
             client_telegram_id = client.telegram_id if client else None
@@ -4763,6 +4695,7 @@ async def adm_mark_posted(callback: CallbackQuery, bot: Bot):
                     slot.status = "booked"
 
             await session.commit()
+            rollup_refresher.mark_order(order.created_at, order.paid_at)
 
             client = await session.get(Client, order.client_id)
             client_telegram_id = client.telegram_id if client else None
@@ -5402,8 +5335,11 @@ async def edit_post_select_time(callback: CallbackQuery, state: FSMContext):
                 await state.clear()
                 return
             post.scheduled_time = scheduled_time_utc
+            post_status = post.status
             await session.commit()
 
+        if post_status == "pending":
+            publish_scheduler.notify(post_id, scheduled_time_utc)
         await state.clear()
         await safe_edit_message(
             callback.message,
@@ -5481,6 +5417,7 @@ async def adm_approve_post(callback: CallbackQuery, bot: Bot):
 
             await session.commit()
 
+        publish_scheduler.notify(post_id, scheduled_time)
         await callback.answer("✅ Пост одобрен и поставлен в очередь!", show_alert=True)
 
         try:
@@ -5514,25 +5451,23 @@ async def adm_approve_post(callback: CallbackQuery, bot: Bot):
 
         # Уведомляем менеджеров о согласованной рекламе и занятом слоте
         if channel:
-            mgr_chat_id = await get_manager_group_chat_id()
-            if mgr_chat_id:
-                try:
-                    local_time = (scheduled_time + LOCAL_TZ_OFFSET) if scheduled_time else None
-                    booking_text = format_slot_booking(
-                        channel_name=channel_name,
-                        channel_category=channel_category,
-                        slot_time=local_time,
-                        price=booking_price,
-                        payment_method=booking_payment,
-                        manager_name=booking_manager_name,
-                    )
-                    await bot.send_message(mgr_chat_id, booking_text, parse_mode=None)
-                except Exception:
-                    logger.warning(
-                        f"Не удалось отправить уведомление о согласовании рекламы в чат менеджеров "
-                        f"(post_id={post_id})",
-                        exc_info=True,
-                    )
+            try:
+                local_time = (scheduled_time + LOCAL_TZ_OFFSET) if scheduled_time else None
+                booking_text = format_slot_booking(
+                    channel_name=channel_name,
+                    channel_category=channel_category,
+                    slot_time=local_time,
+                    price=booking_price,
+                    payment_method=booking_payment,
+                    manager_name=booking_manager_name,
+                )
+                await notification_dispatcher.notify_manager_group(booking_text)
+            except Exception:
+                logger.warning(
+                    f"Не удалось отправить уведомление о согласовании рекламы в чат менеджеров "
+                    f"(post_id={post_id})",
+                    exc_info=True,
+                )
     except Exception as e:
         logger.error(f"Error in adm_approve_post: {traceback.format_exc()}")
         await callback.answer("❌ Ошибка", show_alert=True)
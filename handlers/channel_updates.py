@@ -13,7 +13,7 @@ import logging
 from aiogram import Router
 from aiogram.types import Message
 
-from services.channel_collector import record_post_views
+from services.channel_collector import post_view_buffer
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -39,9 +39,13 @@ async def on_edited_channel_post(message: Message) -> None:
 
 
 async def _save_views(message: Message) -> None:
-    """Извлечь просмотры/реакции из сообщения и передать коллектору."""
-    channel_tg_id = message.chat.id
-    message_id = message.message_id
+    """Извлечь просмотры/реакции из сообщения и положить в буфер просмотров.
+
+    Обновления нерекламных постов отбрасывает post_view_buffer.add (по
+    ad_message_index), а в БД значения попадают пакетно
+    (post_view_buffer.flush), поэтому обработчик не делает запросов на
+    каждое обновление.
+    """
     views = getattr(message, "views", None) or 0
 
     # Суммарные реакции (если поддерживаются версией Bot API)
@@ -52,15 +56,10 @@ async def _save_views(message: Message) -> None:
     # forward_count — число пересылок (появляется при edited_channel_post)
     forwards = getattr(message, "forward_count", 0) or 0
 
-    saved = await record_post_views(
-        channel_tg_id=channel_tg_id,
-        message_id=message_id,
+    post_view_buffer.add(
+        chat_id=message.chat.id,
+        message_id=message.message_id,
         views=views,
         reactions=reactions,
         forwards=forwards,
     )
-    if saved:
-        logger.debug(
-            f"Зафиксированы просмотры: канал {channel_tg_id}, "
-            f"msg {message_id}, views={views}"
-        )
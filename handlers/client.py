@@ -13,12 +13,14 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from sqlalchemy import select, update, or_
 
-from config import CHANNEL_CATEGORIES, ADMIN_IDS, LOYALTY_DISCOUNTS
+from config import CHANNEL_CATEGORIES, LOYALTY_DISCOUNTS
 from database import async_session_maker, Channel, Slot, Client, Order, Manager, PromoCode
 from keyboards import get_channels_keyboard, get_dates_keyboard, get_calendar_keyboard, get_times_keyboard, get_format_keyboard
 from utils import BookingStates, channel_link, utc_now
 from utils.constants import MSG_CHANNEL_NOT_FOUND
 from services.settings import get_setting, PAYMENT_LINK_KEY
+from services.notifications import notification_dispatcher
+from services.rollups import rollup_refresher
 
 
 logger = logging.getLogger(__name__)
@@ -603,6 +605,7 @@ async def confirm_order(callback: CallbackQuery, state: FSMContext):
                         )
 
             await session.commit()
+            rollup_refresher.mark_order(order.created_at)
             
             order_id = order.id
             price = float(order.final_price)
@@ -712,6 +715,7 @@ async def receive_payment_screenshot(message: Message, state: FSMContext, bot: B
             order.payment_screenshot = file_id
             order.status = "payment_uploaded"
             await session.commit()
+            rollup_refresher.mark_order(order.created_at)
         
         await state.clear()
         
@@ -723,15 +727,13 @@ async def receive_payment_screenshot(message: Message, state: FSMContext, bot: B
         )
         
         # Уведомляем админов
-        for admin_id in ADMIN_IDS:
-            try:
-                await bot.send_message(
-                    admin_id,
-                    f"💳 **Новая оплата!**\n\nЗаказ #{order_id}\nПроверьте в админ-панели.",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            except Exception:
-                pass
+        notification_dispatcher.notify_admins(
+            f"💳 **Новая оплата!**\n\nЗаказ #{order_id}\nПроверьте в админ-панели.",
+            parse_mode=ParseMode.MARKDOWN,
+            digest_key="new_payment",
+            digest_title="💳 **Новые оплаты: {count}**\nПроверьте в админ-панели.",
+            digest_line=f"• Заказ #{order_id}",
+        )
     except Exception as e:
         logger.error(f"Error in receive_payment_screenshot: {traceback.format_exc()}")
         await message.answer(f"❌ Ошибка:\n`{str(e)}`", parse_mode=ParseMode.MARKDOWN)
@@ -21,6 +21,8 @@ from utils.helpers import escape_md
 from utils.constants import MSG_AUTH_REQUIRED, MSG_NOT_MANAGER, MSG_CHANNEL_NOT_FOUND, FMT_DATETIME
 from services import gamification_service
 from services.settings import get_setting, PAYMENT_LINK_KEY
+from services.publish_scheduler import publish_scheduler
+from services.notifications import notification_dispatcher, Notification
 
 
 logger = logging.getLogger(__name__)
@@ -1697,6 +1699,8 @@ async def mgr_post_receive_payment(message: Message, state: FSMContext, bot: Bot
             await session.commit()
             post_id = post.id
 
+        if is_owner:
+            publish_scheduler.notify(post_id, scheduled_time)
         await state.clear()
 
         mgr_tz_offset, mgr_tz_label = _manager_tz(manager)
@@ -1729,36 +1733,26 @@ async def mgr_post_receive_payment(message: Message, state: FSMContext, bot: Bot
             # Уведомляем администраторов (время в timezone бота)
             scheduled_admin = scheduled_time + LOCAL_TZ_OFFSET
             channel_name_notify = data.get("mgr_channel_name") or str(channel_id)
+            caption = (
+                f"📝 **Новый пост на модерацию #{post_id}**\n\n"
+                f"От менеджера: {message.from_user.first_name or message.from_user.username}\n"
+                f"📢 Канал: {channel_name_notify}\n"
+                f"📅 Запланирован: {scheduled_admin.strftime(FMT_DATETIME)} {LOCAL_TZ_LABEL}\n\n"
+                f"💳 Скриншот оплаты прикреплён."
+            )
+            moderation_markup = InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="🔍 Перейти к модерации", callback_data=f"adm_post:{post_id}")]
+            ])
+            media_kwargs = {"photo": file_id} if message.photo else {"document": file_id}
             for admin_id in ADMIN_IDS:
-                try:
-                    caption = (
-                        f"📝 **Новый пост на модерацию #{post_id}**\n\n"
-                        f"От менеджера: {message.from_user.first_name or message.from_user.username}\n"
-                        f"📢 Канал: {channel_name_notify}\n"
-                        f"📅 Запланирован: {scheduled_admin.strftime(FMT_DATETIME)} {LOCAL_TZ_LABEL}\n\n"
-                        f"💳 Скриншот оплаты прикреплён."
-                    )
-                    moderation_markup = InlineKeyboardMarkup(inline_keyboard=[
-                        [InlineKeyboardButton(text="🔍 Перейти к модерации", callback_data=f"adm_post:{post_id}")]
-                    ])
-                    if message.photo:
-                        await bot.send_photo(
-                            admin_id,
-                            file_id,
-                            caption=caption,
-                            parse_mode=ParseMode.MARKDOWN,
-                            reply_markup=moderation_markup,
-                        )
-                    else:
-                        await bot.send_document(
-                            admin_id,
-                            file_id,
-                            caption=caption,
-                            parse_mode=ParseMode.MARKDOWN,
-                            reply_markup=moderation_markup,
-                        )
-                except Exception:
-                    logger.warning(f"Could not notify admin {admin_id} about new post #{post_id}", exc_info=True)
+                notification_dispatcher.enqueue(Notification(
+                    admin_id,
+                    method="send_photo" if message.photo else "send_document",
+                    caption=caption,
+                    parse_mode=ParseMode.MARKDOWN,
+                    reply_markup=moderation_markup,
+                    **media_kwargs,
+                ))
 
     except Exception as e:
         logger.error(f"Error in mgr_post_receive_payment: {traceback.format_exc()}")
@@ -16,7 +16,6 @@ from database import async_session_maker, Manager
 from keyboards import get_training_menu, get_ai_feedback_keyboard
 from utils import ManagerStates
 from utils.constants import MSG_NOT_MANAGER
-from services import ai_trainer_service
 
 
 logger = logging.getLogger(__name__)
@@ -344,7 +343,8 @@ async def ai_trainer_message(message: Message, state: FSMContext):
     # Отправляем "печатает"
     await message.answer("🤔 Думаю...")
     
-    # Получаем ответ от AI
+    # Получаем ответ от AI (сервис загружается при первом обращении)
+    from services import ai_trainer_service
     response = await ai_trainer_service.get_response(
         user_id=message.from_user.id,
         user_message=message.text,
@@ -371,6 +371,7 @@ async def ai_feedback(callback: CallbackQuery):
     """Обратная связь на ответ AI"""
     feedback = callback.data.split(":")[1]
     
+    from services import ai_trainer_service
     await ai_trainer_service.save_feedback(callback.from_user.id, feedback)
     
     if feedback == "helpful":
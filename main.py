@@ -2,29 +2,59 @@
 CRM Bot для продажи рекламы в Telegram-каналах и сети Max
 Точка входа
 """
+import time
+
+# Момент старта процесса — до импорта остальных модулей, чтобы метрика
+# времени запуска включала и время импорта
+_PROCESS_STARTED = time.monotonic()
+
+from config import STARTUP_IMPORT_PROFILE, STARTUP_IMPORT_PROFILE_TOP
+from services.startup import ImportProfiler, StartupTracker
+
+# Профиль импорта ставится до тяжёлых модулей (aiogram, SQLAlchemy, обработчики)
+_import_profiler = ImportProfiler().install() if STARTUP_IMPORT_PROFILE else None
+
 import asyncio
 import html as html_module
 import json
 import logging
 import traceback
 from datetime import datetime, timedelta
+from typing import Optional
 
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ErrorEvent
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from sqlalchemy import select, update as sa_update
-
-from config import BOT_TOKEN, MAX_BOT_TOKEN, ADMIN_IDS, ADMIN_PASSWORD, LOCAL_TZ_OFFSET
+from sqlalchemy import select, update as sa_update, literal_column, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from config import (
+    BOT_TOKEN, MAX_BOT_TOKEN, ADMIN_PASSWORD, LOCAL_TZ_OFFSET,
+    PUBLISH_WORKERS, PUBLISH_CLAIM_BATCH, PUBLISH_CLAIM_LEASE_SECONDS, PUBLISH_SAFETY_POLL_MINUTES,
+    INSTANCE_ID,
+    SLOT_CLEANUP_INTERVAL_SECONDS, DELETE_BATCH_SIZE, DELETE_WORKERS, TELEMETR_SYNC_HOURS,
+)
 from database import init_db, async_session_maker
 from database.models import Slot, ScheduledPost, Channel, PostAnalytics, Manager
 from handlers import setup_routers
-from services.broadcast import send_update_broadcast
-from services.channel_collector import refresh_all_channels
-from services.settings import get_manager_group_chat_id
-from services.crosspost import crosspost_post_to_max
-from services.error_library import lookup_error, record_unknown_error
+from services.broadcast import broadcast_engine, send_update_broadcast
+from services.channel_collector import (
+    refresh_all_channels, post_view_buffer, reach_recomputer, sync_all_channels_from_telemetr,
+)
+from services.ad_index import ad_message_index
+from services.view_snapshots import maintain_view_snapshots
+from services.telemetr import telemetr_service
+from services.settings import get_manager_group_chat_id, settings_cache, start_settings_cache
+from services.crosspost import enqueue_crosspost
+from services.crosspost_outbox import crosspost_outbox
+from services.publish_scheduler import publish_scheduler
+from services.rate_limiter import telegram_rate_limiter
+from services.notifications import notification_dispatcher, Notification
+from services.metrics_cache import invalidate_metrics, TAG_ANALYTICS
+from services.rollups import rollup_refresher
 from utils.helpers import format_channel_stats_for_group, format_daily_schedule, utc_now
 from utils.constants import FMT_DATETIME
 
@@ -37,49 +67,75 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Блокировка, предотвращающая повторный вход в publish_scheduled_posts
-# внутри одного процесса (дополнительная защита к max_instances=1 в планировщике).
+# внутри одного процесса (дополнительная защита к последовательному вызову
+# из publish_scheduler).
 _publishing_lock = asyncio.Lock()
 
+
 # Глобальный экземпляр Max-бота (устанавливается в run_max_bot() при старте).
 # Используется для кросспостинга постов из Telegram в Max.
 _max_bot_instance = None
 
 async def cleanup_expired_slots():
-    """Освобождаем слоты, у которых истёк срок резервации"""
+    """Освобождаем слоты, у которых истёк срок резервации.
+
+    Один UPDATE … RETURNING id вместо загрузки ORM-объектов: стоимость
+    задачи не зависит от числа просроченных слотов (поиск идёт по
+    частичному индексу idx_slots_reserved_until).
+    """
     try:
         async with async_session_maker() as session:
             result = await session.execute(
-                select(Slot).where(
+                sa_update(Slot)
+                .where(
                     Slot.status == "reserved",
-                    Slot.reserved_until < utc_now()
+                    Slot.reserved_until < utc_now(),
                 )
+                .values(status="available", reserved_by=None, reserved_until=None)
+                .returning(Slot.id)
             )
-            expired_slots = result.scalars().all()
-            if expired_slots:
-                for slot in expired_slots:
-                    slot.status = "available"
-                    slot.reserved_by = None
-                    slot.reserved_until = None
-                await session.commit()
-                logger.info(f"Освобождено {len(expired_slots)} просроченных слотов")
+            freed_ids = result.scalars().all()
+            await session.commit()
+            if freed_ids:
+                logger.info(f"Освобождено {len(freed_ids)} просроченных слотов")
     except Exception:
         logger.error(f"Ошибка очистки слотов: {traceback.format_exc()}")
 
 
-async def _reset_stale_publishing_posts(bot: Bot = None):
-    """Переводим «застрявшие» посты из publishing → error при старте бота.
+async def _reset_stale_publishing_posts(at_startup: bool = True):
+    """Переводим «застрявшие» посты из publishing → error.
 
-    Такие посты возникают, если предыдущий запуск завершился аварийно между
+    В publishing пост переводится непосредственно перед отправкой, поэтому
+    такой пост означает, что экземпляр бота завершился аварийно между
     отправкой сообщения в Telegram и фиксацией статуса «опубликован» в БД.
     Поскольку мы не знаем, был ли пост в итоге отправлен, мы выбираем
     стратегию «не публиковать дважды»: помечаем такие посты как ошибочные
     и оставляем решение о повторной публикации администратору.
+
+    Посты других экземпляров затрагиваются, только если их аренда истекла:
+    реплика, публикующая пост прямо сейчас, его не потеряет. При запуске
+    (``at_startup``) дополнительно сбрасываются все посты этого экземпляра —
+    их захватил предыдущий, уже завершившийся процесс; захваченные им, но
+    не начатые посты возвращаются в очередь.
     """
+    lease_expired = utc_now() - timedelta(seconds=PUBLISH_CLAIM_LEASE_SECONDS)
+    stale = or_(ScheduledPost.claimed_at.is_(None), ScheduledPost.claimed_at < lease_expired)
+    if at_startup:
+        stale = or_(stale, ScheduledPost.claimed_by == INSTANCE_ID)
     try:
         async with async_session_maker() as session:
+            if at_startup:
+                await session.execute(
+                    sa_update(ScheduledPost)
+                    .where(
+                        ScheduledPost.status == "pending",
+                        ScheduledPost.claimed_by == INSTANCE_ID,
+                    )
+                    .values(claimed_by=None, claimed_at=None)
+                )
             result = await session.execute(
                 sa_update(ScheduledPost)
-                .where(ScheduledPost.status == "publishing")
+                .where(ScheduledPost.status == "publishing", stale)
                 .values(status="error")
                 .returning(ScheduledPost.id)
             )
@@ -89,348 +145,529 @@ async def _reset_stale_publishing_posts(bot: Bot = None):
                 logger.warning(
                     f"Найдено {len(stale_ids)} постов в статусе 'publishing' "
                     f"(ID: {stale_ids}) — переведены в 'error'. "
-                    f"Предыдущий запуск бота, вероятно, завершился в процессе "
+                    f"Экземпляр бота, вероятно, завершился в процессе "
                     f"публикации. При необходимости перезапустите посты вручную."
                 )
-                if bot:
-                    notify_text = (
-                        f"⚠️ При запуске найдено {len(stale_ids)} поста(ов) "
-                        f"в статусе 'publishing' (ID: {stale_ids}).\n\n"
-                        f"Они переведены в статус 'error'. "
-                        f"Проверьте и при необходимости перезапустите их вручную."
-                    )
-                    for admin_id in ADMIN_IDS:
-                        try:
-                            await bot.send_message(admin_id, notify_text, parse_mode=None)
-                        except Exception:
-                            logger.warning(
-                                f"Не удалось уведомить админа {admin_id} о застрявших постах",
-                                exc_info=True,
-                            )
+                notification_dispatcher.notify_admins(
+                    f"⚠️ Найдено {len(stale_ids)} поста(ов), прерванных во время отправки "
+                    f"(статус 'publishing', ID: {stale_ids}).\n\n"
+                    f"Они переведены в статус 'error'. "
+                    f"Проверьте и при необходимости перезапустите их вручную."
+                )
     except Exception:
         logger.error(f"Ошибка сброса застрявших постов: {traceback.format_exc()}")
 
 
-async def publish_scheduled_posts(bot: Bot):
-    """Публикуем посты, время которых наступило, и уведомляем админов"""
+async def _start_publishing(bot: Bot) -> None:
+    """Фоновый этап запуска: сброс застрявших постов, затем планировщик публикаций.
+
+    Планировщик запускается только после сброса, чтобы не перевести в 'error'
+    посты, которые публикует уже этот запуск.
+    """
+    await _reset_stale_publishing_posts()
+    # Событийный планировщик просыпается точно ко времени ближайшего поста
+    await publish_scheduler.reload()
+    publish_scheduler.start(lambda: publish_scheduled_posts(bot))
+
+
+async def _start_view_tracking() -> None:
+    """Фоновый этап запуска: индекс рекламных сообщений и буфер просмотров.
+
+    Пока индекс не загружен, обновления channel_post отбрасываются как
+    нерекламные — просмотры этих постов придут со следующими обновлениями.
+    """
+    # Обновления нерекламных постов отбрасываются по индексу без запросов к БД
+    await ad_message_index.reload()
+    # Секции post_view_snapshots на текущий и следующие месяцы — до первой записи снимков
+    await maintain_view_snapshots()
+    post_view_buffer.start()
+
+
+async def publish_scheduled_posts(bot: Bot) -> bool:
+    """Публикуем посты, время которых наступило, и уведомляем админов.
+
+    Возвращает False, если запуск пропущен или завершился ошибкой, —
+    publish_scheduler тогда повторит его позже.
+    """
     # Быстрая проверка без захвата блокировки — если уже выполняется, просто выходим
     if _publishing_lock.locked():
         logger.info("publish_scheduled_posts уже выполняется — пропускаем этот запуск")
-        return
+        return False
     async with _publishing_lock:
-        await _do_publish_scheduled_posts(bot)
+        return await _do_publish_scheduled_posts(bot)
+
 
+async def _do_publish_scheduled_posts(bot: Bot) -> bool:
+    """Внутренняя реализация публикации постов (вызывается под блокировкой).
 
-async def _do_publish_scheduled_posts(bot: Bot):
-    """Внутренняя реализация публикации постов (вызывается под блокировкой)."""
+    Наступившие посты захватываются пачками по PUBLISH_CLAIM_BATCH.
+    Посты разных каналов публикуются параллельно пулом из PUBLISH_WORKERS
+    воркеров; посты одного канала — последовательно, в порядке времени.
+    Частота отправки ограничивается telegram_rate_limiter.
+    """
     try:
-        async with async_session_maker() as session:
-            result = await session.execute(
-                select(ScheduledPost).where(
-                    ScheduledPost.status == "pending",
-                    ScheduledPost.scheduled_time <= utc_now()
-                )
+        total_posts = 0
+        total_channels: set[int] = set()
+        while True:
+            claimed_posts = await _claim_due_posts(PUBLISH_CLAIM_BATCH)
+            if not claimed_posts:
+                break
+            total_posts += len(claimed_posts)
+            total_channels.update(p.channel_id for p in claimed_posts)
+            await _publish_claimed_posts(bot, claimed_posts)
+            # Неполная пачка — очередь исчерпана, новых запросов не делаем
+            if len(claimed_posts) < PUBLISH_CLAIM_BATCH:
+                break
+
+        if total_posts:
+            logger.info(
+                f"Публикация завершена: {total_posts} пост(ов) в {len(total_channels)} канал(ах)"
             )
-            posts = result.scalars().all()
+        return True
 
-            for post in posts:
-                # Атомарно «захватываем» пост: меняем статус pending → publishing.
-                # Если другой процесс или предыдущий запуск уже изменил статус,
-                # RETURNING вернёт пустой результат — пропускаем этот пост.
-                claim = await session.execute(
-                    sa_update(ScheduledPost)
-                    .where(
-                        ScheduledPost.id == post.id,
-                        ScheduledPost.status == "pending",
-                    )
-                    .values(status="publishing")
-                    .returning(ScheduledPost.id)
-                )
-                await session.commit()
-                if claim.scalar_one_or_none() is None:
-                    logger.info(f"Пост #{post.id} уже обрабатывается другим процессом — пропускаем")
-                    continue
+    except Exception:
+        logger.error(f"Ошибка в _do_publish_scheduled_posts: {traceback.format_exc()}")
+        return False
 
-                channel = await session.get(Channel, post.channel_id)
-                if not channel:
-                    logger.warning(f"Канал #{post.channel_id} не найден для поста #{post.id}")
-                    post.status = "error"
-                    await session.commit()
-                    for admin_id in ADMIN_IDS:
-                        try:
-                            await bot.send_message(
-                                admin_id,
-                                f"⚠️ Пост #{post.id} не опубликован: канал #{post.channel_id} не найден.\n"
-                                f"Проверьте настройки канала.",
-                                parse_mode=None,
-                            )
-                        except Exception:
-                            pass
-                    continue
-
-                channel_tg_id = channel.telegram_id
-
-                # Ищем менеджера, создавшего пост
-                post_manager_name = None
-                if post.created_by:
-                    mgr_result = await session.execute(
-                        select(Manager).where(Manager.telegram_id == post.created_by)
-                    )
-                    mgr = mgr_result.scalar_one_or_none()
-                    if mgr:
-                        post_manager_name = mgr.first_name
-
-                # Строим текст/подпись поста с учётом подписи со скрытой ссылкой
-                post_parse_mode = None
-                if post.signature:
-                    # Экранируем основной контент для HTML-режима
-                    escaped_content = html_module.escape(post.content or "")
-                    # Формат «Текст | URL» — кликабельная подпись с произвольной ссылкой
-                    if " | " in post.signature:
-                        parts = post.signature.split(" | ", 1)
-                        sig_text = parts[0].strip()
-                        sig_url = parts[1].strip()
-                        if sig_text and sig_url.startswith(("http://", "https://", "tg://")):
-                            sig_html = (
-                                f'<a href="{html_module.escape(sig_url)}">'
-                                f'{html_module.escape(sig_text)}</a>'
-                            )
-                        else:
-                            sig_html = html_module.escape(post.signature)
-                    else:
-                        channel_username = channel.username if channel.username else None
-                        channel_url = f"https://t.me/{channel_username}" if channel_username else None
-                        if channel_url:
-                            sig_html = (
-                                f'<a href="{html_module.escape(channel_url)}">'
-                                f'{html_module.escape(post.signature)}</a>'
-                            )
-                        else:
-                            sig_html = html_module.escape(post.signature)
-                    post_text = f"{escaped_content}\n\n{sig_html}" if escaped_content else sig_html
-                    post_parse_mode = "HTML"
-                else:
-                    post_text = post.content or ""
-                caption = post_text or None
 
-                # Build inline keyboard from saved buttons (if any)
-                post_markup = None
-                if post.inline_buttons:
-                    try:
-                        btns = json.loads(post.inline_buttons)
-                        if btns:
-                            post_markup = InlineKeyboardMarkup(inline_keyboard=[
-                                [InlineKeyboardButton(text=b["text"], url=b["url"])]
-                                for b in btns
-                            ])
-                    except Exception:
-                        logger.warning(
-                            f"Не удалось разобрать inline_buttons поста #{post.id} — "
-                            f"пост будет опубликован без кнопок",
-                            exc_info=True,
-                        )
-
-                # Отправляем пост в канал — только ошибки отправки меняют статус
-                sent = None
+async def _claim_due_posts(limit: int) -> list[ScheduledPost]:
+    """Атомарно захватить до ``limit`` наступивших постов одним запросом.
+
+    UPDATE … WHERE id IN (SELECT … FOR UPDATE SKIP LOCKED LIMIT n) RETURNING *
+    помечает посты владельцем (claimed_by/claimed_at) и сразу возвращает их
+    строки; статус остаётся pending до начала отправки (_begin_publish).
+    SKIP LOCKED и аренда позволяют нескольким экземплярам бота разбирать
+    очередь одновременно: посты с действующим захватом пропускаются.
+    """
+    now = utc_now()
+    due_ids = (
+        select(ScheduledPost.id)
+        .where(
+            ScheduledPost.status == "pending",
+            ScheduledPost.scheduled_time <= now,
+            or_(
+                ScheduledPost.claimed_at.is_(None),
+                ScheduledPost.claimed_at < now - timedelta(seconds=PUBLISH_CLAIM_LEASE_SECONDS),
+            ),
+        )
+        .order_by(ScheduledPost.scheduled_time, ScheduledPost.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    async with async_session_maker() as session:
+        result = await session.scalars(
+            sa_update(ScheduledPost)
+            .where(
+                ScheduledPost.id.in_(due_ids),
+                ScheduledPost.status == "pending",
+            )
+            .values(claimed_by=INSTANCE_ID, claimed_at=now)
+            .returning(ScheduledPost)
+            .execution_options(synchronize_session=False)
+        )
+        posts = result.all()
+        await session.commit()
+    # RETURNING не гарантирует порядок строк
+    posts.sort(key=lambda p: (p.scheduled_time, p.id))
+    return posts
+
+
+async def _publish_claimed_posts(bot: Bot, posts: list[ScheduledPost]) -> None:
+    """Опубликовать захваченные посты пулом из PUBLISH_WORKERS воркеров."""
+    posts_by_channel: dict[int, list[ScheduledPost]] = {}
+    for post in posts:
+        posts_by_channel.setdefault(post.channel_id, []).append(post)
+
+    semaphore = asyncio.Semaphore(PUBLISH_WORKERS)
+
+    async def _publish_channel_queue(channel_posts: list[ScheduledPost]) -> None:
+        async with semaphore:
+            for post in channel_posts:
                 try:
-                    if post.file_id and post.file_type == "photo":
-                        sent = await bot.send_photo(
-                            chat_id=channel_tg_id,
-                            photo=post.file_id,
-                            caption=caption,
-                            parse_mode=post_parse_mode,
-                            reply_markup=post_markup,
-                        )
-                    elif post.file_id and post.file_type == "video":
-                        sent = await bot.send_video(
-                            chat_id=channel_tg_id,
-                            video=post.file_id,
-                            caption=caption,
-                            parse_mode=post_parse_mode,
-                            reply_markup=post_markup,
-                        )
-                    elif post.file_id and post.file_type == "document":
-                        sent = await bot.send_document(
-                            chat_id=channel_tg_id,
-                            document=post.file_id,
-                            caption=caption,
-                            parse_mode=post_parse_mode,
-                            reply_markup=post_markup,
-                        )
-                    else:
-                        sent = await bot.send_message(
-                            chat_id=channel_tg_id,
-                            text=post_text,
-                            parse_mode=post_parse_mode,
-                            reply_markup=post_markup,
-                        )
+                    await _publish_post(bot, post)
                 except Exception:
                     logger.error(f"Ошибка публикации поста #{post.id}: {traceback.format_exc()}")
-                    post.status = "error"
-                    await session.commit()
-                    for admin_id in ADMIN_IDS:
-                        try:
-                            await bot.send_message(
-                                admin_id,
-                                f"⚠️ Пост #{post.id} не опубликован в канале {channel.name}.\n"
-                                f"Проверьте пост и при необходимости перезапустите его вручную.",
-                                parse_mode=None,
-                            )
-                        except Exception:
-                            pass
-                    continue
-
-                if sent is None:
-                    logger.error(f"Пост #{post.id}: sent=None после отправки — пропускаем")
-                    post.status = "error"
-                    await session.commit()
-                    for admin_id in ADMIN_IDS:
-                        try:
-                            await bot.send_message(
-                                admin_id,
-                                f"⚠️ Пост #{post.id} не опубликован в канале {channel.name} (нет ответа от Telegram).\n"
-                                f"Проверьте пост и при необходимости перезапустите его вручную.",
-                                parse_mode=None,
-                            )
-                        except Exception:
-                            pass
-                    continue
-
-                # Пост отправлен — фиксируем статус «опубликован» немедленно.
-                # Пост был атомарно захвачен в «publishing» перед отправкой,
-                # поэтому повторная публикация другим экземпляром невозможна.
-                posted_at = utc_now()
-                post.status = "posted"
-                post.posted_at = posted_at
-                post.message_id = sent.message_id
-
-                # Кросспостинг в Max (если включён для этого поста).
-                # Примечание: _max_bot_instance проверяется на наличие, но не на
-                # работоспособность соединения. При сбое Max-бота ошибка будет
-                # поймана блоком except ниже и залогирована без прерывания основного потока.
-                if post.crosspost_to_max and _max_bot_instance is not None:
-                    try:
-                        await crosspost_post_to_max(post, _max_bot_instance)
-                    except Exception:
-                        logger.warning(
-                            f"Ошибка кросспостинга поста #{post.id} в Max — "
-                            f"Telegram-пост уже опубликован",
-                            exc_info=True,
-                        )
 
-                await session.commit()
-                logger.info(f"Пост #{post.id} опубликован в канале {channel.name} (msg_id={sent.message_id})")
+    await asyncio.gather(*(
+        _publish_channel_queue(channel_posts) for channel_posts in posts_by_channel.values()
+    ))
 
-                # Создаём начальную запись аналитики в отдельной сессии,
-                # чтобы любой сбой при её создании не переводил основную сессию
-                # в состояние «нужен откат» и не прерывал обработку следующих
-                # постов в той же очереди.
-                try:
-                    async with async_session_maker() as analytics_session:
-                        existing_analytics = (await analytics_session.execute(
-                            select(PostAnalytics).where(PostAnalytics.scheduled_post_id == post.id)
-                        )).scalar_one_or_none()
-                        if not existing_analytics:
-                            analytics_session.add(PostAnalytics(
-                                scheduled_post_id=post.id,
-                                order_id=post.order_id,
-                                channel_id=post.channel_id,
-                            ))
-                            await analytics_session.commit()
-                except Exception:
-                    logger.warning(
-                        f"Не удалось создать запись аналитики для поста #{post.id} — "
-                        f"статус поста уже зафиксирован как «опубликован»",
-                        exc_info=True,
+
+async def _send_limited(chat_id: int, send, **kwargs):
+    """Отправить сообщение с учётом лимитов Telegram.
+
+    ``send`` — метод бота (send_message, send_photo, …). При ответе 429
+    ожидаем указанное Telegram время и повторяем отправку один раз:
+    RetryAfter означает, что сообщение не было доставлено.
+    """
+    await telegram_rate_limiter.acquire(chat_id)
+    try:
+        return await send(chat_id=chat_id, **kwargs)
+    except TelegramRetryAfter as e:
+        logger.warning(f"Telegram RetryAfter {e.retry_after}s для чата {chat_id}")
+        await asyncio.sleep(e.retry_after)
+        await telegram_rate_limiter.acquire(chat_id)
+        return await send(chat_id=chat_id, **kwargs)
+
+
+async def _delete_limited(bot: Bot, chat_id: int, message_id: int):
+    """Удалить сообщение с учётом только общего лимита бота (см. _send_limited)."""
+    await telegram_rate_limiter.acquire_global()
+    try:
+        return await bot.delete_message(chat_id=chat_id, message_id=message_id)
+    except TelegramRetryAfter as e:
+        logger.warning(f"Telegram RetryAfter {e.retry_after}s при удалении из чата {chat_id}")
+        await asyncio.sleep(e.retry_after)
+        await telegram_rate_limiter.acquire_global()
+        return await bot.delete_message(chat_id=chat_id, message_id=message_id)
+
+
+async def _begin_publish(session, post_id: int) -> Optional[ScheduledPost]:
+    """Перевести захваченный этим экземпляром пост pending → publishing.
+
+    Возвращает актуальную строку поста (с правками, сделанными после захвата)
+    или None, если пост тем временем отменён, перенесён на более позднее время
+    или захват перехвачен другим экземпляром после истечения аренды.
+    Перенесённый пост освобождается, чтобы его взяли в новое время.
+    """
+    mine = (
+        ScheduledPost.id == post_id,
+        ScheduledPost.status == "pending",
+        ScheduledPost.claimed_by == INSTANCE_ID,
+    )
+    result = await session.scalars(
+        sa_update(ScheduledPost)
+        .where(*mine, ScheduledPost.scheduled_time <= utc_now())
+        .values(status="publishing", claimed_at=utc_now())
+        .returning(ScheduledPost)
+        .execution_options(synchronize_session=False)
+    )
+    post = result.one_or_none()
+    if post is None:
+        await session.execute(
+            sa_update(ScheduledPost).where(*mine).values(claimed_by=None, claimed_at=None)
+        )
+    await session.commit()
+    return post
+
+
+async def _publish_post(bot: Bot, claimed: ScheduledPost) -> None:
+    """Опубликовать один захваченный пост в отдельной сессии БД."""
+    async with async_session_maker() as session:
+        post = await _begin_publish(session, claimed.id)
+        if post is None:
+            logger.info(f"Пост #{claimed.id} снят с публикации или захвачен другим экземпляром — пропускаем")
+            return
+        channel = await session.get(Channel, post.channel_id)
+        if not channel:
+            logger.warning(f"Канал #{post.channel_id} не найден для поста #{post.id}")
+            post.status = "error"
+            await session.commit()
+            notification_dispatcher.notify_admins(
+                f"⚠️ Пост #{post.id} не опубликован: канал #{post.channel_id} не найден.\n"
+                f"Проверьте настройки канала.",
+            )
+            return
+
+        channel_tg_id = channel.telegram_id
+
+        # Ищем менеджера, создавшего пост
+        post_manager_name = None
+        if post.created_by:
+            mgr_result = await session.execute(
+                select(Manager).where(Manager.telegram_id == post.created_by)
+            )
+            mgr = mgr_result.scalar_one_or_none()
+            if mgr:
+                post_manager_name = mgr.first_name
+
+        # Строим текст/подпись поста с учётом подписи со скрытой ссылкой
+        post_parse_mode = None
+        if post.signature:
+            # Экранируем основной контент для HTML-режима
+            escaped_content = html_module.escape(post.content or "")
+            # Формат «Текст | URL» — кликабельная подпись с произвольной ссылкой
+            if " | " in post.signature:
+                parts = post.signature.split(" | ", 1)
+                sig_text = parts[0].strip()
+                sig_url = parts[1].strip()
+                if sig_text and sig_url.startswith(("http://", "https://", "tg://")):
+                    sig_html = (
+                        f'<a href="{html_module.escape(sig_url)}">'
+                        f'{html_module.escape(sig_text)}</a>'
+                    )
+                else:
+                    sig_html = html_module.escape(post.signature)
+            else:
+                channel_username = channel.username if channel.username else None
+                channel_url = f"https://t.me/{channel_username}" if channel_username else None
+                if channel_url:
+                    sig_html = (
+                        f'<a href="{html_module.escape(channel_url)}">'
+                        f'{html_module.escape(post.signature)}</a>'
                     )
+                else:
+                    sig_html = html_module.escape(post.signature)
+            post_text = f"{escaped_content}\n\n{sig_html}" if escaped_content else sig_html
+            post_parse_mode = "HTML"
+        else:
+            post_text = post.content or ""
+        caption = post_text or None
+
+        # Build inline keyboard from saved buttons (if any)
+        post_markup = None
+        if post.inline_buttons:
+            try:
+                btns = json.loads(post.inline_buttons)
+                if btns:
+                    post_markup = InlineKeyboardMarkup(inline_keyboard=[
+                        [InlineKeyboardButton(text=b["text"], url=b["url"])]
+                        for b in btns
+                    ])
+            except Exception:
+                logger.warning(
+                    f"Не удалось разобрать inline_buttons поста #{post.id} — "
+                    f"пост будет опубликован без кнопок",
+                    exc_info=True,
+                )
 
-                # Уведомляем администраторов (сбои уведомлений не влияют на статус поста)
-                ch_name = channel.name
-                content_len = len(post.content) if post.content else 0
-                text_preview = (post.content[:50] + "…") if content_len > 50 else (post.content or "📎 медиа")
-                notify_text = (
-                    f"✅ Пост #{post.id} опубликован!\n\n"
-                    f"📢 Канал: {ch_name}\n"
-                    f"🕐 Время публикации: {posted_at.strftime(FMT_DATETIME)} UTC\n"
-                    f"📝 Превью: {text_preview}"
+        # Отправляем пост в канал — только ошибки отправки меняют статус
+        sent = None
+        try:
+            if post.file_id and post.file_type == "photo":
+                sent = await _send_limited(
+                    channel_tg_id, bot.send_photo,
+                    photo=post.file_id,
+                    caption=caption,
+                    parse_mode=post_parse_mode,
+                    reply_markup=post_markup,
                 )
-                for admin_id in ADMIN_IDS:
-                    try:
-                        await bot.send_message(admin_id, notify_text, parse_mode=None)
-                    except Exception:
-                        logger.warning(f"Не удалось уведомить админа {admin_id} о посте #{post.id}", exc_info=True)
+            elif post.file_id and post.file_type == "video":
+                sent = await _send_limited(
+                    channel_tg_id, bot.send_video,
+                    video=post.file_id,
+                    caption=caption,
+                    parse_mode=post_parse_mode,
+                    reply_markup=post_markup,
+                )
+            elif post.file_id and post.file_type == "document":
+                sent = await _send_limited(
+                    channel_tg_id, bot.send_document,
+                    document=post.file_id,
+                    caption=caption,
+                    parse_mode=post_parse_mode,
+                    reply_markup=post_markup,
+                )
+            else:
+                sent = await _send_limited(
+                    channel_tg_id, bot.send_message,
+                    text=post_text,
+                    parse_mode=post_parse_mode,
+                    reply_markup=post_markup,
+                )
+        except Exception:
+            logger.error(f"Ошибка публикации поста #{post.id}: {traceback.format_exc()}")
+            post.status = "error"
+            await session.commit()
+            notification_dispatcher.notify_admins(
+                f"⚠️ Пост #{post.id} не опубликован в канале {channel.name}.\n"
+                f"Проверьте пост и при необходимости перезапустите его вручную.",
+            )
+            return
 
-                # Отправляем статистику канала и пересылаем пост в чат менеджеров
-                # Посты с delete_after_hours=0 ("не удалять") не являются рекламными
-                # и не отправляются в чат менеджеров
-                mgr_chat_id = await get_manager_group_chat_id()
-                if mgr_chat_id and post.delete_after_hours != 0:
-                    try:
-                        await bot.send_message(
-                            mgr_chat_id,
-                            format_channel_stats_for_group(channel, manager_name=post_manager_name),
-                            parse_mode="Markdown",
-                        )
-                    except Exception:
-                        logger.warning(
-                            f"Не удалось отправить статистику канала в чат менеджеров "
-                            f"(пост #{post.id})",
-                            exc_info=True,
-                        )
-                    try:
-                        await bot.forward_message(
-                            chat_id=mgr_chat_id,
-                            from_chat_id=channel_tg_id,
-                            message_id=sent.message_id,
-                        )
-                    except Exception:
-                        logger.warning(
-                            f"Не удалось переслать пост #{post.id} в чат менеджеров",
-                            exc_info=True,
-                        )
+        if sent is None:
+            logger.error(f"Пост #{post.id}: sent=None после отправки — пропускаем")
+            post.status = "error"
+            await session.commit()
+            notification_dispatcher.notify_admins(
+                f"⚠️ Пост #{post.id} не опубликован в канале {channel.name} (нет ответа от Telegram).\n"
+                f"Проверьте пост и при необходимости перезапустите его вручную.",
+            )
+            return
 
-    except Exception:
-        logger.error(f"Ошибка в _do_publish_scheduled_posts: {traceback.format_exc()}")
+        # Пост отправлен — фиксируем статус «опубликован» немедленно.
+        # Пост был атомарно переведён в «publishing» перед отправкой,
+        # поэтому повторная публикация другим экземпляром невозможна.
+        posted_at = utc_now()
+        post.status = "posted"
+        post.posted_at = posted_at
+        post.message_id = sent.message_id
+
+        # Кросспостинг в Max (если включён для этого поста): запись в очередь
+        # фиксируется вместе со статусом, отправляет её crosspost_outbox —
+        # публикация в Telegram не ждёт Max API.
+        crosspost_queued = False
+        if post.crosspost_to_max and MAX_BOT_TOKEN:
+            try:
+                crosspost_queued = await enqueue_crosspost(session, post)
+            except Exception:
+                logger.warning(
+                    f"Не удалось поставить пост #{post.id} в очередь кросспостинга в Max — "
+                    f"Telegram-пост уже опубликован",
+                    exc_info=True,
+                )
 
+        await session.commit()
+        if crosspost_queued:
+            crosspost_outbox.wake()
+        ad_message_index.add_post(
+            post.id, channel.id, channel_tg_id, sent.message_id,
+            order_id=post.order_id, posted_at=posted_at,
+        )
+        logger.info(f"Пост #{post.id} опубликован в канале {channel.name} (msg_id={sent.message_id})")
 
-async def delete_posted_posts(bot: Bot):
-    """Удаляем опубликованные посты из каналов по истечении delete_after_hours"""
+    # Создаём начальную запись аналитики в отдельной сессии,
+    # чтобы любой сбой при её создании не влиял на уже
+    # зафиксированный статус поста.
     try:
-        async with async_session_maker() as session:
-            result = await session.execute(
-                select(ScheduledPost).where(
-                    ScheduledPost.status == "posted",
-                    ScheduledPost.delete_after_hours > 0,
-                    ScheduledPost.posted_at.isnot(None),
-                    ScheduledPost.deleted_at.is_(None),
-                    ScheduledPost.message_id.isnot(None),
+        async with async_session_maker() as analytics_session:
+            # Запись могла уже появиться из channel_post-обновлений
+            result = await analytics_session.execute(
+                pg_insert(PostAnalytics)
+                .values(
+                    scheduled_post_id=post.id,
+                    order_id=post.order_id,
+                    channel_id=post.channel_id,
                 )
+                .on_conflict_do_nothing(index_elements=[PostAnalytics.scheduled_post_id])
             )
-            posts = result.scalars().all()
+            await analytics_session.commit()
+            if result.rowcount:
+                invalidate_metrics(TAG_ANALYTICS)
+                rollup_refresher.mark_post(posted_at)
+    except Exception:
+        logger.warning(
+            f"Не удалось создать запись аналитики для поста #{post.id} — "
+            f"статус поста уже зафиксирован как «опубликован»",
+            exc_info=True,
+        )
 
-            now = utc_now()
-            for post in posts:
-                if post.posted_at + timedelta(hours=post.delete_after_hours) > now:
-                    continue
+    # Уведомления только ставятся в очередь notification_dispatcher:
+    # медленный чат админа или менеджеров не задерживает следующие посты.
+    await _notify_post_published(post, channel, posted_at, post_manager_name)
+
+
+async def _notify_post_published(
+    post: ScheduledPost,
+    channel: Channel,
+    posted_at: datetime,
+    post_manager_name: str = None,
+) -> None:
+    """Поставить в очередь уведомления админов и чата менеджеров об опубликованном посте."""
+    # Уведомляем администраторов (сбои уведомлений не влияют на статус поста)
+    ch_name = channel.name
+    content_len = len(post.content) if post.content else 0
+    text_preview = (post.content[:50] + "…") if content_len > 50 else (post.content or "📎 медиа")
+    notify_text = (
+        f"✅ Пост #{post.id} опубликован!\n\n"
+        f"📢 Канал: {ch_name}\n"
+        f"🕐 Время публикации: {posted_at.strftime(FMT_DATETIME)} UTC\n"
+        f"📝 Превью: {text_preview}"
+    )
+    notification_dispatcher.notify_admins(
+        notify_text,
+        digest_key="post_published",
+        digest_title="✅ Опубликовано постов: {count}",
+        digest_line=f"• #{post.id} — {ch_name}",
+    )
 
-                channel = await session.get(Channel, post.channel_id)
-                if not channel:
-                    post.deleted_at = now
-                    await session.commit()
-                    continue
+    # Отправляем статистику канала и пересылаем пост в чат менеджеров
+    # Посты с delete_after_hours=0 ("не удалять") не являются рекламными
+    # и не отправляются в чат менеджеров
+    if post.delete_after_hours == 0:
+        return
+    mgr_chat_id = await get_manager_group_chat_id()
+    if mgr_chat_id:
+        notification_dispatcher.send(
+            mgr_chat_id,
+            format_channel_stats_for_group(channel, manager_name=post_manager_name),
+            parse_mode="Markdown",
+        )
+        notification_dispatcher.enqueue(Notification(
+            mgr_chat_id,
+            method="forward_message",
+            from_chat_id=channel.telegram_id,
+            message_id=post.message_id,
+        ))
+
+
+# Момент, когда опубликованный пост должен быть удалён из канала.
+# Выражение совпадает с индексом idx_scheduled_posts_delete_due.
+_POST_DELETE_AT = ScheduledPost.posted_at + ScheduledPost.delete_after_hours * literal_column("INTERVAL '1 hour'")
 
-                try:
-                    await bot.delete_message(
-                        chat_id=channel.telegram_id,
-                        message_id=post.message_id,
-                    )
-                except Exception:
-                    logger.warning(f"Не удалось удалить сообщение поста #{post.id} из канала: {traceback.format_exc()}")
 
-                post.deleted_at = now
-                post.status = "deleted"
+async def delete_posted_posts(bot: Bot):
+    """Удаляем опубликованные посты из каналов по истечении delete_after_hours.
+
+    Просроченные посты выбираются пачками по DELETE_BATCH_SIZE (срок
+    вычисляется в SQL), каналы пачки загружаются одним запросом, сообщения
+    удаляются параллельно (DELETE_WORKERS) с учётом общего лимита Telegram,
+    а статусы фиксируются одним UPDATE на пачку. Лимит канала удаления не
+    расходуют — запланированные публикации в тот же канал их не ждут.
+    """
+    try:
+        while True:
+            now = utc_now()
+            async with async_session_maker() as session:
+                posts = (await session.execute(
+                    select(ScheduledPost.id, ScheduledPost.channel_id, ScheduledPost.message_id)
+                    .where(
+                        ScheduledPost.status == "posted",
+                        ScheduledPost.delete_after_hours > 0,
+                        ScheduledPost.deleted_at.is_(None),
+                        ScheduledPost.message_id.isnot(None),
+                        _POST_DELETE_AT <= now,
+                    )
+                    .order_by(_POST_DELETE_AT)
+                    .limit(DELETE_BATCH_SIZE)
+                )).all()
+                if not posts:
+                    return
+
+                channel_ids = {p.channel_id for p in posts}
+                channels = {
+                    row.id: row for row in (await session.execute(
+                        select(Channel.id, Channel.telegram_id, Channel.name)
+                        .where(Channel.id.in_(channel_ids))
+                    )).all()
+                }
+
+            semaphore = asyncio.Semaphore(DELETE_WORKERS)
+
+            async def _delete_one(post) -> None:
+                channel = channels[post.channel_id]
+                async with semaphore:
+                    try:
+                        await _delete_limited(bot, channel.telegram_id, post.message_id)
+                        logger.info(f"Пост #{post.id} удалён из канала {channel.name}")
+                    except Exception:
+                        logger.warning(f"Не удалось удалить сообщение поста #{post.id} из канала: {traceback.format_exc()}")
+
+            # Посты, канал которых удалён, только помечаем (статус не меняем)
+            orphan_ids = [p.id for p in posts if p.channel_id not in channels]
+            deletable = [p for p in posts if p.channel_id in channels]
+            await asyncio.gather(*(_delete_one(p) for p in deletable))
+
+            async with async_session_maker() as session:
+                if deletable:
+                    await session.execute(
+                        sa_update(ScheduledPost)
+                        .where(ScheduledPost.id.in_([p.id for p in deletable]))
+                        .values(deleted_at=now, status="deleted")
+                    )
+                if orphan_ids:
+                    await session.execute(
+                        sa_update(ScheduledPost)
+                        .where(ScheduledPost.id.in_(orphan_ids))
+                        .values(deleted_at=now)
+                    )
                 await session.commit()
-                logger.info(f"Пост #{post.id} удалён из канала {channel.name}")
+
+            for p in posts:
+                ad_message_index.remove_post(p.channel_id, p.message_id)
+
+            if len(posts) < DELETE_BATCH_SIZE:
+                return
 
     except Exception:
         logger.error(f"Ошибка в delete_posted_posts: {traceback.format_exc()}")
@@ -451,18 +688,8 @@ async def send_daily_reach_report(bot: Bot):
         date_str = utc_now().strftime("%d.%m.%Y")
         text = format_daily_reach_report_text(data, date_str, bold="*")
 
-        mgr_chat_id = await get_manager_group_chat_id()
-        if mgr_chat_id:
-            try:
-                await bot.send_message(mgr_chat_id, text, parse_mode=ParseMode.MARKDOWN)
-            except Exception:
-                logger.warning("Не удалось отправить отчёт об охватах в чат менеджеров", exc_info=True)
-
-        for admin_id in ADMIN_IDS:
-            try:
-                await bot.send_message(admin_id, text, parse_mode=ParseMode.MARKDOWN)
-            except Exception:
-                logger.warning(f"Не удалось отправить отчёт об охватах админу {admin_id}", exc_info=True)
+        await notification_dispatcher.notify_manager_group(text, parse_mode=ParseMode.MARKDOWN)
+        notification_dispatcher.notify_admins(text, parse_mode=ParseMode.MARKDOWN)
 
         logger.info(f"Отчёт об охватах за сутки отправлен: {data['count']} постов")
     except Exception:
@@ -560,7 +787,8 @@ async def global_error_handler(event: ErrorEvent, bot: Bot) -> bool:
     # Трейсбэк (первые 600 символов, чтобы не флудить)
     tb_short = tb[-600:] if len(tb) > 600 else tb
 
-    # Поиск в библиотеке ошибок
+    # Поиск в библиотеке ошибок (модуль загружается при первой ошибке)
+    from services.error_library import lookup_error, record_unknown_error
     known = lookup_error(exception, tb)
     if known:
         solution_block = (
@@ -581,11 +809,7 @@ async def global_error_handler(event: ErrorEvent, bot: Bot) -> bool:
         f"{solution_block}"
     )
 
-    for admin_id in ADMIN_IDS:
-        try:
-            await bot.send_message(admin_id, notify_text, parse_mode=ParseMode.MARKDOWN)
-        except Exception:
-            logger.warning(f"Не удалось отправить уведомление об ошибке админу {admin_id}", exc_info=True)
+    notification_dispatcher.notify_admins(notify_text, parse_mode=ParseMode.MARKDOWN)
 
     return True
 
@@ -648,27 +872,54 @@ async def main():
     # Регистрируем глобальный обработчик ошибок
     dp.errors.register(global_error_handler)
     
-    # Инициализация БД
-    logger.info("Инициализация базы данных...")
-    await init_db()
-
-    # Сброс «застрявших» постов из предыдущего запуска
-    await _reset_stale_publishing_posts(bot)
+    # Фоновая доставка служебных уведомлений админам и в чат менеджеров
+    notification_dispatcher.start(bot)
+
+    # Критический путь: без БД и настроек бот не может отвечать пользователям
+    startup = StartupTracker(process_started=_PROCESS_STARTED)
+    async with startup.stage("база данных"):
+        await init_db()
+    async with startup.stage("настройки"):
+        # Настройки bot_settings читаются из памяти
+        await start_settings_cache()
+
+    # Остальная подготовка — в фоне, параллельно с приёмом обновлений
+    startup.background("публикация постов", _start_publishing(bot))
+    startup.background("учёт просмотров", _start_view_tracking())
+    # Дневные сводки для метрик: заполнение при первом запуске
+    # и пересчёт изменённых дней
+    startup.background("дневные сводки", rollup_refresher.backfill_if_empty())
+    rollup_refresher.start()
+
+    # Фоновая отправка кросспостов в Max (ждёт запуска Max-бота)
+    if MAX_BOT_TOKEN:
+        crosspost_outbox.start(lambda: _max_bot_instance)
 
     # Планировщик задач
     scheduler = AsyncIOScheduler()
     scheduler.add_job(
         cleanup_expired_slots,
         trigger="interval",
-        minutes=5,
-        id="cleanup_expired_slots"
+        seconds=SLOT_CLEANUP_INTERVAL_SECONDS,
+        id="cleanup_expired_slots",
+        max_instances=1,
     )
+    # Периодическая перезагрузка очереди публикаций из БД — страховка
+    # к событийному планировщику (он запускается в _start_publishing)
     scheduler.add_job(
-        publish_scheduled_posts,
+        publish_scheduler.reload,
         trigger="interval",
-        minutes=1,
+        minutes=PUBLISH_SAFETY_POLL_MINUTES,
         id="publish_scheduled_posts",
-        args=[bot],
+        max_instances=1,
+    )
+    # Посты, прерванные во время отправки на упавшей реплике, — по истечении аренды
+    scheduler.add_job(
+        _reset_stale_publishing_posts,
+        trigger="interval",
+        minutes=PUBLISH_SAFETY_POLL_MINUTES,
+        kwargs={"at_startup": False},
+        id="reset_stale_publishing_posts",
         max_instances=1,
     )
     scheduler.add_job(
@@ -685,6 +936,23 @@ async def main():
         id="refresh_all_channels",
         args=[bot],
     )
+    # Между полными обновлениями — пересчёт охвата каналов с новой аналитикой
+    scheduler.add_job(
+        reach_recomputer.run,
+        trigger="interval",
+        minutes=30,
+        id="recompute_channel_reach",
+        max_instances=1,
+    )
+    # Пакетная синхронизация аналитики каналов с Telemetr
+    if telemetr_service.api_token and TELEMETR_SYNC_HOURS > 0:
+        scheduler.add_job(
+            sync_all_channels_from_telemetr,
+            trigger="interval",
+            hours=TELEMETR_SYNC_HOURS,
+            id="sync_channels_from_telemetr",
+            max_instances=1,
+        )
     # Ежедневный отчёт об охватах: в 9:00 по местному времени (LOCAL_TZ_OFFSET)
     report_hour_utc = (9 - int(LOCAL_TZ_OFFSET.total_seconds() // 3600)) % 24
     scheduler.add_job(
@@ -705,22 +973,50 @@ async def main():
         id="daily_schedule",
         args=[bot],
     )
+    # Страховочная перезагрузка индекса рекламных сообщений
+    scheduler.add_job(
+        ad_message_index.reload,
+        trigger="interval",
+        minutes=15,
+        id="reload_ad_message_index",
+        max_instances=1,
+    )
+    # Страховочный пересчёт сводок за последние дни (изменения в обход хуков)
+    scheduler.add_job(
+        rollup_refresher.refresh_recent,
+        trigger="cron",
+        hour=0,
+        minute=30,
+        id="refresh_daily_rollups",
+        max_instances=1,
+    )
+    # Секции и прореживание снимков просмотров
+    scheduler.add_job(
+        maintain_view_snapshots,
+        trigger="cron",
+        hour=1,
+        minute=0,
+        id="maintain_view_snapshots",
+        max_instances=1,
+    )
     scheduler.start()
     logger.info("Планировщик задач запущен")
-    
+
+    # Рассылка об обновлении всем пользователям (если версия изменилась) — в фоне,
+    # прерванная рассылка продолжается с места остановки
+    startup.background("рассылка об обновлении", send_update_broadcast(bot))
+
     # Запуск бота
     logger.info("🚀 Бот запускается...")
-    
+    ready_after = startup.mark_ready()
+    startup.summarize_in_background()
+    if _import_profiler:
+        _import_profiler.uninstall()
+        logger.info(_import_profiler.report(STARTUP_IMPORT_PROFILE_TOP))
+
     # Уведомляем админов о запуске
-    for admin_id in ADMIN_IDS:
-        try:
-            await bot.send_message(admin_id, "✅ Бот запущен!")
-        except Exception as e:
-            logger.error(f"Не удалось уведомить админа {admin_id}: {e}")
+    notification_dispatcher.notify_admins(f"✅ Бот запущен! (готов через {ready_after:.1f} с)")
 
-    # Рассылаем сообщение об обновлении всем пользователям (если версия изменилась)
-    await send_update_broadcast(bot)
-    
     try:
         # Запускаем Telegram-бот и Max-бот параллельно
         await asyncio.gather(
@@ -729,6 +1025,15 @@ async def main():
         )
     finally:
         scheduler.shutdown(wait=False)
+        await startup.stop()
+        await publish_scheduler.stop()
+        await post_view_buffer.stop()
+        await rollup_refresher.stop()
+        await crosspost_outbox.stop()
+        await broadcast_engine.stop()
+        await notification_dispatcher.stop()
+        await telemetr_service.close()
+        await settings_cache.stop_listener()
         await bot.session.close()
 
 
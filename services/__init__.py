@@ -1,22 +1,44 @@
 """
 Services package
+
+Имена из ``__all__`` загружаются лениво: подмодуль импортируется при первом
+обращении (``from services import ai_trainer_service``), а не при импорте
+пакета. Так редко используемые подсистемы (AI-тренер, диагностика) не
+замедляют запуск и не занимают память, пока они не нужны.
 """
-from services.telemetr import telemetr_service, TelemetrService
-from services.ai_trainer import ai_trainer_service, AITrainerService
-from services.gamification import gamification_service, GamificationService
-from services.diagnostics import run_diagnostics, gather_business_metrics, get_improvement_suggestions
-from services.settings import (
-    get_setting, set_setting, get_manager_group_chat_id,
-    MANAGER_GROUP_CHAT_ID_KEY, PAYMENT_LINK_KEY,
-    CROSSPOST_ENABLED_KEY, CROSSPOST_DAILY_LIMIT_KEY, MAX_CROSSPOST_CHAT_ID_KEY,
-)
+import importlib
+
+_LAZY_EXPORTS = {
+    "telemetr_service": "services.telemetr",
+    "TelemetrService": "services.telemetr",
+    "ai_trainer_service": "services.ai_trainer",
+    "AITrainerService": "services.ai_trainer",
+    "gamification_service": "services.gamification",
+    "GamificationService": "services.gamification",
+    "run_diagnostics": "services.diagnostics",
+    "gather_business_metrics": "services.diagnostics",
+    "get_improvement_suggestions": "services.diagnostics",
+    "get_setting": "services.settings",
+    "set_setting": "services.settings",
+    "get_manager_group_chat_id": "services.settings",
+    "MANAGER_GROUP_CHAT_ID_KEY": "services.settings",
+    "PAYMENT_LINK_KEY": "services.settings",
+    "CROSSPOST_ENABLED_KEY": "services.settings",
+    "CROSSPOST_DAILY_LIMIT_KEY": "services.settings",
+    "MAX_CROSSPOST_CHAT_ID_KEY": "services.settings",
+}
+
+__all__ = list(_LAZY_EXPORTS)
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
 
-__all__ = [
-    "telemetr_service", "TelemetrService",
-    "ai_trainer_service", "AITrainerService", 
-    "gamification_service", "GamificationService",
-    "run_diagnostics", "gather_business_metrics", "get_improvement_suggestions",
-    "get_setting", "set_setting", "get_manager_group_chat_id", "MANAGER_GROUP_CHAT_ID_KEY",
-    "PAYMENT_LINK_KEY",
-    "CROSSPOST_ENABLED_KEY", "CROSSPOST_DAILY_LIMIT_KEY", "MAX_CROSSPOST_CHAT_ID_KEY",
-]
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,135 @@
+"""
+Индекс рекламных сообщений в каналах (в памяти процесса).
+
+Telegram присылает channel_post / edited_channel_post для каждого поста
+каждого канала, где бот — администратор, а рекламных среди них немного.
+Индекс позволяет отбросить «органические» посты за O(1), не обращаясь к БД:
+
+ - telegram_id канала → Channel.id;
+ - (Channel.id, message_id) опубликованного ScheduledPost → данные поста.
+
+Индекс загружается при старте, пополняется при публикации поста
+(``ad_message_index.add_post``), очищается при удалении
+(``remove_post``) и периодически перезагружается из БД как страховка от
+изменений в обход этих хуков.
+"""
+import logging
+import traceback
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select
+
+from database import async_session_maker, Channel, ScheduledPost
+
+logger = logging.getLogger(__name__)
+
+
+class AdPost(NamedTuple):
+    """Опубликованный рекламный пост, на который приходят обновления просмотров."""
+    post_id: int
+    channel_id: int
+    order_id: Optional[int]
+    posted_at: Optional[datetime]
+
+
+class AdMessageIndex:
+    """Сопоставление сообщений каналов с опубликованными постами."""
+
+    def __init__(self):
+        self._channels: dict[int, int] = {}
+        self._messages: dict[tuple[int, int], AdPost] = {}
+        # Журналы add_post/remove_post для идущих перезагрузок: изменения,
+        # сделанные во время запроса к БД, переносятся в новый индекс
+        self._journals: list[list[tuple]] = []
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def lookup(self, chat_id: int, message_id: int) -> Optional[AdPost]:
+        """Пост по (telegram_id канала, message_id) или None, если это не реклама."""
+        channel_id = self._channels.get(chat_id)
+        if channel_id is None:
+            return None
+        return self._messages.get((channel_id, message_id))
+
+    def add_post(
+        self,
+        post_id: int,
+        channel_id: int,
+        channel_telegram_id: int,
+        message_id: int,
+        order_id: Optional[int] = None,
+        posted_at: Optional[datetime] = None,
+    ) -> None:
+        """Зарегистрировать только что опубликованный пост."""
+        change = ("add", channel_telegram_id, channel_id, message_id,
+                  AdPost(post_id, channel_id, order_id, posted_at))
+        self._apply(self._channels, self._messages, change)
+        for journal in self._journals:
+            journal.append(change)
+
+    def remove_post(self, channel_id: int, message_id: Optional[int]) -> None:
+        """Убрать пост, удалённый из канала."""
+        if message_id is None:
+            return
+        change = ("remove", None, channel_id, message_id, None)
+        self._apply(self._channels, self._messages, change)
+        for journal in self._journals:
+            journal.append(change)
+
+    @staticmethod
+    def _apply(channels: dict, messages: dict, change: tuple) -> None:
+        kind, channel_telegram_id, channel_id, message_id, post = change
+        if kind == "add":
+            channels[channel_telegram_id] = channel_id
+            messages[(channel_id, message_id)] = post
+        else:
+            messages.pop((channel_id, message_id), None)
+
+    async def reload(self) -> None:
+        """Перестроить индекс по каналам и опубликованным постам из БД.
+
+        add_post/remove_post, вызванные во время запроса, повторяются поверх
+        загруженных данных, поэтому перезагрузка их не теряет и не отменяет.
+        """
+        journal: list[tuple] = []
+        self._journals.append(journal)
+        try:
+            async with async_session_maker() as session:
+                channel_rows = (await session.execute(
+                    select(Channel.id, Channel.telegram_id)
+                )).all()
+                post_rows = (await session.execute(
+                    select(
+                        ScheduledPost.id,
+                        ScheduledPost.channel_id,
+                        ScheduledPost.message_id,
+                        ScheduledPost.order_id,
+                        ScheduledPost.posted_at,
+                    ).where(
+                        ScheduledPost.status == "posted",
+                        ScheduledPost.message_id.isnot(None),
+                    )
+                )).all()
+            channels = {row.telegram_id: row.id for row in channel_rows}
+            messages = {
+                (row.channel_id, row.message_id): AdPost(row.id, row.channel_id, row.order_id, row.posted_at)
+                for row in post_rows
+            }
+            for change in journal:
+                self._apply(channels, messages, change)
+            self._channels, self._messages = channels, messages
+            self.loaded = True
+            logger.debug(
+                f"Индекс рекламных сообщений: каналов {len(self._channels)}, постов {len(self._messages)}"
+            )
+        except Exception:
+            logger.error(f"Ошибка загрузки индекса рекламных сообщений: {traceback.format_exc()}")
+        finally:
+            self._journals.remove(journal)
+
+
+# Глобальный индекс рекламных сообщений
+ad_message_index = AdMessageIndex()
@@ -2,44 +2,344 @@
 Рассылка сервисных сообщений всем пользователям бота.
 
 Используется для уведомлений об обновлениях после каждого деплоя.
+
+Рассылка идёт в фоне и не задерживает запуск бота:
+ - получатели версии записываются в broadcast_deliveries (курсор доставки);
+   после перезапуска рассылка продолжается с недоставленных;
+ - получатели забираются порциями по BROADCAST_CHUNK (FOR UPDATE SKIP LOCKED —
+   несколько экземпляров бота не отправляют одному пользователю дважды),
+   результаты порции фиксируются одним UPDATE;
+ - BROADCAST_CONCURRENCY отправок одновременно; темп задаёт
+   AdaptiveRateLimiter (не выше BROADCAST_RATE, снижается при 429) вместе
+   с общим лимитом бота telegram_rate_limiter (без вёдер личных чатов);
+ - прогресс и скорость пишутся в лог каждые BROADCAST_PROGRESS_SECONDS.
 """
 import asyncio
 import logging
+import time
 import traceback
+from datetime import timedelta
+from typing import Callable, Optional
 
 from aiogram import Bot
 from aiogram.enums import ParseMode
-from sqlalchemy import select, union
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from sqlalchemy import BigInteger, String, Text, and_, cast, column, delete, func, literal, or_, select, union, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from config import UPDATE_VERSION, UPDATE_NOTES
-from database import async_session_maker, Client, Manager
+from config import (
+    UPDATE_VERSION, UPDATE_NOTES, BROADCAST_RATE, BROADCAST_CONCURRENCY, BROADCAST_CHUNK,
+    BROADCAST_PROGRESS_SECONDS,
+)
+from database import async_session_maker, BroadcastDelivery, Client, Manager
+from services.notifications import notification_dispatcher
+from services.rate_limiter import AdaptiveRateLimiter, telegram_rate_limiter
 from services.settings import get_setting, set_setting
+from utils.helpers import utc_now
 
 logger = logging.getLogger(__name__)
 
 # Ключ в bot_settings, хранящий версию последней отправленной рассылки
 LAST_BROADCAST_VERSION_KEY = "last_broadcast_version"
 
+# Через сколько секунд порция, забранная упавшим экземпляром, снова доступна
+SENDING_LEASE_SECONDS = 600
+# Сколько раз повторять отправку одному пользователю после 429
+MAX_SEND_ATTEMPTS = 3
 
-async def _get_all_user_ids() -> list[int]:
-    """Возвращает уникальный список telegram_id всех пользователей (клиенты + менеджеры)."""
-    try:
+# Итоговые статусы доставки
+FINAL_STATUSES = ("sent", "blocked", "failed")
+
+
+class BroadcastProgress:
+    """Счётчики рассылки; скорость считается по отправкам текущего запуска."""
+
+    def __init__(
+        self,
+        version: str,
+        total: int,
+        sent: int = 0,
+        blocked: int = 0,
+        failed: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.version = version
+        self.total = total
+        self.sent = sent
+        self.blocked = blocked
+        self.failed = failed
+        self._clock = clock
+        self._started = clock()
+        self._done_at_start = self.done
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    def record(self, status: str) -> None:
+        setattr(self, status, getattr(self, status) + 1)
+
+    def rate(self) -> float:
+        """Сообщений в секунду с момента запуска."""
+        elapsed = self._clock() - self._started
+        return (self.done - self._done_at_start) / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.done}/{self.total}: отправлено {self.sent}, заблокировали бота {self.blocked}, "
+            f"ошибок {self.failed}, {self.rate():.1f} msg/s"
+        )
+
+
+def _seed_statement(version: str):
+    """Добавить в курсор всех пользователей (клиенты + менеджеры), которых в нём нет."""
+    users = union(
+        select(Client.telegram_id).where(Client.telegram_id.isnot(None)),
+        select(Manager.telegram_id).where(Manager.telegram_id.isnot(None)),
+    ).subquery()
+    return (
+        pg_insert(BroadcastDelivery)
+        .from_select(["version", "telegram_id"], select(literal(version), users.c.telegram_id))
+        .on_conflict_do_nothing()
+    )
+
+
+def _counts_statement(version: str):
+    return (
+        select(BroadcastDelivery.status, func.count())
+        .where(BroadcastDelivery.version == version)
+        .group_by(BroadcastDelivery.status)
+    )
+
+
+def _open_condition(now):
+    """Не доставлено: ожидает отправки или забрано, но срок аренды порции истёк."""
+    return or_(
+        BroadcastDelivery.status == "pending",
+        and_(
+            BroadcastDelivery.status == "sending",
+            BroadcastDelivery.updated_at < now - timedelta(seconds=SENDING_LEASE_SECONDS),
+        ),
+    )
+
+
+def _claim_statement(version: str, now, limit: int):
+    chunk = (
+        select(BroadcastDelivery.telegram_id)
+        .where(BroadcastDelivery.version == version, _open_condition(now))
+        .order_by(BroadcastDelivery.telegram_id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    return (
+        update(BroadcastDelivery)
+        .where(BroadcastDelivery.version == version, BroadcastDelivery.telegram_id.in_(chunk))
+        .values(status="sending", updated_at=now)
+        .returning(BroadcastDelivery.telegram_id)
+    )
+
+
+def _results_statement(version: str, rows: list[tuple], now):
+    """UPDATE курсора по строкам (telegram_id, status, error)."""
+    outcome = values(
+        column("telegram_id", BigInteger),
+        column("status", String),
+        column("error", Text),
+        name="outcome",
+    ).data(rows)
+    return (
+        update(BroadcastDelivery)
+        .where(
+            BroadcastDelivery.version == version,
+            BroadcastDelivery.telegram_id == outcome.c.telegram_id,
+        )
+        # NULL в VALUES без приведения типа Postgres считает текстом
+        .values(status=outcome.c.status, error=cast(outcome.c.error, Text), updated_at=now)
+    )
+
+
+class BroadcastEngine:
+    """Фоновая рассылка одного текста всем пользователям с продолжением после перезапуска."""
+
+    def __init__(
+        self,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        chunk_size: int = BROADCAST_CHUNK,
+        rate: float = BROADCAST_RATE,
+        progress_seconds: float = BROADCAST_PROGRESS_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.progress_seconds = progress_seconds
+        self.limiter = AdaptiveRateLimiter(rate, clock=clock)
+        self.progress: Optional[BroadcastProgress] = None
+        self._clock = clock
+        self._task: Optional[asyncio.Task] = None
+
+    # ─── Жизненный цикл ──────────────────────────────────────────────────────
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, bot: Bot, version: str, text: str) -> None:
+        """Запустить рассылку в фоне (если она ещё не идёт)."""
+        if not self.running:
+            self._task = asyncio.create_task(self._run_safe(bot, version, text))
+
+    async def stop(self) -> None:
+        """Прервать рассылку; недоставленные получатели останутся в курсоре."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_safe(self, bot: Bot, version: str, text: str) -> None:
+        try:
+            await self.run(bot, version, text)
+        except asyncio.CancelledError:
+            if self.progress is not None:
+                logger.info(f"Рассылка v{version} прервана ({self.progress.summary()}) — продолжится после перезапуска")
+            raise
+        except Exception:
+            logger.error(f"Ошибка рассылки v{version}: {traceback.format_exc()}")
+
+    # ─── Рассылка ────────────────────────────────────────────────────────────
+
+    async def run(self, bot: Bot, version: str, text: str) -> BroadcastProgress:
+        """Разослать ``text`` всем недоставленным получателям версии ``version``."""
         async with async_session_maker() as session:
-            clients_q = select(Client.telegram_id).where(Client.telegram_id.isnot(None))
-            managers_q = select(Manager.telegram_id).where(Manager.telegram_id.isnot(None))
+            await session.execute(_seed_statement(version))
+            counts = dict((await session.execute(_counts_statement(version))).all())
+            await session.commit()
 
-            result = await session.execute(union(clients_q, managers_q))
-            return [row[0] for row in result.fetchall()]
-    except Exception:
-        logger.error(f"Ошибка получения списка пользователей для рассылки: {traceback.format_exc()}")
-        return []
+        progress = BroadcastProgress(
+            version,
+            total=sum(counts.values()),
+            sent=counts.get("sent", 0),
+            blocked=counts.get("blocked", 0),
+            failed=counts.get("failed", 0),
+            clock=self._clock,
+        )
+        self.progress = progress
+        if progress.done:
+            logger.info(f"Рассылка v{version} продолжается: {progress.summary()}")
+        else:
+            logger.info(f"Рассылка v{version} — {progress.total} пользователей")
+
+        last_report = self._clock()
+        while True:
+            now = utc_now()
+            async with async_session_maker() as session:
+                chunk = list((await session.execute(
+                    _claim_statement(version, now, self.chunk_size)
+                )).scalars().all())
+                remaining = 0
+                if not chunk:
+                    remaining = (await session.execute(
+                        select(func.count()).select_from(BroadcastDelivery).where(
+                            BroadcastDelivery.version == version,
+                            BroadcastDelivery.status.notin_(FINAL_STATUSES),
+                        )
+                    )).scalar_one()
+                await session.commit()
+
+            if not chunk:
+                if not remaining:
+                    break
+                # Порции другого (или упавшего) экземпляра: ждём их завершения
+                # либо истечения аренды
+                await asyncio.sleep(min(60, SENDING_LEASE_SECONDS))
+                continue
+
+            await self._send_chunk(bot, version, text, chunk, progress)
+
+            if self._clock() - last_report >= self.progress_seconds:
+                last_report = self._clock()
+                logger.info(f"Рассылка v{version}: {progress.summary()}, темп {self.limiter.rate:.1f} msg/s")
+
+        await self._finish(version, progress)
+        return progress
+
+    async def _send_chunk(
+        self, bot: Bot, version: str, text: str, chunk: list[int], progress: BroadcastProgress,
+    ) -> None:
+        """Отправить порцию и зафиксировать результаты одним UPDATE.
+
+        При остановке фиксируются уже отправленные, остальные возвращаются в очередь.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for user_id in chunk:
+            queue.put_nowait(user_id)
+        results: dict[int, tuple] = {}
+
+        async def worker() -> None:
+            while not queue.empty():
+                user_id = queue.get_nowait()
+                status, error = await self._deliver(bot, user_id, text)
+                results[user_id] = (user_id, status, error)
+                progress.record(status)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, len(chunk)))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            rows = [results.get(user_id, (user_id, "pending", None)) for user_id in chunk]
+            async with async_session_maker() as session:
+                await session.execute(_results_statement(version, rows, utc_now()))
+                await session.commit()
+
+    async def _deliver(self, bot: Bot, user_id: int, text: str) -> tuple[str, Optional[str]]:
+        """Отправить сообщение одному пользователю; вернуть (статус, ошибка)."""
+        for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+            await self.limiter.acquire()
+            # Каждому пользователю — одно сообщение, поэтому ведро личного чата
+            # не нужно: хватает общего лимита бота
+            await telegram_rate_limiter.acquire_global()
+            try:
+                await bot.send_message(chat_id=user_id, text=text, parse_mode=ParseMode.MARKDOWN)
+            except TelegramRetryAfter as e:
+                self.limiter.on_retry_after(e.retry_after)
+                if attempt == MAX_SEND_ATTEMPTS:
+                    return "failed", f"RetryAfter {e.retry_after}s"
+                continue
+            except TelegramForbiddenError as e:
+                return "blocked", str(e)[:500]
+            except Exception as e:
+                return "failed", str(e)[:500]
+            self.limiter.on_success()
+            return "sent", None
+        return "failed", None
+
+    async def _finish(self, version: str, progress: BroadcastProgress) -> None:
+        await set_setting(LAST_BROADCAST_VERSION_KEY, version)
+        # Курсоры прошлых версий больше не нужны
+        async with async_session_maker() as session:
+            await session.execute(delete(BroadcastDelivery).where(BroadcastDelivery.version != version))
+            await session.commit()
+        logger.info(f"Рассылка обновления v{version} завершена: {progress.summary()}")
+        if progress.total:
+            notification_dispatcher.notify_admins(f"📣 Рассылка обновления v{version} завершена: {progress.summary()}")
+
+
+# Глобальный экземпляр рассылки
+broadcast_engine = BroadcastEngine()
 
 
 async def send_update_broadcast(bot: Bot) -> None:
-    """Проверяет, была ли рассылка для текущей версии бота, и если нет — отправляет её.
+    """Проверяет, была ли рассылка для текущей версии бота, и если нет — запускает её в фоне.
 
-    Вызывается один раз при старте бота. Если ``UPDATE_VERSION`` из config.py
-    совпадает с последней записанной в БД версией рассылки, ничего не происходит.
+    Вызывается один раз при старте бота и не ждёт окончания рассылки. Если
+    ``UPDATE_VERSION`` из config.py совпадает с последней записанной в БД
+    версией рассылки, ничего не происходит; прерванная рассылка продолжается
+    с недоставленных получателей.
     """
     try:
         last_version = await get_setting(LAST_BROADCAST_VERSION_KEY)
@@ -48,35 +348,6 @@ async def send_update_broadcast(bot: Bot) -> None:
                 f"Рассылка об обновлении уже была отправлена для версии {UPDATE_VERSION} — пропускаем"
             )
             return
-
-        user_ids = await _get_all_user_ids()
-        if not user_ids:
-            logger.info("Нет пользователей для рассылки об обновлении")
-            await set_setting(LAST_BROADCAST_VERSION_KEY, UPDATE_VERSION)
-            return
-
-        logger.info(f"Рассылка обновления v{UPDATE_VERSION} — {len(user_ids)} пользователей")
-
-        sent = 0
-        failed = 0
-        for user_id in user_ids:
-            try:
-                await bot.send_message(
-                    chat_id=user_id,
-                    text=UPDATE_NOTES,
-                    parse_mode=ParseMode.MARKDOWN,
-                )
-                sent += 1
-            except Exception:
-                failed += 1
-            # Небольшая задержка, чтобы не превышать лимиты Telegram (~10 msg/sec)
-            await asyncio.sleep(0.1)
-
-        logger.info(
-            f"Рассылка обновления v{UPDATE_VERSION} завершена: "
-            f"отправлено {sent}, ошибок {failed}"
-        )
-        await set_setting(LAST_BROADCAST_VERSION_KEY, UPDATE_VERSION)
-
+        broadcast_engine.start(bot, UPDATE_VERSION, UPDATE_NOTES)
     except Exception:
         logger.error(f"Ошибка рассылки обновления: {traceback.format_exc()}")
@@ -4,19 +4,29 @@
 Бот является администратором каналов и может:
  - Получать количество подписчиков через get_chat_member_count()
  - Принимать обновления channel_post / edited_channel_post, содержащие
-   актуальное поле views для каждого поста
+   актуальное поле views для каждого поста (копятся в post_view_buffer
+   и записываются в БД пакетами)
  - Пересчитывать avg_reach и ERR на основе накопленных PostAnalytics
 """
+import asyncio
 import logging
+import time
 from datetime import datetime, timezone, timedelta
 from typing import Optional
 
 from aiogram import Bot
-from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
-from sqlalchemy import select, func
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest, TelegramRetryAfter
+from sqlalchemy import Integer, Numeric, String, cast, column, func, insert, literal, or_, select, update, values
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
+from config import VIEW_FLUSH_SECONDS, CHANNEL_REFRESH_CONCURRENCY, TELEMETR_MAX_CONNECTIONS
 from database import async_session_maker, Channel, PostAnalytics
-from database.models import ScheduledPost, PostViewSnapshot
+from database.models import PostViewSnapshot
+from services.metrics_cache import invalidate_metrics, TAG_ANALYTICS
+from services.rollups import rollup_refresher
+from services.ad_index import ad_message_index
+from services.rate_limiter import telegram_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +55,113 @@ async def refresh_channel_subscribers(bot: Bot, channel: Channel) -> Optional[in
         return None
 
 
+# Сколько последних записей PostAnalytics канала учитывается в avg_reach / ERR
+REACH_WINDOW = 20
+
+
+def _reach_update_statement(channel_ids: Optional[list[int]] = None, since: Optional[datetime] = None):
+    """UPDATE channels … FROM (оконный расчёт avg_reach / ERR) … RETURNING.
+
+    Для каждого канала берутся последние REACH_WINDOW записей с ненулевыми
+    просмотрами. ``channel_ids`` ограничивает пересчёт каналами, ``since`` —
+    каналами, у которых после этого момента появилась или изменилась аналитика.
+    """
+    engage = (
+        func.coalesce(PostAnalytics.reactions, 0) + func.coalesce(PostAnalytics.forwards, 0)
+        + func.coalesce(PostAnalytics.saves, 0) + func.coalesce(PostAnalytics.comments, 0)
+    )
+    ranked = select(
+        PostAnalytics.channel_id,
+        PostAnalytics.views,
+        engage.label("engage"),
+        func.row_number().over(
+            partition_by=PostAnalytics.channel_id,
+            order_by=PostAnalytics.recorded_at.desc(),
+        ).label("rn"),
+    ).where(PostAnalytics.views > 0)
+    if channel_ids is not None:
+        ranked = ranked.where(PostAnalytics.channel_id.in_(channel_ids))
+    if since is not None:
+        changed = aliased(PostAnalytics)
+        ranked = ranked.where(
+            PostAnalytics.channel_id.in_(select(changed.channel_id).where(changed.recorded_at > since))
+        )
+    ranked = ranked.subquery("ranked")
+
+    reach = (
+        select(
+            ranked.c.channel_id,
+            cast(func.floor(func.avg(ranked.c.views)), Integer).label("avg_reach"),
+            func.round(func.sum(ranked.c.engage) * literal(100, Numeric) / func.sum(ranked.c.views), 2).label("err"),
+            func.count().label("records"),
+        )
+        .where(ranked.c.rn <= REACH_WINDOW)
+        .group_by(ranked.c.channel_id)
+        .subquery("reach")
+    )
+    channels = Channel.__table__
+    return (
+        update(channels)
+        .where(channels.c.id == reach.c.channel_id)
+        .values(
+            avg_reach=reach.c.avg_reach,
+            # ERR24 = ERR: нет разбивки по периодам
+            avg_reach_24h=reach.c.avg_reach,
+            err_percent=reach.c.err,
+            err24_percent=reach.c.err,
+            analytics_updated=func.timezone("UTC", func.now()),
+        )
+        .returning(channels.c.id, reach.c.avg_reach, reach.c.err, reach.c.records)
+    )
+
+
+async def recompute_channel_reach(
+    channel_ids: Optional[list[int]] = None,
+    since: Optional[datetime] = None,
+) -> dict[int, dict]:
+    """Пересчитать avg_reach и ERR одним запросом; вернуть {channel_id: показатели}.
+
+    Без аргументов пересчитываются все каналы с аналитикой.
+    """
+    async with async_session_maker() as session:
+        rows = (await session.execute(_reach_update_statement(channel_ids, since))).all()
+        await session.commit()
+    return {
+        channel_id: {
+            "avg_reach": avg_reach,
+            "err_percent": float(err or 0),
+            "records_used": records,
+        }
+        for channel_id, avg_reach, err, records in rows
+    }
+
+
+class ReachRecomputer:
+    """Инкрементальный пересчёт охвата: только каналы с новой аналитикой."""
+
+    def __init__(self):
+        self.last_run: Optional[datetime] = None
+
+    async def run(self, incremental: bool = True) -> int:
+        """Пересчитать каналы; при ``incremental`` — изменившиеся с прошлого запуска."""
+        started = datetime.now(timezone.utc).replace(tzinfo=None)
+        since = self.last_run if incremental else None
+        try:
+            result = await recompute_channel_reach(since=since)
+        except Exception as e:
+            logger.error(f"Ошибка пересчёта reach/ERR каналов: {e}")
+            return 0
+        # Время начала: аналитика, записанная во время пересчёта, попадёт в следующий
+        self.last_run = started
+        if result:
+            logger.info(f"Пересчитан охват/ERR каналов: {len(result)}")
+        return len(result)
+
+
+# Глобальный экземпляр инкрементального пересчёта охвата
+reach_recomputer = ReachRecomputer()
+
+
 async def update_channel_reach_from_analytics(channel_id: int) -> dict:
     """
     Пересчитать avg_reach и ERR канала из накопленных данных PostAnalytics.
@@ -57,51 +174,15 @@ async def update_channel_reach_from_analytics(channel_id: int) -> dict:
       avg_reach, err_percent, records_used
     """
     try:
-        async with async_session_maker() as session:
-            channel = await session.get(Channel, channel_id)
-            if not channel:
-                return {}
-
-            # Берём последние 20 записей с ненулевыми просмотрами
-            rows = (await session.execute(
-                select(PostAnalytics.views, PostAnalytics.reactions,
-                       PostAnalytics.forwards, PostAnalytics.saves,
-                       PostAnalytics.comments)
-                .where(
-                    PostAnalytics.channel_id == channel_id,
-                    PostAnalytics.views > 0,
-                )
-                .order_by(PostAnalytics.recorded_at.desc())
-                .limit(20)
-            )).all()
-
-            if not rows:
-                return {"records_used": 0}
-
-            avg_views = sum(r.views for r in rows) / len(rows)
-            avg_engage = sum(
-                r.reactions + r.forwards + r.saves + r.comments for r in rows
-            ) / len(rows)
-            err = round(avg_engage / avg_views * 100, 2) if avg_views > 0 else 0
-            err24 = err  # используем как ERR24 (нет разбивки по периодам)
-
-            # Обновляем канал
-            channel.avg_reach = int(avg_views)
-            channel.avg_reach_24h = int(avg_views)
-            channel.err_percent = err
-            channel.err24_percent = err24
-            channel.analytics_updated = datetime.now(timezone.utc).replace(tzinfo=None)
-            await session.commit()
-
-            logger.info(
-                f"Канал {channel_id}: avg_reach={int(avg_views)}, ERR={err}% "
-                f"(по {len(rows)} постам)"
-            )
-            return {
-                "avg_reach": int(avg_views),
-                "err_percent": err,
-                "records_used": len(rows),
-            }
+        result = await recompute_channel_reach([channel_id])
+        data = result.get(channel_id)
+        if not data:
+            return {"records_used": 0}
+        logger.info(
+            f"Канал {channel_id}: avg_reach={data['avg_reach']}, ERR={data['err_percent']}% "
+            f"(по {data['records_used']} постам)"
+        )
+        return data
     except Exception as e:
         logger.error(f"Ошибка пересчёта reach/ERR для канала {channel_id}: {e}")
         return {}
@@ -127,6 +208,7 @@ async def refresh_channel_from_telemetr(channel: Channel) -> Optional[dict]:
         stats = await telemetr_service.get_full_stats(
             telegram_id=channel.telegram_id,
             username=channel.username,
+            internal_id=channel.telemetr_id,
         )
         if not stats:
             logger.info(f"Канал «{channel.name}»: не найден в Telemetr")
@@ -169,120 +251,371 @@ async def refresh_channel_from_telemetr(channel: Channel) -> Optional[dict]:
         return None
 
 
-async def record_post_views(
-    channel_tg_id: int,
-    message_id: int,
-    views: int,
-    reactions: int = 0,
-    forwards: int = 0,
-) -> bool:
+async def sync_all_channels_from_telemetr() -> dict:
     """
-    Сохранить/обновить просмотры поста, полученные из channel_post обновления.
+    Обновить аналитику всех активных каналов через Telemetr API (задача планировщика).
 
-    Ищет ScheduledPost по (channel_tg_id, message_id), затем создаёт
-    или обновляет запись PostAnalytics.
+    Сохранённый Channel.telemetr_id используется повторно, так что на канал
+    обычно уходит один запрос статистики. Запросы идут параллельно в пределах
+    лимитов TelemetrService, а все изменения записываются одним UPDATE в одной
+    транзакции; поля, которых нет в ответе Telemetr, не затираются.
 
-    Возвращает True, если запись была сохранена.
+    Возвращает отчёт о запуске:
+      channels, updated, not_found, requests (расход квоты), quota_hits, seconds
     """
+    from services.telemetr import telemetr_service
+
+    report = {"channels": 0, "updated": 0, "not_found": 0, "requests": 0, "quota_hits": 0, "seconds": 0.0}
+    if not telemetr_service.api_token:
+        return report
+    if telemetr_service.quota_blocked_for() > 0:
+        logger.info("Синхронизация с Telemetr пропущена: квота исчерпана")
+        return report
+
+    started = time.monotonic()
+    requests_before = telemetr_service.requests_made
+    quota_hits_before = telemetr_service.quota_hits
     try:
         async with async_session_maker() as session:
-            # Найти ScheduledPost
-            channel_row = (await session.execute(
-                select(Channel).where(Channel.telegram_id == channel_tg_id)
-            )).scalar_one_or_none()
-
-            if not channel_row:
-                return False
-
-            post = (await session.execute(
-                select(ScheduledPost).where(
-                    ScheduledPost.channel_id == channel_row.id,
-                    ScheduledPost.message_id == message_id,
-                    ScheduledPost.status.in_(["posted", "deleted"]),
-                )
-            )).scalar_one_or_none()
+            channels = (await session.execute(
+                select(Channel.id, Channel.telegram_id, Channel.username, Channel.telemetr_id)
+                .where(Channel.is_active == True)
+            )).all()
+        report["channels"] = len(channels)
 
-            if not post:
-                return False
+        semaphore = asyncio.Semaphore(TELEMETR_MAX_CONNECTIONS)
 
-            # Найти или создать запись PostAnalytics
-            analytics = (await session.execute(
-                select(PostAnalytics).where(
-                    PostAnalytics.scheduled_post_id == post.id
-                )
-            )).scalar_one_or_none()
-
-            if analytics:
-                # Обновляем только если новое значение больше
-                if views > analytics.views:
-                    analytics.views = views
-                    analytics.reactions = max(reactions, analytics.reactions)
-                    analytics.forwards = max(forwards, analytics.forwards)
-                    analytics.recorded_at = datetime.now(timezone.utc).replace(tzinfo=None)
-            else:
-                analytics = PostAnalytics(
-                    scheduled_post_id=post.id,
-                    order_id=post.order_id,
-                    channel_id=channel_row.id,
-                    views=views,
-                    reactions=reactions,
-                    forwards=forwards,
-                    recorded_at=datetime.now(timezone.utc).replace(tzinfo=None),
+        async def fetch(channel):
+            async with semaphore:
+                return await telemetr_service.get_full_stats(
+                    telegram_id=channel.telegram_id,
+                    username=channel.username,
+                    internal_id=channel.telemetr_id,
                 )
-                session.add(analytics)
-
-            # Сохраняем снимок просмотров для построения динамики.
-            # Ограничиваем частоту: не чаще одного снимка в 30 минут на пост.
-            now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
-            throttle_after = now_utc - timedelta(minutes=30)
-            last_snapshot = (await session.execute(
-                select(PostViewSnapshot)
-                .where(PostViewSnapshot.scheduled_post_id == post.id)
-                .order_by(PostViewSnapshot.recorded_at.desc())
-                .limit(1)
-            )).scalar_one_or_none()
-
-            if last_snapshot is None or last_snapshot.recorded_at < throttle_after:
-                snapshot = PostViewSnapshot(
-                    scheduled_post_id=post.id,
-                    channel_id=channel_row.id,
-                    views=views,
-                    reactions=reactions,
-                    forwards=forwards,
-                    recorded_at=now_utc,
-                )
-                session.add(snapshot)
 
-            await session.commit()
-            logger.debug(
-                f"Просмотры поста #{post.id} (msg {message_id}): {views}"
-            )
-            return True
+        results = await asyncio.gather(*(fetch(ch) for ch in channels))
+
+        rows = []
+        for channel, stats in zip(channels, results):
+            if not stats:
+                report["not_found"] += 1
+                continue
+            rows.append((
+                channel.id,
+                str(stats["internal_id"]) if stats.get("internal_id") else None,
+                int(stats.get("subscribers") or 0),
+                int(stats.get("avg_views_24h") or 0),
+                int(stats.get("avg_views_48h") or 0),
+                int(stats.get("avg_views") or 0),
+                float(stats.get("err_percent") or 0),
+                float(stats.get("err24_percent") or 0),
+            ))
+
+        if rows:
+            incoming = values(
+                column("id", Integer),
+                column("telemetr_id", String(20)),
+                column("subscribers", Integer),
+                column("avg_24h", Integer),
+                column("avg_48h", Integer),
+                column("avg_all", Integer),
+                column("err", Numeric(5, 2)),
+                column("err24", Numeric(5, 2)),
+                name="telemetr",
+            ).data(rows)
+
+            def keep_if_zero(new, current):
+                # 0 / NULL в ответе Telemetr — нет данных, оставляем прежнее значение
+                return func.coalesce(func.nullif(new, 0), current)
+
+            async with async_session_maker() as session:
+                await session.execute(
+                    update(Channel)
+                    .where(Channel.id == incoming.c.id)
+                    .values(
+                        telemetr_id=func.coalesce(incoming.c.telemetr_id, Channel.telemetr_id),
+                        subscribers=keep_if_zero(incoming.c.subscribers, Channel.subscribers),
+                        avg_reach_24h=keep_if_zero(incoming.c.avg_24h, Channel.avg_reach_24h),
+                        avg_reach_48h=keep_if_zero(incoming.c.avg_48h, Channel.avg_reach_48h),
+                        avg_reach=keep_if_zero(incoming.c.avg_all, Channel.avg_reach),
+                        err_percent=keep_if_zero(incoming.c.err, Channel.err_percent),
+                        err24_percent=keep_if_zero(incoming.c.err24, Channel.err24_percent),
+                        analytics_updated=datetime.now(timezone.utc).replace(tzinfo=None),
+                    )
+                )
+                await session.commit()
+        report["updated"] = len(rows)
     except Exception as e:
-        logger.error(f"Ошибка record_post_views (msg={message_id}): {e}")
-        return False
+        logger.error(f"Ошибка синхронизации каналов с Telemetr: {e}")
+    finally:
+        report["requests"] = telemetr_service.requests_made - requests_before
+        report["quota_hits"] = telemetr_service.quota_hits - quota_hits_before
+        report["seconds"] = round(time.monotonic() - started, 2)
+
+    logger.info(
+        f"Синхронизация с Telemetr: обновлено {report['updated']}/{report['channels']}, "
+        f"не найдено {report['not_found']}, запросов {report['requests']}, "
+        f"426: {report['quota_hits']}, {report['seconds']} с"
+    )
+    return report
+
+
+# Не чаще одного снимка просмотров в это время на пост
+SNAPSHOT_INTERVAL = timedelta(minutes=30)
+# Предел размера кэша времени последних снимков
+MAX_SNAPSHOT_CACHE = 10_000
+
+
+def _upsert_analytics(incoming, now: datetime):
+    """INSERT … SELECT FROM VALUES … ON CONFLICT (scheduled_post_id) DO UPDATE."""
+    stmt = pg_insert(PostAnalytics).from_select(
+        ["scheduled_post_id", "channel_id", "order_id", "views",
+         "reactions", "forwards", "recorded_at"],
+        select(
+            # VALUES из одних NULL Postgres типизирует как text
+            incoming.c.post_id, incoming.c.channel_id, cast(incoming.c.order_id, Integer),
+            incoming.c.views, incoming.c.reactions, incoming.c.forwards,
+            literal(now),
+        ),
+    )
+    current = PostAnalytics.__table__.c
+    return stmt.on_conflict_do_update(
+        index_elements=[PostAnalytics.scheduled_post_id],
+        set_={
+            "views": func.greatest(current.views, stmt.excluded.views),
+            "reactions": func.greatest(current.reactions, stmt.excluded.reactions),
+            "forwards": func.greatest(current.forwards, stmt.excluded.forwards),
+            "recorded_at": stmt.excluded.recorded_at,
+        },
+        # Не трогаем строку, если ни один счётчик не вырос
+        where=or_(
+            stmt.excluded.views > current.views,
+            stmt.excluded.reactions > current.reactions,
+            stmt.excluded.forwards > current.forwards,
+        ),
+    )
+
+
+class PostViewBuffer:
+    """Буфер просмотров постов с отложенной пакетной записью в БД.
+
+    Обновления channel_post / edited_channel_post приходят непрерывно — по
+    несколько на каждый пост. ``add()`` отбрасывает нерекламные посты по
+    ad_message_index и лишь обновляет максимум просмотров, реакций и
+    пересылок в памяти по ключу (chat_id, message_id); раз в
+    VIEW_FLUSH_SECONDS ``flush()`` записывает накопленное несколькими
+    пакетными запросами, так что число записей в БД растёт с числом постов,
+    а не обновлений.
+    """
+
+    def __init__(self, flush_interval: float = VIEW_FLUSH_SECONDS):
+        self.flush_interval = flush_interval
+        # (chat_id, message_id) -> [views, reactions, forwards]
+        self._pending: dict[tuple[int, int], list[int]] = {}
+        # post_id -> время последнего снимка просмотров
+        self._last_snapshot: dict[int, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, chat_id: int, message_id: int, views: int, reactions: int = 0, forwards: int = 0) -> bool:
+        """Учесть обновление просмотров поста (без обращения к БД).
+
+        Возвращает False, если сообщение не является опубликованным
+        рекламным постом (обновление отброшено).
+        """
+        if ad_message_index.lookup(chat_id, message_id) is None:
+            return False
+        key = (chat_id, message_id)
+        current = self._pending.get(key)
+        if current is None:
+            self._pending[key] = [views, reactions, forwards]
+        else:
+            current[0] = max(current[0], views)
+            current[1] = max(current[1], reactions)
+            current[2] = max(current[2], forwards)
+        return True
+
+    # ─── Запись в БД ─────────────────────────────────────────────────────────
+
+    async def _snapshot_due(self, session, post_ids: list[int], now: datetime) -> set[int]:
+        """Посты, для которых пора сохранить снимок просмотров."""
+        unseen = [pid for pid in post_ids if pid not in self._last_snapshot]
+        if unseen:
+            rows = (await session.execute(
+                select(PostViewSnapshot.scheduled_post_id, func.max(PostViewSnapshot.recorded_at))
+                .where(PostViewSnapshot.scheduled_post_id.in_(unseen))
+                .group_by(PostViewSnapshot.scheduled_post_id)
+            )).all()
+            if len(self._last_snapshot) > MAX_SNAPSHOT_CACHE:
+                self._last_snapshot.clear()
+            for post_id, recorded_at in rows:
+                self._last_snapshot[post_id] = recorded_at
+        throttle_after = now - SNAPSHOT_INTERVAL
+        return {
+            pid for pid in post_ids
+            if self._last_snapshot.get(pid) is None or self._last_snapshot[pid] < throttle_after
+        }
+
+    async def flush(self) -> int:
+        """Записать накопленные просмотры; вернуть число обновлённых постов."""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+        # Пост мог быть удалён из канала, пока значения копились в буфере
+        resolved = {}
+        for key in pending:
+            post = ad_message_index.lookup(*key)
+            if post is not None:
+                resolved[key] = post
+        if not resolved:
+            return 0
+
+        rows = []
+        for key, post in resolved.items():
+            views, reactions, forwards = pending[key]
+            rows.append((post.post_id, post.channel_id, post.order_id, views, reactions, forwards))
+
+        try:
+            async with async_session_maker() as session:
+                incoming = values(
+                    column("post_id", Integer),
+                    column("channel_id", Integer),
+                    column("order_id", Integer),
+                    column("views", Integer),
+                    column("reactions", Integer),
+                    column("forwards", Integer),
+                    name="incoming",
+                ).data(rows)
+
+                # Один upsert на все посты: уникальный индекс по scheduled_post_id
+                # исключает дубликаты, счётчики только растут (GREATEST)
+                await session.execute(_upsert_analytics(incoming, now))
+
+                # Снимки для построения динамики (не чаще SNAPSHOT_INTERVAL на пост)
+                due = await self._snapshot_due(session, [r[0] for r in rows], now)
+                snapshots = [
+                    {
+                        "scheduled_post_id": post_id,
+                        "channel_id": channel_id,
+                        "views": views,
+                        "reactions": reactions,
+                        "forwards": forwards,
+                        "recorded_at": now,
+                    }
+                    for post_id, channel_id, _, views, reactions, forwards in rows
+                    if post_id in due
+                ]
+                if snapshots:
+                    await session.execute(insert(PostViewSnapshot), snapshots)
+
+                await session.commit()
+        except Exception:
+            # Вернём данные в буфер, не затирая более свежие значения
+            for key, (views, reactions, forwards) in pending.items():
+                self.add(key[0], key[1], views, reactions, forwards)
+            raise
+
+        for post_id in due:
+            self._last_snapshot[post_id] = now
+        invalidate_metrics(TAG_ANALYTICS)
+        for post in resolved.values():
+            rollup_refresher.mark_post(post.posted_at)
+        logger.debug(f"Просмотры записаны: постов {len(rows)}, снимков {len(snapshots)}")
+        return len(rows)
+
+    # ─── Жизненный цикл ──────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        """Запустить периодическую запись буфера."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить фоновую задачу и записать остаток буфера."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Ошибка записи просмотров при остановке: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка пакетной записи просмотров: {e}")
+
+
+# Глобальный буфер просмотров постов
+post_view_buffer = PostViewBuffer()
+
+
+async def _fetch_subscribers(bot: Bot, channel, semaphore: asyncio.Semaphore) -> Optional[int]:
+    """Число подписчиков канала через Bot API (None — нет доступа или ошибка)."""
+    async with semaphore:
+        for attempt in range(2):
+            await telegram_rate_limiter.acquire_global()
+            try:
+                return await bot.get_chat_member_count(channel.telegram_id)
+            except TelegramRetryAfter as e:
+                if attempt:
+                    break
+                await asyncio.sleep(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                logger.warning(f"Канал «{channel.name}»: нет доступа — {e}")
+                return None
+            except Exception as e:
+                logger.error(f"Ошибка получения подписчиков канала {channel.id}: {e}")
+                return None
+    logger.warning(f"Канал «{channel.name}»: подписчики не получены из-за лимита Telegram")
+    return None
 
 
 async def refresh_all_channels(bot: Bot) -> int:
     """
     Обновить подписчиков и пересчитать ERR/охват для всех активных каналов.
 
-    Используется планировщиком для периодического обновления.
+    Используется планировщиком для периодического обновления. Запросы к Bot API
+    идут параллельно (не больше CHANNEL_REFRESH_CONCURRENCY одновременно, в
+    пределах общего лимита бота), подписчики записываются одним UPDATE, а
+    охват и ERR всех каналов пересчитываются одним запросом.
     Возвращает количество успешно обновлённых каналов.
     """
     updated = 0
     try:
         async with async_session_maker() as session:
             channels = (await session.execute(
-                select(Channel).where(Channel.is_active == True)
-            )).scalars().all()
-
-        for channel in channels:
-            count = await refresh_channel_subscribers(bot, channel)
-            if count is not None:
-                updated += 1
-            # Пересчитываем avg_reach и ERR из накопленных PostAnalytics
-            await update_channel_reach_from_analytics(channel.id)
+                select(Channel.id, Channel.telegram_id, Channel.name).where(Channel.is_active == True)
+            )).all()
+
+        semaphore = asyncio.Semaphore(CHANNEL_REFRESH_CONCURRENCY)
+        counts = await asyncio.gather(*(_fetch_subscribers(bot, ch, semaphore) for ch in channels))
+        fresh = [(ch.id, count) for ch, count in zip(channels, counts) if count is not None]
+        updated = len(fresh)
+
+        if fresh:
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            incoming = values(
+                column("id", Integer), column("subscribers", Integer), name="fresh",
+            ).data(fresh)
+            async with async_session_maker() as session:
+                await session.execute(
+                    update(Channel)
+                    .where(Channel.id == incoming.c.id)
+                    .values(subscribers=incoming.c.subscribers, analytics_updated=now)
+                )
+                await session.commit()
+
+        # Полный пересчёт avg_reach и ERR из накопленных PostAnalytics
+        await reach_recomputer.run(incremental=False)
 
         logger.info(f"Плановое обновление каналов: {updated}/{len(channels)} обновлено")
     except Exception as e:
@@ -4,15 +4,25 @@
 Публикует содержимое запланированных постов в чат Max после
 успешной публикации в Telegram-канале. Поддерживает лимит
 количества кросспостов в сутки (настраивается через admin-панель).
+
+Публикация в Telegram не ждёт Max: enqueue_crosspost добавляет запись в
+crosspost_outbox в той же транзакции, а отправляет её фоновый обработчик
+services/crosspost_outbox.py.
+
+Проверки на пути публикации не обращаются к БД: настройки берутся из
+settings_cache, а счётчик кросспостов за сегодня хранит crosspost_governor —
+он считывается из БД один раз за UTC-сутки и дальше ведётся в памяти.
 """
+import asyncio
 import logging
-import traceback
 from datetime import date
-from typing import Optional
+from typing import Callable, NamedTuple, Optional
 
 from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import async_session_maker, ScheduledPost
+from database import async_session_maker, CrosspostOutbox, ScheduledPost
 from services.settings import (
     get_setting,
     CROSSPOST_ENABLED_KEY,
@@ -66,52 +76,82 @@ async def get_daily_crosspost_count() -> int:
 
     Граница суток определяется по UTC: с 00:00:00 до 23:59:59 текущей UTC-даты.
     Все временны́е метки в БД хранятся в UTC, поэтому подсчёт корректен.
+    Ошибки БД пробрасываются: подставленный 0 снял бы дневной лимит.
     """
     today_start = utc_now().replace(hour=0, minute=0, second=0, microsecond=0)
     today_end = today_start.replace(hour=23, minute=59, second=59, microsecond=999999)
-    try:
-        async with async_session_maker() as session:
-            result = await session.execute(
-                select(func.count(ScheduledPost.id)).where(
-                    ScheduledPost.max_posted_at >= today_start,
-                    ScheduledPost.max_posted_at <= today_end,
-                )
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(func.count(ScheduledPost.id)).where(
+                ScheduledPost.max_posted_at >= today_start,
+                ScheduledPost.max_posted_at <= today_end,
             )
-            return result.scalar_one() or 0
-    except Exception as e:
-        logger.error(f"Ошибка подсчёта кросспостов за сегодня: {e}")
-        return 0
+        )
+        return result.scalar_one() or 0
+
 
+class CrosspostConfig(NamedTuple):
+    """Снимок настроек кросспостинга."""
+    enabled: bool
+    daily_limit: int
+    chat_id: Optional[int]
 
-async def can_crosspost_today() -> bool:
-    """Вернуть True, если дневной лимит кросспостов ещё не исчерпан."""
-    limit = await get_crosspost_daily_limit()
-    if limit == 0:
-        return True  # 0 = без ограничений
-    count = await get_daily_crosspost_count()
-    return count < limit
 
+async def get_crosspost_config() -> CrosspostConfig:
+    """Прочитать все настройки кросспостинга (из кэша настроек, без запросов к БД)."""
+    return CrosspostConfig(
+        enabled=await is_crosspost_enabled(),
+        daily_limit=await get_crosspost_daily_limit(),
+        chat_id=await get_max_crosspost_chat_id(),
+    )
 
-async def crosspost_post_to_max(post: ScheduledPost, max_bot) -> bool:
-    """Отправить пост в чат Max.
 
-    Возвращает True при успехе, False при ошибке или если условия не выполнены.
-    Обновляет поля max_post_id и max_posted_at в переданном объекте поста
-    (изменения должны быть зафиксированы в БД вызывающим кодом).
+class CrosspostGovernor:
+    """Счётчик кросспостов за текущие UTC-сутки в памяти.
+
+    В начале суток (и при первом обращении после старта) значение один раз
+    считывается из БД, затем увеличивается при каждом кросспосте. Если чтение
+    не удалось, ошибка пробрасывается и следующее обращение повторяет его. Место под
+    кросспост резервируется до отправки, чтобы параллельные публикации
+    в разных каналах не превысили лимит; при ошибке отправки оно освобождается.
     """
-    if not await is_crosspost_enabled():
-        return False
 
-    if not await can_crosspost_today():
-        logger.info(f"Дневной лимит кросспостов исчерпан — пост #{post.id} не будет скопирован в Max")
-        return False
+    def __init__(self, today: Callable[[], date] = lambda: utc_now().date()):
+        self._today = today
+        self._day: Optional[date] = None
+        self._count = 0
+        self._lock = asyncio.Lock()
+
+    async def count_today(self) -> int:
+        """Количество кросспостов за сегодня."""
+        today = self._today()
+        if self._day != today:
+            async with self._lock:
+                if self._day != today:
+                    self._count = await get_daily_crosspost_count()
+                    self._day = today
+        return self._count
+
+    async def try_acquire(self, limit: int) -> bool:
+        """Зарезервировать кросспост, если лимит (0 = без ограничений) не исчерпан."""
+        count = await self.count_today()
+        if limit and count >= limit:
+            return False
+        self._count += 1
+        return True
+
+    def release(self) -> None:
+        """Вернуть резерв после неудачной отправки."""
+        if self._day == self._today() and self._count > 0:
+            self._count -= 1
+
+
+# Глобальный счётчик кросспостов
+crosspost_governor = CrosspostGovernor()
 
-    chat_id = await get_max_crosspost_chat_id()
-    if not chat_id:
-        logger.warning("MAX_CROSSPOST_CHAT_ID не задан — кросспост невозможен")
-        return False
 
-    # Формируем текст для Max (без HTML-тегов, Max поддерживает только markdown)
+def build_crosspost_text(post: ScheduledPost) -> str:
+    """Текст поста для Max: содержимое и подпись (без HTML, Max поддерживает только markdown)."""
     text = post.content or ""
     if post.signature:
         if " | " in post.signature:
@@ -124,21 +164,39 @@ async def crosspost_post_to_max(post: ScheduledPost, max_bot) -> bool:
                 text = f"{text}\n\n{post.signature}" if text else post.signature
         else:
             text = f"{text}\n\n{post.signature}" if text else post.signature
+    return text
 
+
+async def send_to_max(max_bot, chat_id: int, text: str) -> str:
+    """Отправить сообщение в чат Max и вернуть ID сообщения (ошибки пробрасываются)."""
+    sent = await max_bot.send_message(chat_id=chat_id, text=text)
+    raw_id = getattr(sent, "message_id", None) or getattr(sent, "id", None)
+    if raw_id is None:
+        logger.warning(f"Max API не вернул ID сообщения (chat_id={chat_id}) — запись без ID")
+    return str(raw_id) if raw_id is not None else "unknown"
+
+
+async def enqueue_crosspost(session: AsyncSession, post: ScheduledPost) -> bool:
+    """Поставить кросспост поста в очередь crosspost_outbox.
+
+    Запись выполняется в переданной сессии и фиксируется вызывающим кодом
+    вместе с публикацией поста. Ошибка записи откатывает только SAVEPOINT и
+    не мешает зафиксировать публикацию. Возвращает True, если пост поставлен в очередь.
+    """
+    if not await is_crosspost_enabled():
+        return False
+
+    text = build_crosspost_text(post)
     if not text:
-        # Пост состоит только из медиафайла без текста — пропускаем, Max не поддерживает Telegram file_id
+        # Пост состоит только из медиафайла без текста — Max не поддерживает Telegram file_id
         logger.info(f"Пост #{post.id} содержит только медиа без текста — кросспост пропущен")
         return False
 
-    try:
-        sent = await max_bot.send_message(chat_id=chat_id, text=text)
-        raw_id = getattr(sent, "message_id", None) or getattr(sent, "id", None)
-        if raw_id is None:
-            logger.warning(f"Пост #{post.id}: Max API не вернул ID сообщения — запись без ID")
-        post.max_post_id = str(raw_id) if raw_id is not None else "unknown"
-        post.max_posted_at = utc_now()
-        logger.info(f"Пост #{post.id} скопирован в Max (chat_id={chat_id})")
-        return True
-    except Exception:
-        logger.error(f"Ошибка кросспостинга поста #{post.id} в Max: {traceback.format_exc()}")
-        return False
+    async with session.begin_nested():
+        await session.execute(
+            pg_insert(CrosspostOutbox)
+            .values(scheduled_post_id=post.id, text=text, next_attempt_at=utc_now())
+            .on_conflict_do_nothing(index_elements=[CrosspostOutbox.scheduled_post_id])
+        )
+    return True
+
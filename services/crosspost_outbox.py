@@ -0,0 +1,265 @@
+"""
+Фоновая отправка кросспостов в сеть Max из таблицы crosspost_outbox.
+
+Публикация в Telegram только добавляет строку в очередь (enqueue_crosspost)
+в той же транзакции, что и статус «опубликован», — медленный или недоступный
+Max API не задерживает ни коммит, ни публикацию в следующих каналах.
+
+Обработчик:
+ - забирает до CROSSPOST_OUTBOX_BATCH готовых записей одним UPDATE … RETURNING
+   (FOR UPDATE SKIP LOCKED — несколько экземпляров бота не берут одну запись);
+ - отправляет их параллельно, не больше CROSSPOST_OUTBOX_CONCURRENCY сразу,
+   соблюдая дневной лимит (crosspost_governor);
+ - фиксирует результаты пакета двумя UPDATE … FROM VALUES;
+ - при сбое повторяет отправку с удвоением задержки, после
+   CROSSPOST_MAX_ATTEMPTS попыток помечает запись как failed.
+"""
+import asyncio
+import logging
+import traceback
+from datetime import timedelta
+from typing import Callable, NamedTuple, Optional
+
+from sqlalchemy import Integer, String, DateTime, Text, cast, column, select, update, values
+
+from config import (
+    CROSSPOST_OUTBOX_BATCH, CROSSPOST_OUTBOX_CONCURRENCY, CROSSPOST_OUTBOX_POLL_SECONDS,
+    CROSSPOST_MAX_ATTEMPTS, CROSSPOST_RETRY_BASE_SECONDS,
+)
+from database import async_session_maker, CrosspostOutbox, ScheduledPost
+from services.crosspost import crosspost_governor, get_crosspost_config, send_to_max
+from services.notifications import notification_dispatcher
+from utils.helpers import utc_now
+
+logger = logging.getLogger(__name__)
+
+# На сколько секунд запись закрепляется за обработчиком, забравшим её;
+# если экземпляр упадёт во время отправки, запись вернётся в очередь
+CLAIM_LEASE_SECONDS = 300
+
+
+class OutboxItem(NamedTuple):
+    id: int
+    scheduled_post_id: int
+    text: str
+    attempts: int
+
+
+class OutboxResult(NamedTuple):
+    """Итог обработки записи: новый статус и, при успехе, ID сообщения в Max."""
+    item: OutboxItem
+    status: str
+    max_post_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+def retry_delay(attempts: int, base: float = CROSSPOST_RETRY_BASE_SECONDS) -> float:
+    """Задержка перед следующей попыткой после ``attempts`` неудачных."""
+    return base * (2 ** max(0, attempts - 1))
+
+
+def _claim_statement(now, batch_size: int):
+    due = (
+        select(CrosspostOutbox.id)
+        .where(CrosspostOutbox.status == "pending", CrosspostOutbox.next_attempt_at <= now)
+        .order_by(CrosspostOutbox.next_attempt_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    return (
+        update(CrosspostOutbox)
+        .where(CrosspostOutbox.id.in_(due))
+        .values(
+            attempts=CrosspostOutbox.attempts + 1,
+            next_attempt_at=now + timedelta(seconds=CLAIM_LEASE_SECONDS),
+        )
+        .returning(
+            CrosspostOutbox.id, CrosspostOutbox.scheduled_post_id,
+            CrosspostOutbox.text, CrosspostOutbox.attempts,
+        )
+    )
+
+
+def _results_statement(rows: list[tuple]):
+    """UPDATE crosspost_outbox по строкам (id, status, next_attempt_at, last_error, sent_at)."""
+    outcome = values(
+        column("id", Integer),
+        column("status", String),
+        column("next_attempt_at", DateTime),
+        column("last_error", Text),
+        column("sent_at", DateTime),
+        name="outcome",
+    ).data(rows)
+    return (
+        update(CrosspostOutbox)
+        .where(CrosspostOutbox.id == outcome.c.id)
+        .values(
+            status=outcome.c.status,
+            next_attempt_at=outcome.c.next_attempt_at,
+            # NULL в VALUES без приведения типа Postgres считает текстом
+            last_error=cast(outcome.c.last_error, Text),
+            sent_at=cast(outcome.c.sent_at, DateTime),
+        )
+    )
+
+
+def _posts_statement(rows: list[tuple], now):
+    """UPDATE scheduled_posts: ID сообщения в Max по строкам (scheduled_post_id, max_post_id)."""
+    sent = values(
+        column("id", Integer),
+        column("max_post_id", String),
+        name="sent",
+    ).data(rows)
+    return (
+        update(ScheduledPost)
+        .where(ScheduledPost.id == sent.c.id)
+        .values(max_post_id=sent.c.max_post_id, max_posted_at=now)
+    )
+
+
+class CrosspostOutboxWorker:
+    """Фоновая задача отправки очереди crosspost_outbox."""
+
+    def __init__(
+        self,
+        batch_size: int = CROSSPOST_OUTBOX_BATCH,
+        concurrency: int = CROSSPOST_OUTBOX_CONCURRENCY,
+        poll_seconds: float = CROSSPOST_OUTBOX_POLL_SECONDS,
+        max_attempts: int = CROSSPOST_MAX_ATTEMPTS,
+    ):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self._get_bot: Callable[[], object] = lambda: None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # ─── Жизненный цикл ──────────────────────────────────────────────────────
+
+    def start(self, get_bot: Callable[[], object]) -> None:
+        """Запустить обработку; ``get_bot`` возвращает текущий Max-бот или None."""
+        self._get_bot = get_bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self) -> None:
+        """Разбудить обработчик: в очередь добавлены записи."""
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                processed = await self.process_batch()
+            except Exception:
+                logger.error(f"Ошибка обработки очереди кросспостов: {traceback.format_exc()}")
+                processed = 0
+            if processed >= self.batch_size:
+                continue  # в очереди, скорее всего, есть ещё записи
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    # ─── Обработка ───────────────────────────────────────────────────────────
+
+    async def process_batch(self) -> int:
+        """Обработать один пакет записей; вернуть их количество."""
+        max_bot = self._get_bot()
+        if max_bot is None:
+            return 0  # Max-бот ещё не запущен — записи подождут
+        # Счётчик за сутки читается до захвата: если БД недоступна,
+        # записи остаются в очереди до следующего прохода
+        await crosspost_governor.count_today()
+
+        now = utc_now()
+        async with async_session_maker() as session:
+            result = await session.execute(_claim_statement(now, self.batch_size))
+            items = [OutboxItem(*row) for row in result.all()]
+            await session.commit()
+        if not items:
+            return 0
+
+        results = await self._deliver(max_bot, items)
+        await self._save(results)
+        return len(items)
+
+    async def _deliver(self, max_bot, items: list[OutboxItem]) -> list[OutboxResult]:
+        config = await get_crosspost_config()
+        if not config.enabled:
+            return [OutboxResult(item, "skipped", error="кросспостинг выключен") for item in items]
+        if not config.chat_id:
+            logger.warning("MAX_CROSSPOST_CHAT_ID не задан — кросспост невозможен")
+            return [OutboxResult(item, "skipped", error="не задан чат Max") for item in items]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def deliver_one(item: OutboxItem) -> OutboxResult:
+            if not await crosspost_governor.try_acquire(config.daily_limit):
+                logger.info(
+                    f"Дневной лимит кросспостов исчерпан — пост #{item.scheduled_post_id} "
+                    f"не будет скопирован в Max"
+                )
+                return OutboxResult(item, "skipped", error="дневной лимит")
+            try:
+                async with semaphore:
+                    max_post_id = await send_to_max(max_bot, config.chat_id, item.text)
+            except Exception as e:
+                crosspost_governor.release()
+                logger.warning(
+                    f"Кросспост поста #{item.scheduled_post_id} в Max не отправлен "
+                    f"(попытка {item.attempts}): {e}"
+                )
+                return OutboxResult(item, "retry", error=str(e)[:1000])
+            logger.info(f"Пост #{item.scheduled_post_id} скопирован в Max (chat_id={config.chat_id})")
+            return OutboxResult(item, "sent", max_post_id=max_post_id)
+
+        return list(await asyncio.gather(*(deliver_one(item) for item in items)))
+
+    async def _save(self, results: list[OutboxResult]) -> None:
+        now = utc_now()
+        rows = []
+        sent = []
+        failed = []
+        for r in results:
+            if r.status == "sent":
+                rows.append((r.item.id, "sent", now, None, now))
+                sent.append((r.item.scheduled_post_id, r.max_post_id))
+            elif r.status == "retry" and r.item.attempts < self.max_attempts:
+                retry_at = now + timedelta(seconds=retry_delay(r.item.attempts))
+                rows.append((r.item.id, "pending", retry_at, r.error, None))
+            elif r.status == "retry":
+                rows.append((r.item.id, "failed", now, r.error, None))
+                failed.append(r.item.scheduled_post_id)
+            else:
+                rows.append((r.item.id, r.status, now, r.error, None))
+
+        async with async_session_maker() as session:
+            await session.execute(_results_statement(rows))
+            if sent:
+                await session.execute(_posts_statement(sent, now))
+            await session.commit()
+
+        for post_id in failed:
+            logger.error(f"Кросспост поста #{post_id} в Max не отправлен за {self.max_attempts} попыток")
+            notification_dispatcher.notify_admins(
+                f"⚠️ Пост #{post_id} не скопирован в Max за {self.max_attempts} попыток.",
+                digest_key="crosspost_failed",
+                digest_title="⚠️ Не скопировано в Max постов: {count}",
+                digest_line=f"• пост #{post_id}",
+            )
+
+
+# Глобальный обработчик очереди кросспостов
+crosspost_outbox = CrosspostOutboxWorker()
@@ -16,7 +16,8 @@ from config import (
 )
 from database import (
     async_session_maker, Channel, Manager, Order, ScheduledPost, Client,
-    PostAnalytics, Slot, CategoryCPM, Competition, PromoCode,
+    PostAnalytics, Slot, CategoryCPM, Competition, PromoCode, DailyOrderStats,
+    get_pool_stats,
 )
 
 
@@ -31,6 +32,7 @@ async def run_diagnostics() -> dict:
       - claude: (icon, message)
       - telemetr: (icon, message)
       - queue: dict с pending_posts / overdue_posts / pending_payments  или None при ошибке
+      - db_pool: dict со статистикой пула соединений (см. get_pool_stats)
     """
     results = {}
 
@@ -135,6 +137,9 @@ async def run_diagnostics() -> dict:
         logger.error(f"Diagnostics queue check error: {e}")
         results["queue"] = None
 
+    # 5. Пул соединений с БД
+    results["db_pool"] = get_pool_stats()
+
     return results
 
 
@@ -499,46 +504,34 @@ async def _check_section_booking() -> tuple[str, str]:
 
 async def gather_business_metrics() -> dict:
     """Собрать бизнес-метрики для AI-анализа."""
-    now = datetime.now(timezone.utc).replace(tzinfo=None)
-    month_ago = now - timedelta(days=30)
-    prev_month_start = now - timedelta(days=60)
-    week_ago = now - timedelta(days=7)
+    today = datetime.now(timezone.utc).date()
+    month_ago = today - timedelta(days=30)
+    prev_month_start = today - timedelta(days=60)
+    week_ago = today - timedelta(days=7)
 
     metrics: dict = {}
     try:
         async with async_session_maker() as session:
-            # Выручка
-            revenue_month = float((await session.execute(
-                select(func.sum(Order.final_price)).where(
-                    Order.status == "payment_confirmed",
-                    Order.paid_at >= month_ago,
-                )
-            )).scalar() or 0)
-
-            revenue_prev_month = float((await session.execute(
-                select(func.sum(Order.final_price)).where(
-                    Order.status == "payment_confirmed",
-                    Order.paid_at >= prev_month_start,
-                    Order.paid_at < month_ago,
+            # Выручка и заказы — по дневной сводке (daily_order_stats)
+            d = DailyOrderStats
+            orders_row = (await session.execute(
+                select(
+                    func.sum(d.revenue).filter(d.day >= month_ago).label("revenue_month"),
+                    func.sum(d.revenue).filter(
+                        d.day >= prev_month_start, d.day < month_ago,
+                    ).label("revenue_prev_month"),
+                    func.sum(d.orders_created).label("total_orders"),
+                    func.sum(d.orders_confirmed).label("confirmed_orders"),
+                    func.sum(d.orders_cancelled).label("cancelled_orders"),
+                    func.sum(d.orders_created).filter(d.day >= week_ago).label("orders_week"),
                 )
-            )).scalar() or 0)
-
-            # Заказы
-            total_orders = (await session.execute(
-                select(func.count(Order.id))
-            )).scalar() or 0
-
-            confirmed_orders = (await session.execute(
-                select(func.count(Order.id)).where(Order.status == "payment_confirmed")
-            )).scalar() or 0
-
-            cancelled_orders = (await session.execute(
-                select(func.count(Order.id)).where(Order.status == "cancelled")
-            )).scalar() or 0
-
-            orders_week = (await session.execute(
-                select(func.count(Order.id)).where(Order.created_at >= week_ago)
-            )).scalar() or 0
+            )).one()
+            revenue_month = float(orders_row.revenue_month or 0)
+            revenue_prev_month = float(orders_row.revenue_prev_month or 0)
+            total_orders = int(orders_row.total_orders or 0)
+            confirmed_orders = int(orders_row.confirmed_orders or 0)
+            cancelled_orders = int(orders_row.cancelled_orders or 0)
+            orders_week = int(orders_row.orders_week or 0)
 
             # Каналы
             total_channels = (await session.execute(
@@ -560,7 +553,9 @@ async def gather_business_metrics() -> dict:
             )).scalar() or 0
 
             new_clients_month = (await session.execute(
-                select(func.count(Client.id)).where(Client.created_at >= month_ago)
+                select(func.count(Client.id)).where(
+                    Client.created_at >= datetime.combine(month_ago, datetime.min.time())
+                )
             )).scalar() or 0
 
             # Автопостинг
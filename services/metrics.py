@@ -2,14 +2,16 @@
 Сервис комплексных метрик (TG Stat-подобная аналитика)
 """
 import logging
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, time, timedelta, timezone
 from typing import Optional
 
-from sqlalchemy import select, func, case
+from sqlalchemy import select, func
 from sqlalchemy.exc import ProgrammingError, OperationalError
 
-from database import async_session_maker, Channel, Manager, Order, Client, PostAnalytics
-from database.models import ScheduledPost, PostViewSnapshot
+from database import async_session_maker, Channel, Manager, Client, PostAnalytics
+from database.models import ScheduledPost, DailyOrderStats, DailyPostStats
+from services.metrics_cache import cached_metric, TAG_ORDERS, TAG_ANALYTICS
+from services.view_snapshots import fetch_view_series, views_at
 
 logger = logging.getLogger(__name__)
 
@@ -24,25 +26,17 @@ def _channel_avg_reach(channel) -> int:
     return int(channel.avg_reach_24h or channel.avg_reach or 0)
 
 
-def _period_bounds(period: str) -> tuple[datetime, datetime, datetime, datetime]:
-    """Вернуть (start, end, prev_start, prev_end) для заданного периода."""
-    now = _utcnow()
-    if period == "day":
-        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        end = now
-        prev_start = start - timedelta(days=1)
-        prev_end = start
-    elif period == "week":
-        start = now - timedelta(days=7)
-        end = now
-        prev_start = start - timedelta(days=7)
-        prev_end = start
-    else:  # month
-        start = now - timedelta(days=30)
-        end = now
-        prev_start = start - timedelta(days=30)
-        prev_end = start
-    return start, end, prev_start, prev_end
+def _period_days(period: str) -> tuple[date, date, date, date]:
+    """Вернуть (start, end, prev_start, prev_end) — границы периода в днях, end не включается.
+
+    day — сегодня, week — 7 последних дней, month — 30 последних дней
+    (включая сегодня); предыдущий период той же длины идёт перед текущим.
+    """
+    length = {"day": 1, "week": 7}.get(period, 30)
+    end = _utcnow().date() + timedelta(days=1)
+    start = end - timedelta(days=length)
+    prev_start = start - timedelta(days=length)
+    return start, end, prev_start, start
 
 
 def _delta_str(current: float, previous: float) -> str:
@@ -54,10 +48,87 @@ def _delta_str(current: float, previous: float) -> str:
     return f" {arrow}{abs(change):.1f}%"
 
 
+@cached_metric(TAG_ORDERS)
+async def get_dashboard_snapshot() -> dict:
+    """
+    Сводка CRM для экрана «Статистика» одним запросом к БД.
+
+    Заказы и выручка суммируются по дневной сводке daily_order_stats
+    с FILTER (WHERE …), счётчики менеджеров, каналов и клиентов — скалярными
+    подзапросами в том же SELECT. Ошибки БД пробрасываются вызывающему коду.
+
+    Возвращает словарь с полями:
+      total_orders, pending_orders, payment_uploaded, confirmed_orders,
+      cancelled_orders, orders_today, orders_week, orders_month,
+      total_revenue, revenue_today, revenue_week, revenue_month,
+      revenue_prev_month, total_managers, active_managers,
+      total_channels, active_channels, total_clients, new_clients_month
+    """
+    today = _utcnow().date()
+    week_start = today - timedelta(days=7)
+    month_start = today - timedelta(days=30)
+    prev_month_start = month_start - timedelta(days=30)
+
+    d = DailyOrderStats
+
+    def _sum(column, *conditions):
+        total = func.sum(column)
+        if conditions:
+            total = total.filter(*conditions)
+        return func.coalesce(total, 0)
+
+    def _count(model, *conditions):
+        query = select(func.count(model.id))
+        if conditions:
+            query = query.where(*conditions)
+        return query.scalar_subquery()
+
+    columns = {
+        "total_orders": _sum(d.orders_created),
+        "pending_orders": _sum(d.orders_pending),
+        "payment_uploaded": _sum(d.orders_payment_uploaded),
+        "confirmed_orders": _sum(d.orders_confirmed),
+        "cancelled_orders": _sum(d.orders_cancelled),
+        "orders_today": _sum(d.orders_created, d.day >= today),
+        "orders_week": _sum(d.orders_created, d.day >= week_start),
+        "orders_month": _sum(d.orders_created, d.day >= month_start),
+        "total_revenue": _sum(d.revenue),
+        "revenue_today": _sum(d.revenue, d.day >= today),
+        "revenue_week": _sum(d.revenue, d.day >= week_start),
+        "revenue_month": _sum(d.revenue, d.day >= month_start),
+        "revenue_prev_month": _sum(d.revenue, d.day >= prev_month_start, d.day < month_start),
+        "total_managers": _count(Manager),
+        "active_managers": _count(Manager, Manager.is_active == True),
+        "total_channels": _count(Channel),
+        "active_channels": _count(Channel, Channel.is_active == True),
+        "total_clients": _count(Client),
+        "new_clients_month": _count(
+            Client, Client.created_at >= datetime.combine(month_start, time.min),
+        ),
+    }
+
+    async with async_session_maker() as session:
+        row = (await session.execute(
+            select(*(column.label(name) for name, column in columns.items())).select_from(d)
+        )).one()
+
+    snapshot = {}
+    for name, value in row._mapping.items():
+        if "revenue" in name:
+            snapshot[name] = float(value or 0)
+        else:
+            snapshot[name] = int(value or 0)
+    return snapshot
+
+
+@cached_metric(TAG_ORDERS)
 async def get_sales_metrics(period: str = "month") -> Optional[dict]:
     """
     Метрики продаж за выбранный период с трендами.
 
+    Заказы и выручка берутся из дневной сводки daily_order_stats, поэтому
+    границы периода выровнены по суткам (см. _period_days).
+
     Возвращает словарь с полями:
       period, revenue, revenue_prev, revenue_delta,
       orders, orders_prev, orders_delta,
@@ -65,59 +136,46 @@ async def get_sales_metrics(period: str = "month") -> Optional[dict]:
       new_clients, new_clients_prev, new_clients_delta
     """
     try:
-        start, end, prev_start, prev_end = _period_bounds(period)
-        async with async_session_maker() as session:
-            # Выручка за текущий период
-            revenue = float((await session.execute(
-                select(func.sum(Order.final_price)).where(
-                    Order.status == "payment_confirmed",
-                    Order.paid_at >= start, Order.paid_at < end,
-                )
-            )).scalar() or 0)
-            revenue_prev = float((await session.execute(
-                select(func.sum(Order.final_price)).where(
-                    Order.status == "payment_confirmed",
-                    Order.paid_at >= prev_start, Order.paid_at < prev_end,
-                )
-            )).scalar() or 0)
+        start, end, prev_start, prev_end = _period_days(period)
+        d = DailyOrderStats
+        current = (d.day >= start, d.day < end)
+        previous = (d.day >= prev_start, d.day < prev_end)
 
-            # Новые заказы (все статусы) за период
-            orders = (await session.execute(
-                select(func.count(Order.id)).where(
-                    Order.created_at >= start, Order.created_at < end,
-                )
-            )).scalar() or 0
-            orders_prev = (await session.execute(
-                select(func.count(Order.id)).where(
-                    Order.created_at >= prev_start, Order.created_at < prev_end,
-                )
-            )).scalar() or 0
+        def _sum(column, conditions):
+            return func.coalesce(func.sum(column).filter(*conditions), 0)
 
-            # Подтверждённые заказы в периоде (для конверсии)
-            confirmed = (await session.execute(
-                select(func.count(Order.id)).where(
-                    Order.status == "payment_confirmed",
-                    Order.created_at >= start, Order.created_at < end,
-                )
-            )).scalar() or 0
-            cancelled = (await session.execute(
-                select(func.count(Order.id)).where(
-                    Order.status == "cancelled",
-                    Order.created_at >= start, Order.created_at < end,
-                )
-            )).scalar() or 0
+        def _new_clients(since: date, until: date):
+            return select(func.count(Client.id)).where(
+                Client.created_at >= datetime.combine(since, time.min),
+                Client.created_at < datetime.combine(until, time.min),
+            ).scalar_subquery()
 
-            # Новые клиенты
-            new_clients = (await session.execute(
-                select(func.count(Client.id)).where(
-                    Client.created_at >= start, Client.created_at < end,
-                )
-            )).scalar() or 0
-            new_clients_prev = (await session.execute(
-                select(func.count(Client.id)).where(
-                    Client.created_at >= prev_start, Client.created_at < prev_end,
+        async with async_session_maker() as session:
+            row = (await session.execute(
+                select(
+                    _sum(d.revenue, current).label("revenue"),
+                    _sum(d.revenue, previous).label("revenue_prev"),
+                    # Новые заказы (все статусы) за период
+                    _sum(d.orders_created, current).label("orders"),
+                    _sum(d.orders_created, previous).label("orders_prev"),
+                    # Подтверждённые / отменённые заказы периода (для конверсии)
+                    _sum(d.orders_confirmed, current).label("confirmed"),
+                    _sum(d.orders_cancelled, current).label("cancelled"),
+                    _new_clients(start, end).label("new_clients"),
+                    _new_clients(prev_start, prev_end).label("new_clients_prev"),
                 )
-            )).scalar() or 0
+                .select_from(d)
+                .where(d.day >= prev_start, d.day < end)
+            )).one()
+
+        revenue = float(row.revenue or 0)
+        revenue_prev = float(row.revenue_prev or 0)
+        orders = int(row.orders or 0)
+        orders_prev = int(row.orders_prev or 0)
+        confirmed = int(row.confirmed or 0)
+        cancelled = int(row.cancelled or 0)
+        new_clients = int(row.new_clients or 0)
+        new_clients_prev = int(row.new_clients_prev or 0)
 
         avg_order_value = revenue / confirmed if confirmed > 0 else 0
         conversion_rate = round(confirmed / orders * 100, 1) if orders > 0 else 0
@@ -144,6 +202,7 @@ async def get_sales_metrics(period: str = "month") -> Optional[dict]:
         return None
 
 
+@cached_metric(TAG_ORDERS, TAG_ANALYTICS)
 async def get_channel_metrics() -> Optional[dict]:
     """
     Метрики по каналам: топ-5 по выручке,
@@ -154,23 +213,22 @@ async def get_channel_metrics() -> Optional[dict]:
     avg_reach / ERR из накопленных PostAnalytics).
     """
     try:
-        from database.models import Slot
+        d = DailyOrderStats
         async with async_session_maker() as session:
-            # Топ каналов по выручке (Order -> Slot -> Channel)
+            # Топ каналов по выручке (дневная сводка заказов -> Channel)
             top_by_revenue = []
             try:
                 top_by_revenue = (await session.execute(
                     select(
                         Channel.name,
-                        func.sum(Order.final_price).label("rev"),
-                        func.count(Order.id).label("cnt"),
+                        func.sum(d.revenue).label("rev"),
+                        func.sum(d.paid_orders).label("cnt"),
                     )
-                    .select_from(Order)
-                    .join(Slot, Order.slot_id == Slot.id)
-                    .join(Channel, Slot.channel_id == Channel.id)
-                    .where(Order.status == "payment_confirmed")
+                    .select_from(d)
+                    .join(Channel, d.channel_id == Channel.id)
                     .group_by(Channel.id, Channel.name)
-                    .order_by(func.sum(Order.final_price).desc())
+                    .having(func.sum(d.paid_orders) > 0)
+                    .order_by(func.sum(d.revenue).desc())
                     .limit(5)
                 )).all()
             except Exception as e:
@@ -220,22 +278,20 @@ async def get_channel_metrics() -> Optional[dict]:
             except Exception as e:
                 logger.warning(f"get_channel_metrics: total_active query failed: {e}", exc_info=True)
 
-            # Суммарные просмотры по PostAnalytics (факт, собранные ботом)
+            # Суммарные просмотры по дневной сводке PostAnalytics (факт, собранные ботом)
             total_views = 0
-            try:
-                total_views = (await session.execute(
-                    select(func.sum(PostAnalytics.views)).where(PostAnalytics.views > 0)
-                )).scalar() or 0
-            except Exception as e:
-                logger.warning(f"get_channel_metrics: total_views query failed: {e}", exc_info=True)
-
             analytics_posts = 0
             try:
-                analytics_posts = (await session.execute(
-                    select(func.count(PostAnalytics.id)).where(PostAnalytics.views > 0)
-                )).scalar() or 0
+                views_row = (await session.execute(
+                    select(
+                        func.sum(DailyPostStats.views).label("views"),
+                        func.sum(DailyPostStats.posts_with_views).label("posts"),
+                    )
+                )).one()
+                total_views = views_row.views or 0
+                analytics_posts = int(views_row.posts or 0)
             except Exception as e:
-                logger.warning(f"get_channel_metrics: analytics_posts query failed: {e}", exc_info=True)
+                logger.warning(f"get_channel_metrics: total_views query failed: {e}", exc_info=True)
 
         return {
             "top_by_revenue": [(r.name, float(r.rev or 0), r.cnt) for r in top_by_revenue],
@@ -251,25 +307,27 @@ async def get_channel_metrics() -> Optional[dict]:
         return None
 
 
+@cached_metric(TAG_ORDERS)
 async def get_manager_metrics() -> Optional[dict]:
     """
     Метрики по менеджерам: топ-5 по выручке, по конверсии,
     средний чек менеджера.
     """
     try:
+        d = DailyOrderStats
         async with async_session_maker() as session:
             # Топ по выручке (все подтверждённые заказы)
             top_rev = (await session.execute(
                 select(
                     Manager.first_name,
                     Manager.username,
-                    func.sum(Order.final_price).label("rev"),
-                    func.count(Order.id).label("cnt"),
+                    func.sum(d.revenue).label("rev"),
+                    func.sum(d.paid_orders).label("cnt"),
                 )
-                .join(Order, Order.manager_id == Manager.id)
-                .where(Order.status == "payment_confirmed")
+                .join(d, d.manager_id == Manager.id)
                 .group_by(Manager.id, Manager.first_name, Manager.username)
-                .order_by(func.sum(Order.final_price).desc())
+                .having(func.sum(d.paid_orders) > 0)
+                .order_by(func.sum(d.revenue).desc())
                 .limit(5)
             )).all()
 
@@ -278,43 +336,41 @@ async def get_manager_metrics() -> Optional[dict]:
                 select(
                     Manager.first_name,
                     Manager.username,
-                    func.count(Order.id).label("total"),
-                    func.sum(
-                        case((Order.status == "payment_confirmed", 1), else_=0)
-                    ).label("confirmed"),
+                    func.sum(d.orders_created).label("total"),
+                    func.sum(d.orders_confirmed).label("confirmed"),
                 )
-                .join(Order, Order.manager_id == Manager.id)
+                .join(d, d.manager_id == Manager.id)
                 .where(Manager.is_active == True)
                 .group_by(Manager.id, Manager.first_name, Manager.username)
-                .having(func.count(Order.id) >= 3)
+                .having(func.sum(d.orders_created) >= 3)
                 .order_by(
-                    (func.sum(case((Order.status == "payment_confirmed", 1), else_=0)) /
-                     func.count(Order.id)).desc()
+                    (func.sum(d.orders_confirmed) * 1.0 / func.sum(d.orders_created)).desc()
                 )
                 .limit(5)
             )).all()
 
             # Средний чек по менеджерам
-            avg_check = float((await session.execute(
-                select(func.avg(Order.final_price)).where(
-                    Order.status == "payment_confirmed",
-                    Order.manager_id.is_not(None),
-                )
-            )).scalar() or 0)
+            check_row = (await session.execute(
+                select(
+                    func.sum(d.revenue).label("rev"),
+                    func.sum(d.paid_orders).label("cnt"),
+                ).where(d.manager_id != 0)
+            )).one()
+            avg_check = float(check_row.rev or 0) / check_row.cnt if check_row.cnt else 0.0
 
         top_revenue = [
             {
                 "name": r.first_name or r.username or "—",
                 "revenue": float(r.rev),
-                "orders": r.cnt,
+                "orders": int(r.cnt),
             }
             for r in top_rev
         ]
         top_conversion = [
             {
                 "name": r.first_name or r.username or "—",
-                "total": r.total,
-                "confirmed": r.confirmed,
+                "total": int(r.total),
+                "confirmed": int(r.confirmed),
                 "rate": round(r.confirmed / r.total * 100, 1) if r.total > 0 else 0,
             }
             for r in conv_rows
@@ -329,6 +385,7 @@ async def get_manager_metrics() -> Optional[dict]:
         return None
 
 
+@cached_metric(TAG_ORDERS)
 async def get_client_metrics() -> Optional[dict]:
     """
     Метрики по клиентам: новые vs. повторные, средний LTV,
@@ -397,6 +454,7 @@ async def get_client_metrics() -> Optional[dict]:
         return None
 
 
+@cached_metric(TAG_ORDERS)
 async def get_format_metrics() -> Optional[dict]:
     """
     Разбивка заказов по форматам размещения (1/24, 1/48, 2/48, native):
@@ -404,24 +462,25 @@ async def get_format_metrics() -> Optional[dict]:
     """
     try:
         async with async_session_maker() as session:
+            d = DailyOrderStats
             rows = (await session.execute(
                 select(
-                    Order.format_type,
-                    func.count(Order.id).label("cnt"),
-                    func.sum(Order.final_price).label("rev"),
+                    d.format_type,
+                    func.sum(d.paid_orders).label("cnt"),
+                    func.sum(d.revenue).label("rev"),
                 )
-                .where(Order.status == "payment_confirmed")
-                .group_by(Order.format_type)
-                .order_by(func.sum(Order.final_price).desc())
+                .group_by(d.format_type)
+                .having(func.sum(d.paid_orders) > 0)
+                .order_by(func.sum(d.revenue).desc())
             )).all()
 
-            total_orders = sum(r.cnt for r in rows)
+            total_orders = sum(int(r.cnt) for r in rows)
             total_revenue = sum(float(r.rev or 0) for r in rows)
 
         formats = [
             {
                 "type": r.format_type or "—",
-                "orders": r.cnt,
+                "orders": int(r.cnt),
                 "revenue": float(r.rev or 0),
                 "order_share": round(r.cnt / total_orders * 100, 1) if total_orders > 0 else 0,
                 "revenue_share": round(float(r.rev or 0) / total_revenue * 100, 1) if total_revenue > 0 else 0,
@@ -434,6 +493,7 @@ async def get_format_metrics() -> Optional[dict]:
         return None
 
 
+@cached_metric(TAG_ANALYTICS)
 async def get_post_analytics_metrics() -> Optional[dict]:
     """
     Сводная аналитика рекламных постов:
@@ -441,20 +501,23 @@ async def get_post_analytics_metrics() -> Optional[dict]:
     """
     try:
         async with async_session_maker() as session:
-            count = (await session.execute(
-                select(func.count(PostAnalytics.id))
-            )).scalar() or 0
+            # Количество и средние — по дневной сводке, а не по всем записям
+            totals = (await session.execute(
+                select(
+                    func.sum(DailyPostStats.posts).label("posts"),
+                    func.sum(DailyPostStats.posts_with_views).label("with_views"),
+                    func.sum(DailyPostStats.views).label("views"),
+                    func.sum(DailyPostStats.reactions).label("reactions"),
+                )
+            )).one()
+            count = int(totals.posts or 0)
 
             if count == 0:
                 return {"count": 0, "avg_views": 0, "avg_reactions": 0, "avg_er": 0, "top": []}
 
-            avg_views = float((await session.execute(
-                select(func.avg(PostAnalytics.views)).where(PostAnalytics.views > 0)
-            )).scalar() or 0)
-
-            avg_reactions = float((await session.execute(
-                select(func.avg(PostAnalytics.reactions)).where(PostAnalytics.views > 0)
-            )).scalar() or 0)
+            with_views = int(totals.with_views or 0)
+            avg_views = float(totals.views or 0) / with_views if with_views else 0.0
+            avg_reactions = float(totals.reactions or 0) / with_views if with_views else 0.0
 
             # Топ-5 постов по ER (реакции+пересылки+сохранения+комментарии / просмотры)
             # JOIN по channel_id может завершиться ошибкой, если колонка ещё не добавлена
@@ -734,18 +797,7 @@ async def get_daily_reach_report() -> Optional[dict]:
             if not rows:
                 return {"posts": [], "count": 0, "total_views": 0, "total_views_24h": 0, "avg_err24": 0.0}
 
-            post_ids = [r.id for r in rows]
-
-            snapshots_all = (await session.execute(
-                select(PostViewSnapshot)
-                .where(PostViewSnapshot.scheduled_post_id.in_(post_ids))
-                .order_by(PostViewSnapshot.recorded_at.asc())
-            )).scalars().all()
-
-        # Группируем снимки по scheduled_post_id
-        snapshots_by_post: dict = {}
-        for s in snapshots_all:
-            snapshots_by_post.setdefault(s.scheduled_post_id, []).append(s)
+            series_by_post = await fetch_view_series(session, [r.id for r in rows])
 
         results = []
         total_views = 0
@@ -761,14 +813,13 @@ async def get_daily_reach_report() -> Optional[dict]:
             comments = r.comments or 0
             total_engage = reactions + forwards + saves + comments
 
-            # Просмотры за 24 часа из снимков
-            post_snaps = snapshots_by_post.get(r.id, [])
-            views_24h = views  # fallback: текущие просмотры
-            if post_snaps and r.posted_at:
-                cutoff_24h = r.posted_at + timedelta(hours=24)
-                snaps_24h = [s for s in post_snaps if s.recorded_at <= cutoff_24h]
-                if snaps_24h:
-                    views_24h = snaps_24h[-1].views
+            # Просмотры за 24 часа из снимков (fallback: текущие просмотры)
+            views_24h = views
+            series = series_by_post.get(r.id)
+            if series and r.posted_at:
+                snap_views = views_at(series, r.posted_at + timedelta(hours=24))
+                if snap_views is not None:
+                    views_24h = snap_views
 
             err24 = round(total_engage / views_24h * 100, 1) if views_24h > 0 else 0.0
 
@@ -0,0 +1,116 @@
+"""
+Кэш тяжёлых метрик в памяти.
+
+Функции из services/metrics.py помечаются декоратором ``cached_metric``:
+результат хранится METRICS_CACHE_TTL_SECONDS секунд по ключу
+(имя функции, аргументы). Если несколько администраторов одновременно
+открывают один и тот же экран, запрос к БД выполняется один раз — остальные
+ждут его результата (single-flight).
+
+Каждая метрика помечается тегами данных, от которых она зависит
+("orders", "analytics"). При изменении данных вызывающий код сбрасывает
+соответствующие записи: ``metrics_cache.invalidate("orders")``.
+"""
+import asyncio
+import functools
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from config import METRICS_CACHE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Теги данных, от которых зависят метрики
+TAG_ORDERS = "orders"
+TAG_ANALYTICS = "analytics"
+
+
+class MetricsCache:
+    """TTL-кэш асинхронных функций с дедупликацией одновременных запросов."""
+
+    def __init__(self, ttl: float = METRICS_CACHE_TTL_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        # key -> (expires_at, value, tags)
+        self._entries: dict[tuple, tuple[float, Any, frozenset]] = {}
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        # Увеличивается при каждой инвалидации: результат, посчитанный до
+        # сброса, не должен попасть в кэш после него
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_compute(
+        self,
+        key: tuple,
+        compute: Callable[[], Awaitable[Any]],
+        tags: frozenset = frozenset(),
+    ) -> Any:
+        """Вернуть значение из кэша или посчитать его через ``compute()``.
+
+        None (признак ошибки у функций метрик) не кэшируется.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > self._clock():
+            self.hits += 1
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._compute(key, compute, tags, self._generation))
+            self._inflight[key] = task
+        # shield: отмена одного ожидающего не отменяет расчёт для остальных
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: tuple, compute, tags: frozenset, generation: int) -> Any:
+        try:
+            value = await compute()
+            if value is not None and self.ttl > 0 and generation == self._generation:
+                self._entries[key] = (self._clock() + self.ttl, value, tags)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def invalidate(self, *tags: str) -> int:
+        """Сбросить записи с любым из ``tags`` (без аргументов — все); вернуть их число."""
+        self._generation += 1
+        if not tags:
+            dropped = len(self._entries)
+            self._entries.clear()
+        else:
+            wanted = set(tags)
+            stale = [key for key, entry in self._entries.items() if entry[2] & wanted]
+            for key in stale:
+                del self._entries[key]
+            dropped = len(stale)
+        if dropped:
+            logger.debug(f"Кэш метрик: сброшено {dropped} записей (теги: {tags or 'все'})")
+        return dropped
+
+
+# Глобальный экземпляр кэша метрик
+metrics_cache = MetricsCache()
+
+
+def cached_metric(*tags: str):
+    """Декоратор: кэшировать результат асинхронной функции метрик.
+
+    Исходная функция без кэша доступна как ``func.__wrapped__``.
+    """
+    tag_set = frozenset(tags)
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            return await metrics_cache.get_or_compute(key, lambda: func(*args, **kwargs), tag_set)
+        return wrapper
+
+    return decorator
+
+
+def invalidate_metrics(*tags: str) -> None:
+    """Хук инвалидации: вызывать после изменения заказов или аналитики."""
+    metrics_cache.invalidate(*tags)
@@ -0,0 +1,269 @@
+"""
+Фоновая рассылка служебных уведомлений (администраторам и в чат менеджеров).
+
+Вызывающий код не ждёт отправки: ``notification_dispatcher.notify_admins(...)``
+лишь кладёт уведомление в очередь и сразу возвращает управление.
+Фоновая задача:
+ - собирает уведомления за короткое окно (NOTIFY_COALESCE_SECONDS);
+ - склеивает однотипные уведомления (одинаковый digest_key) в один дайджест,
+   например «Опубликовано постов: 20» вместо 20 отдельных сообщений;
+ - раздаёт уведомления по очередям получателей: у каждого чата свой
+   обработчик, поэтому одному получателю сообщения идут по порядку, а
+   медленный чат (RetryAfter, повторы) не задерживает остальные;
+ - соблюдает лимиты Telegram (telegram_rate_limiter) и повторяет неудачные
+   отправки с экспоненциальной задержкой.
+"""
+import asyncio
+import logging
+import traceback
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+
+from config import ADMIN_IDS, NOTIFY_COALESCE_SECONDS, NOTIFY_MAX_RETRIES
+from services.rate_limiter import telegram_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+# Базовая задержка перед повторной отправкой (удваивается с каждой попыткой)
+RETRY_BASE_DELAY = 1.0
+
+
+class Notification:
+    """Одно исходящее сообщение.
+
+    ``method`` — имя метода бота (send_message, send_photo, forward_message, …),
+    ``kwargs`` — его аргументы без chat_id. Уведомления с одинаковыми
+    (chat_id, digest_key) склеиваются: вместо полного текста в дайджест
+    попадает ``digest_line`` под заголовком ``digest_title`` (с ``{count}``).
+    """
+
+    def __init__(
+        self,
+        chat_id: int,
+        method: str = "send_message",
+        digest_key: Optional[str] = None,
+        digest_title: Optional[str] = None,
+        digest_line: Optional[str] = None,
+        **kwargs,
+    ):
+        self.chat_id = chat_id
+        self.method = method
+        self.digest_key = digest_key
+        self.digest_title = digest_title
+        self.digest_line = digest_line
+        self.kwargs = kwargs
+
+    def __repr__(self) -> str:
+        return f"Notification(chat_id={self.chat_id}, method={self.method!r}, digest_key={self.digest_key!r})"
+
+
+def _split_lines(lines: list[str], header: str, limit: int = MAX_MESSAGE_LENGTH) -> list[str]:
+    """Разбить строки дайджеста на сообщения не длиннее ``limit`` символов."""
+    chunks = []
+    current = header
+    for line in lines:
+        candidate = f"{current}\n{line}"
+        if len(candidate) > limit and current != header:
+            chunks.append(current)
+            current = f"{header}\n{line}"
+        else:
+            current = candidate
+    chunks.append(current)
+    return chunks
+
+
+def coalesce(batch: list[Notification]) -> list[Notification]:
+    """Склеить однотипные уведомления одного получателя в дайджесты.
+
+    Порядок сохраняется: дайджест занимает место первого уведомления группы.
+    Одиночные уведомления и уведомления без digest_key не изменяются.
+    """
+    groups: dict[tuple, list[Notification]] = {}
+    order: list = []
+    for item in batch:
+        if item.digest_key and item.digest_line:
+            key = (item.chat_id, item.digest_key, item.kwargs.get("parse_mode"))
+            if key not in groups:
+                groups[key] = []
+                order.append(key)
+            groups[key].append(item)
+        else:
+            order.append(item)
+
+    result = []
+    for entry in order:
+        if isinstance(entry, Notification):
+            result.append(entry)
+            continue
+        items = groups[entry]
+        if len(items) == 1:
+            result.append(items[0])
+            continue
+        first = items[0]
+        title = (first.digest_title or "🔔 Уведомлений: {count}").format(count=len(items))
+        for text in _split_lines([i.digest_line for i in items], f"{title}\n"):
+            result.append(Notification(
+                first.chat_id,
+                text=text,
+                parse_mode=first.kwargs.get("parse_mode"),
+            ))
+    return result
+
+
+class NotificationDispatcher:
+    """Очередь уведомлений + фоновая задача доставки."""
+
+    def __init__(
+        self,
+        coalesce_window: float = NOTIFY_COALESCE_SECONDS,
+        max_retries: int = NOTIFY_MAX_RETRIES,
+    ):
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        # Очередь и обработчик на каждый чат (получателей немного: админы и чат менеджеров)
+        self._chat_queues: dict[int, asyncio.Queue] = {}
+        self._chat_workers: dict[int, asyncio.Task] = {}
+
+    # ─── Постановка в очередь ────────────────────────────────────────────────
+
+    def enqueue(self, notification: Notification) -> None:
+        """Поставить уведомление в очередь (не ждёт отправки)."""
+        self._queue.put_nowait(notification)
+
+    def send(self, chat_id: int, text: str, parse_mode: Optional[str] = None, **kwargs) -> None:
+        """Отправить текст в чат ``chat_id`` в фоне."""
+        self.enqueue(Notification(chat_id, text=text, parse_mode=parse_mode, **kwargs))
+
+    def notify_admins(self, text: str, parse_mode: Optional[str] = None, **kwargs) -> None:
+        """Отправить текст всем администраторам из ADMIN_IDS в фоне."""
+        for admin_id in ADMIN_IDS:
+            self.send(admin_id, text, parse_mode=parse_mode, **kwargs)
+
+    async def notify_manager_group(self, text: str, parse_mode: Optional[str] = None, **kwargs) -> bool:
+        """Отправить текст в чат менеджеров (если настроен) в фоне.
+
+        Возвращает False, если чат менеджеров не задан.
+        """
+        from services.settings import get_manager_group_chat_id
+
+        chat_id = await get_manager_group_chat_id()
+        if not chat_id:
+            return False
+        self.send(chat_id, text, parse_mode=parse_mode, **kwargs)
+        return True
+
+    # ─── Жизненный цикл ──────────────────────────────────────────────────────
+
+    def start(self, bot: Bot) -> None:
+        """Запустить фоновую задачу доставки."""
+        self._bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Дождаться отправки очереди (не дольше ``timeout`` секунд) и остановиться."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout=timeout)
+        except asyncio.TimeoutError:
+            unsent = self._queue.qsize() + sum(q.qsize() for q in self._chat_queues.values())
+            logger.warning(f"Не отправлено уведомлений при остановке: {unsent}")
+        tasks = [self._task, *self._chat_workers.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._chat_queues.clear()
+        self._chat_workers.clear()
+
+    async def _drain(self) -> None:
+        """Дождаться, пока общая очередь и очереди всех чатов опустеют."""
+        await self._queue.join()
+        for queue in list(self._chat_queues.values()):
+            await queue.join()
+
+    # ─── Доставка ────────────────────────────────────────────────────────────
+
+    async def _collect_batch(self) -> list[Notification]:
+        """Дождаться первого уведомления и собрать все пришедшие за окно."""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.coalesce_window
+        while True:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect_batch()
+            try:
+                self._dispatch(coalesce(batch))
+            except Exception:
+                logger.error(f"Ошибка доставки уведомлений: {traceback.format_exc()}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _dispatch(self, notifications: list[Notification]) -> None:
+        """Разложить уведомления по очередям чатов, не дожидаясь отправки."""
+        for item in notifications:
+            queue = self._chat_queues.get(item.chat_id)
+            if queue is None:
+                queue = self._chat_queues[item.chat_id] = asyncio.Queue()
+                self._chat_workers[item.chat_id] = asyncio.create_task(self._chat_worker(queue))
+            queue.put_nowait(item)
+
+    async def _chat_worker(self, queue: asyncio.Queue) -> None:
+        """Отправлять уведомления одного чата по порядку."""
+        while True:
+            item = await queue.get()
+            try:
+                await self._send_with_retry(item)
+            except Exception:
+                logger.error(f"Ошибка доставки уведомления в чат {item.chat_id}: {traceback.format_exc()}")
+            finally:
+                queue.task_done()
+
+    async def _send_with_retry(self, item: Notification) -> bool:
+        """Отправить одно уведомление; вернуть True при успехе."""
+        send = getattr(self._bot, item.method)
+        for attempt in range(self.max_retries + 1):
+            await telegram_rate_limiter.acquire(item.chat_id)
+            try:
+                await send(chat_id=item.chat_id, **item.kwargs)
+                return True
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Бот заблокирован или некорректный запрос — повтор не поможет
+                logger.warning(f"Уведомление в чат {item.chat_id} не доставлено: {e}")
+                return False
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    break
+                delay = RETRY_BASE_DELAY * 2 ** attempt
+                logger.info(
+                    f"Ошибка отправки уведомления в чат {item.chat_id} ({e}), "
+                    f"повтор через {delay:.0f} с"
+                )
+                await asyncio.sleep(delay)
+        logger.warning(f"Уведомление в чат {item.chat_id} не доставлено после {self.max_retries + 1} попыток")
+        return False
+
+
+# Глобальный экземпляр диспетчера уведомлений
+notification_dispatcher = NotificationDispatcher()
@@ -0,0 +1,160 @@
+"""
+Событийный планировщик публикации постов.
+
+Вместо опроса БД раз в минуту держим в памяти кучу (heapq) пар
+(scheduled_time, post_id) для постов в статусе pending и просыпаемся ровно
+в момент, когда наступает время ближайшего поста.
+
+Куча пополняется:
+ - при старте и периодически (страховочный опрос) — загрузкой из БД;
+ - из обработчиков, когда пост создан, перенесён или одобрен
+   (``publish_scheduler.notify(post_id, scheduled_time)``).
+
+Записи в куче могут устаревать (пост отменён, перенесён) — это безопасно:
+публикация всё равно атомарно захватывает посты в БД, поэтому «лишнее»
+пробуждение стоит одного пустого запроса. Наоборот, потерять запись нельзя:
+если публикация упала или была пропущена, наступившие записи возвращаются
+в кучу и повторяются через ``retry_delay`` секунд.
+"""
+import asyncio
+import heapq
+import logging
+import traceback
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import select
+
+from database import async_session_maker, ScheduledPost
+from utils.helpers import utc_now
+
+logger = logging.getLogger(__name__)
+
+
+class PublishScheduler:
+    """Будильник публикаций: куча времён постов + фоновая задача ожидания."""
+
+    def __init__(self, retry_delay: float = 5.0):
+        self.retry_delay = retry_delay
+        self._heap: list[tuple[datetime, int]] = []
+        # Записи, добавленные во время идущих reload(): сливаются с загрузкой из БД
+        self._journals: list[list[tuple[datetime, int]]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._callback: Optional[Callable[[], Awaitable[Optional[bool]]]] = None
+
+    def notify(self, post_id: int, scheduled_time: Optional[datetime]) -> None:
+        """Сообщить о посте, ожидающем публикации в ``scheduled_time`` (UTC)."""
+        if scheduled_time is None:
+            return
+        self._push((scheduled_time, post_id))
+
+    def _push(self, entry: tuple[datetime, int]) -> None:
+        is_new_head = not self._heap or entry[0] < self._heap[0][0]
+        heapq.heappush(self._heap, entry)
+        for journal in self._journals:
+            journal.append(entry)
+        if is_new_head:
+            self._wakeup.set()
+
+    async def reload(self) -> None:
+        """Перестроить кучу по текущим pending-постам из БД.
+
+        Используется при старте и как страховочный опрос: подхватывает посты,
+        созданные в обход notify() (другим экземпляром бота, вручную в БД).
+        Записи, добавленные во время запроса, сохраняются.
+        """
+        journal: list[tuple[datetime, int]] = []
+        self._journals.append(journal)
+        try:
+            async with async_session_maker() as session:
+                rows = (await session.execute(
+                    select(ScheduledPost.scheduled_time, ScheduledPost.id).where(
+                        ScheduledPost.status == "pending",
+                        ScheduledPost.scheduled_time.isnot(None),
+                    )
+                )).all()
+            self._heap = [(row[0], row[1]) for row in rows] + journal
+            heapq.heapify(self._heap)
+            self._wakeup.set()
+            logger.debug(f"Планировщик публикаций: загружено {len(self._heap)} постов в очереди")
+        except Exception:
+            logger.error(f"Ошибка загрузки очереди публикаций: {traceback.format_exc()}")
+        finally:
+            self._journals.remove(journal)
+
+    def next_due(self) -> Optional[datetime]:
+        """Время ближайшей публикации (UTC) или None, если очередь пуста."""
+        return self._heap[0][0] if self._heap else None
+
+    def _seconds_until_next(self) -> Optional[float]:
+        next_due = self.next_due()
+        if next_due is None:
+            return None
+        return max(0.0, (next_due - utc_now()).total_seconds())
+
+    def _pop_due(self) -> list[tuple[datetime, int]]:
+        """Убрать из кучи все наступившие записи и вернуть их."""
+        now = utc_now()
+        popped = []
+        while self._heap and self._heap[0][0] <= now:
+            popped.append(heapq.heappop(self._heap))
+        return popped
+
+    def start(self, callback: Callable[[], Awaitable[Optional[bool]]]) -> None:
+        """Запустить фоновую задачу; ``callback`` публикует наступившие посты.
+
+        ``callback`` возвращает False, если публикация не выполнена (пропущена
+        или упала); тогда наступившие записи повторяются через ``retry_delay``.
+        """
+        self._callback = callback
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить фоновую задачу."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self._wakeup.clear()
+                delay = self._seconds_until_next()
+                if delay is None or delay > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                        # Очередь изменилась — пересчитываем время пробуждения
+                        continue
+                    except asyncio.TimeoutError:
+                        pass
+                due = self._pop_due()
+                if due:
+                    await self._fire(due)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.error(f"Ошибка в планировщике публикаций: {traceback.format_exc()}")
+                await asyncio.sleep(1)
+
+    async def _fire(self, due: list[tuple[datetime, int]]) -> None:
+        try:
+            done = await self._callback() is not False
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.error(f"Ошибка публикации по расписанию: {traceback.format_exc()}")
+            done = False
+        if not done:
+            for entry in due:
+                self._push(entry)
+            await asyncio.sleep(self.retry_delay)
+
+
+# Глобальный экземпляр планировщика публикаций
+publish_scheduler = PublishScheduler()
@@ -0,0 +1,182 @@
+"""
+Ограничение частоты отправки сообщений в Telegram (token bucket).
+
+Telegram Bot API ограничивает бота примерно 30 сообщениями в секунду
+суммарно, 1 сообщением в секунду в личный чат и ~20 сообщениями в минуту
+в одну группу или канал. При превышении лимитов API отвечает 429
+(TelegramRetryAfter) и временно блокирует отправку.
+
+TelegramRateLimiter объединяет глобальное «ведро» и отдельные вёдра для
+каждого чата: перед каждой отправкой вызывается ``await acquire(chat_id)``,
+который дожидается свободного токена в обоих вёдрах.
+
+AdaptiveRateLimiter — темп для массовых отправок (рассылок), который
+снижается при ответах 429 и восстанавливается при успешных отправках.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from config import TG_GLOBAL_RATE, TG_GROUP_RATE_PER_MIN
+
+logger = logging.getLogger(__name__)
+
+# Лимит для личных чатов: 1 сообщение в секунду
+PRIVATE_CHAT_RATE = 1.0
+# Ёмкость ведра для групп и каналов — небольшой «всплеск» без ожидания
+GROUP_CHAT_BURST = 3
+# Сколько вёдер чатов хранить; сверх этого удаляется ведро чата, в который
+# дольше всех не отправляли (оно давно восполнилось)
+MAX_CHAT_BUCKETS = 1000
+
+
+class TokenBucket:
+    """Ведро токенов: ``rate`` токенов в секунду, не более ``capacity`` в запасе."""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = max(0.0, now - self._updated)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Попытаться взять токены без ожидания.
+
+        Возвращает 0, если токены выданы, иначе — сколько секунд нужно подождать.
+        """
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    def set_rate(self, rate: float) -> None:
+        """Изменить темп; накопленные токены сохраняются."""
+        self._refill()
+        self.rate = float(rate)
+
+    def drain(self, until: float = 0.0) -> None:
+        """Обнулить запас токенов; восполнение начнётся не раньше ``until``."""
+        self._refill()
+        self._tokens = 0.0
+        self._updated = max(self._updated, until)
+
+    def is_full(self) -> bool:
+        """True, если ведро полностью восполнилось (им давно не пользовались)."""
+        self._refill()
+        return self._tokens >= self.capacity
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Дождаться и взять токены. Ожидающие обслуживаются по очереди."""
+        async with self._lock:
+            while True:
+                wait = self.try_acquire(tokens)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+
+class TelegramRateLimiter:
+    """Глобальный лимит бота + лимит на каждый чат."""
+
+    def __init__(
+        self,
+        global_rate: float = TG_GLOBAL_RATE,
+        group_rate_per_min: float = TG_GROUP_RATE_PER_MIN,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._clock = clock
+        self._global = TokenBucket(global_rate, max(1.0, global_rate), clock=clock)
+        self._group_rate = group_rate_per_min / 60.0
+        # Порядок — от давно использованных к недавним (LRU)
+        self._chats: OrderedDict[int, TokenBucket] = OrderedDict()
+
+    def _bucket_for(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is not None:
+            self._chats.move_to_end(chat_id)
+        else:
+            while len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._chats.popitem(last=False)
+            # Отрицательные ID — группы и каналы, положительные — личные чаты
+            if chat_id < 0:
+                bucket = TokenBucket(self._group_rate, GROUP_CHAT_BURST, clock=self._clock)
+            else:
+                bucket = TokenBucket(PRIVATE_CHAT_RATE, 1, clock=self._clock)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def acquire(self, chat_id: int) -> None:
+        """Дождаться разрешения на отправку одного сообщения в чат ``chat_id``."""
+        await self._bucket_for(chat_id).acquire()
+        await self._global.acquire()
+
+    async def acquire_global(self) -> None:
+        """Дождаться разрешения на запрос к API, не связанный с отправкой в чат."""
+        await self._global.acquire()
+
+
+class AdaptiveRateLimiter:
+    """Темп, подстраивающийся под ответы Telegram (AIMD).
+
+    Ответ 429 (TelegramRetryAfter) приостанавливает всех ожидающих на
+    указанное Telegram время и вдвое снижает темп; каждая успешная отправка
+    понемногу повышает его (примерно на ``increase`` сообщений в секунду за
+    секунду успешной работы), но не выше ``max_rate``.
+    """
+
+    def __init__(
+        self,
+        max_rate: float,
+        min_rate: float = 1.0,
+        increase: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_rate = float(max_rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.increase = increase
+        self._clock = clock
+        self._bucket = TokenBucket(max_rate, max(1.0, max_rate), clock=clock)
+        self._paused_until = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self._bucket.rate
+
+    def paused_for(self) -> float:
+        """Сколько секунд ещё действует пауза после 429."""
+        return max(0.0, self._paused_until - self._clock())
+
+    async def acquire(self) -> None:
+        """Дождаться конца паузы и свободного токена."""
+        while True:
+            pause = self.paused_for()
+            if pause <= 0:
+                break
+            await asyncio.sleep(pause)
+        await self._bucket.acquire()
+
+    def on_success(self) -> None:
+        if self.rate < self.max_rate:
+            self._bucket.set_rate(min(self.max_rate, self.rate + self.increase / self.rate))
+
+    def on_retry_after(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+        self._bucket.set_rate(max(self.min_rate, self.rate / 2))
+        # Иначе за время паузы накопится запас и после неё будет всплеск отправок
+        self._bucket.drain(until=self._paused_until)
+        logger.warning(f"Telegram RetryAfter {seconds}s — темп снижен до {self.rate:.1f} msg/s")
+
+
+# Глобальный экземпляр ограничителя (общий для всех отправок бота)
+telegram_rate_limiter = TelegramRateLimiter()
@@ -0,0 +1,274 @@
+"""
+Дневные сводки заказов и аналитики постов.
+
+Метрики за период читают не orders / post_analytics, а таблицы
+daily_order_stats и daily_post_stats — одна строка на день × измерение, так что
+стоимость запроса растёт с числом дней, а не с историей заказов.
+
+Сводки поддерживаются инкрементально: код, изменивший заказ или аналитику,
+отмечает затронутые дни (``rollup_refresher.mark_order(...)``,
+``mark_post(...)``), а фоновая задача раз в ROLLUP_FLUSH_SECONDS пересчитывает
+только эти дни из исходных таблиц. Пересчёт дня идемпотентен (DELETE + INSERT …
+SELECT), поэтому сводки не «уплывают» даже при повторной или пропущенной
+отметке; ежедневный пересчёт последних дней и заполнение пустых таблиц при
+старте страхуют от изменений в обход хуков.
+"""
+import asyncio
+import logging
+import traceback
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+
+from config import ROLLUP_FLUSH_SECONDS
+from database import async_session_maker
+from services.metrics_cache import invalidate_metrics, TAG_ORDERS, TAG_ANALYTICS
+from utils.helpers import utc_now
+
+logger = logging.getLogger(__name__)
+
+# Пересчёт заказов за [start, end). Счётчики статусов — по дню создания,
+# выручка и число оплат — по дню оплаты (только payment_confirmed; у старых
+# подтверждённых заказов без paid_at — по дню создания).
+_REFRESH_ORDERS_SQL = text("""
+    INSERT INTO daily_order_stats (
+        day, channel_id, manager_id, format_type,
+        orders_created, orders_pending, orders_payment_uploaded,
+        orders_confirmed, orders_cancelled, paid_orders, revenue
+    )
+    SELECT day, channel_id, manager_id, format_type,
+           SUM(created), SUM(pending), SUM(uploaded),
+           SUM(confirmed), SUM(cancelled), SUM(paid), SUM(revenue)
+    FROM (
+        SELECT CAST(o.created_at AS DATE) AS day,
+               COALESCE(s.channel_id, 0) AS channel_id,
+               COALESCE(o.manager_id, 0) AS manager_id,
+               COALESCE(o.format_type, '') AS format_type,
+               1 AS created,
+               (o.status = 'pending')::int AS pending,
+               (o.status = 'payment_uploaded')::int AS uploaded,
+               (o.status = 'payment_confirmed')::int AS confirmed,
+               (o.status = 'cancelled')::int AS cancelled,
+               0 AS paid,
+               0 AS revenue
+        FROM orders o LEFT JOIN slots s ON s.id = o.slot_id
+        WHERE o.created_at >= :start AND o.created_at < :end
+        UNION ALL
+        SELECT CAST(COALESCE(o.paid_at, o.created_at) AS DATE),
+               COALESCE(s.channel_id, 0),
+               COALESCE(o.manager_id, 0),
+               COALESCE(o.format_type, ''),
+               0, 0, 0, 0, 0,
+               1,
+               COALESCE(o.final_price, 0)
+        FROM orders o LEFT JOIN slots s ON s.id = o.slot_id
+        WHERE o.status = 'payment_confirmed'
+          AND COALESCE(o.paid_at, o.created_at) >= :start
+          AND COALESCE(o.paid_at, o.created_at) < :end
+    ) t
+    GROUP BY day, channel_id, manager_id, format_type
+""")
+
+# Пересчёт аналитики постов, опубликованных в [start, end)
+_REFRESH_POSTS_SQL = text("""
+    INSERT INTO daily_post_stats (
+        day, channel_id, posts, posts_with_views,
+        views, reactions, forwards, saves, comments
+    )
+    SELECT CAST(sp.posted_at AS DATE), pa.channel_id,
+           COUNT(*), COUNT(*) FILTER (WHERE pa.views > 0),
+           COALESCE(SUM(pa.views), 0), COALESCE(SUM(pa.reactions), 0),
+           COALESCE(SUM(pa.forwards), 0), COALESCE(SUM(pa.saves), 0),
+           COALESCE(SUM(pa.comments), 0)
+    FROM scheduled_posts sp JOIN post_analytics pa ON pa.scheduled_post_id = sp.id
+    WHERE sp.posted_at >= :start AND sp.posted_at < :end
+    GROUP BY 1, 2
+""")
+
+_DELETE_ORDERS_SQL = text("DELETE FROM daily_order_stats WHERE day >= :start_day AND day < :end_day")
+_DELETE_POSTS_SQL = text("DELETE FROM daily_post_stats WHERE day >= :start_day AND day < :end_day")
+
+# Пересчёты одних и тех же дней не должны пересекаться (DELETE + INSERT
+# в параллельных транзакциях дали бы конфликт первичного ключа)
+_LOCK_SQL = text("SELECT pg_advisory_xact_lock(7351011)")
+
+_BOUNDS_SQL = text("""
+    SELECT
+        (SELECT EXISTS (SELECT 1 FROM daily_order_stats)) AS orders_filled,
+        (SELECT EXISTS (SELECT 1 FROM daily_post_stats)) AS posts_filled,
+        (SELECT MIN(LEAST(created_at, COALESCE(paid_at, created_at))) FROM orders) AS first_order,
+        (SELECT MIN(posted_at) FROM scheduled_posts) AS first_post
+""")
+
+
+def day_ranges(days: Iterable[date]) -> list[tuple[date, date]]:
+    """Склеить дни в непрерывные диапазоны [start, end)."""
+    ranges: list[tuple[date, date]] = []
+    for day in sorted(set(days)):
+        if ranges and ranges[-1][1] == day:
+            ranges[-1] = (ranges[-1][0], day + timedelta(days=1))
+        else:
+            ranges.append((day, day + timedelta(days=1)))
+    return ranges
+
+
+def _range_params(start_day: date, end_day: date) -> dict:
+    return {
+        "start_day": start_day,
+        "end_day": end_day,
+        "start": datetime.combine(start_day, time.min),
+        "end": datetime.combine(end_day, time.min),
+    }
+
+
+async def refresh_order_days(session, start_day: date, end_day: date) -> None:
+    """Пересчитать daily_order_stats за дни [start_day, end_day) (без commit)."""
+    params = _range_params(start_day, end_day)
+    await session.execute(_DELETE_ORDERS_SQL, params)
+    await session.execute(_REFRESH_ORDERS_SQL, params)
+
+
+async def refresh_post_days(session, start_day: date, end_day: date) -> None:
+    """Пересчитать daily_post_stats за дни [start_day, end_day) (без commit)."""
+    params = _range_params(start_day, end_day)
+    await session.execute(_DELETE_POSTS_SQL, params)
+    await session.execute(_REFRESH_POSTS_SQL, params)
+
+
+class RollupRefresher:
+    """Очередь «грязных» дней + фоновый пересчёт сводок."""
+
+    def __init__(self, flush_delay: float = ROLLUP_FLUSH_SECONDS):
+        self.flush_delay = flush_delay
+        self._order_days: set[date] = set()
+        self._post_days: set[date] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # ─── Отметка изменений ───────────────────────────────────────────────────
+
+    def mark_order(self, created_at: Optional[datetime], paid_at: Optional[datetime] = None) -> None:
+        """Отметить изменение заказа (UTC).
+
+        Оплата учитывается в дне ``paid_at``, а у подтверждённых заказов без
+        ``paid_at`` — в дне ``created_at``, как и в ``_REFRESH_ORDERS_SQL``.
+        """
+        self._mark(self._order_days, (created_at, paid_at or created_at))
+
+    def mark_post(self, posted_at: Optional[datetime]) -> None:
+        """Отметить изменение аналитики поста, опубликованного в ``posted_at`` (UTC)."""
+        self._mark(self._post_days, (posted_at,))
+
+    def _mark(self, target: set, moments) -> None:
+        added = False
+        for moment in moments:
+            if moment is not None:
+                target.add(moment.date() if isinstance(moment, datetime) else moment)
+                added = True
+        if added:
+            self._wakeup.set()
+
+    # ─── Пересчёт ────────────────────────────────────────────────────────────
+
+    async def flush(self) -> None:
+        """Пересчитать все отмеченные дни."""
+        order_days, self._order_days = self._order_days, set()
+        post_days, self._post_days = self._post_days, set()
+        if not order_days and not post_days:
+            return
+        try:
+            async with async_session_maker() as session:
+                await session.execute(_LOCK_SQL)
+                for start_day, end_day in day_ranges(order_days):
+                    await refresh_order_days(session, start_day, end_day)
+                for start_day, end_day in day_ranges(post_days):
+                    await refresh_post_days(session, start_day, end_day)
+                await session.commit()
+        except Exception:
+            # Вернём дни в очередь — пересчитаем при следующей попытке
+            self._order_days |= order_days
+            self._post_days |= post_days
+            raise
+        # Кэш метрик мог успеть заполниться по старым сводкам
+        if order_days:
+            invalidate_metrics(TAG_ORDERS)
+        if post_days:
+            invalidate_metrics(TAG_ANALYTICS)
+        logger.debug(f"Сводки пересчитаны: заказы {len(order_days)} дн., посты {len(post_days)} дн.")
+
+    async def rebuild(self, start_day: Optional[date] = None, end_day: Optional[date] = None) -> None:
+        """Полностью пересчитать сводки за [start_day, end_day) (по умолчанию — по сегодня)."""
+        end_day = end_day or (utc_now().date() + timedelta(days=1))
+        async with async_session_maker() as session:
+            if start_day is None:
+                bounds = (await session.execute(_BOUNDS_SQL)).one()
+                order_start = bounds.first_order.date() if bounds.first_order else end_day
+                post_start = bounds.first_post.date() if bounds.first_post else end_day
+            else:
+                order_start = post_start = start_day
+            await session.execute(_LOCK_SQL)
+            await refresh_order_days(session, order_start, end_day)
+            await refresh_post_days(session, post_start, end_day)
+            await session.commit()
+        invalidate_metrics(TAG_ORDERS, TAG_ANALYTICS)
+
+    async def refresh_recent(self, days: int = 2) -> None:
+        """Страховочный пересчёт последних ``days`` дней (задача планировщика)."""
+        try:
+            today = utc_now().date()
+            await self.rebuild(today - timedelta(days=days - 1), today + timedelta(days=1))
+        except Exception:
+            logger.error(f"Ошибка пересчёта дневных сводок: {traceback.format_exc()}")
+
+    async def backfill_if_empty(self) -> None:
+        """Заполнить сводки по всей истории, если таблицы пусты (первый запуск)."""
+        try:
+            async with async_session_maker() as session:
+                bounds = (await session.execute(_BOUNDS_SQL)).one()
+            if bounds.orders_filled or bounds.posts_filled:
+                return
+            if bounds.first_order is None and bounds.first_post is None:
+                return
+            logger.info("Дневные сводки пусты — пересчёт по всей истории")
+            await self.rebuild()
+        except Exception:
+            logger.error(f"Ошибка заполнения дневных сводок: {traceback.format_exc()}")
+
+    # ─── Жизненный цикл ──────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        """Запустить фоновый пересчёт отмеченных дней."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить фоновую задачу, пересчитав оставшиеся дни."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.error(f"Ошибка пересчёта сводок при остановке: {traceback.format_exc()}")
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            # Даём накопиться изменениям, чтобы пересчитать день один раз
+            await asyncio.sleep(self.flush_delay)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.error(f"Ошибка пересчёта дневных сводок: {traceback.format_exc()}")
+                await asyncio.sleep(self.flush_delay or 1)
+                self._wakeup.set()
+
+
+# Глобальный экземпляр пересчёта сводок
+rollup_refresher = RollupRefresher()
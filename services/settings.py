@@ -4,11 +4,23 @@
 Настройки хранятся в таблице bot_settings (key-value).
 При чтении в первую очередь используется значение из БД;
 если оно не задано, применяется значение из переменной окружения / config.py.
+
+Таблица маленькая, а читается на горячих путях (публикация, кросспостинг),
+поэтому все строки держатся в памяти (settings_cache): загружаются при старте,
+обновляются в set_setting и перечитываются раз в SETTINGS_CACHE_TTL_SECONDS.
+set_setting отправляет NOTIFY bot_settings_changed; при SETTINGS_LISTEN_NOTIFY
+другие экземпляры бота перечитывают кэш сразу.
 """
+import asyncio
 import logging
+import time
+import traceback
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Optional
+
+from sqlalchemy import select, text
 
+from config import SETTINGS_CACHE_TTL_SECONDS, SETTINGS_LISTEN_NOTIFY
 from database import async_session_maker, BotSetting
 from utils.helpers import utc_now
 
@@ -21,13 +33,120 @@ CROSSPOST_ENABLED_KEY = "crosspost_enabled"
 CROSSPOST_DAILY_LIMIT_KEY = "crosspost_daily_limit"
 MAX_CROSSPOST_CHAT_ID_KEY = "max_crosspost_chat_id"
 
+# Канал LISTEN/NOTIFY об изменении настроек (payload — ключ)
+SETTINGS_NOTIFY_CHANNEL = "bot_settings_changed"
+
+
+class SettingsCache:
+    """Копия таблицы bot_settings в памяти."""
+
+    def __init__(self, ttl: float = SETTINGS_CACHE_TTL_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._values: dict[str, Optional[str]] = {}
+        self._expires_at = 0.0
+        # Увеличивается при каждом изменении: загрузка, начатая до него,
+        # не должна считаться свежей
+        self._generation = 0
+        self._loading: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def is_fresh(self) -> bool:
+        return self._expires_at > self._clock()
+
+    async def load(self) -> None:
+        """Перечитать все настройки из БД (одновременные вызовы ждут один запрос)."""
+        if self._loading is None or self._loading.done():
+            self._loading = asyncio.ensure_future(self._load(self._generation))
+        await asyncio.shield(self._loading)
+
+    async def _load(self, generation: int) -> None:
+        async with async_session_maker() as session:
+            rows = (await session.execute(select(BotSetting.key, BotSetting.value))).all()
+        if generation != self._generation:
+            # Пока читали, настройку изменили: прочитанное может быть
+            # устаревшим — перечитаем при следующем обращении
+            return
+        self._values = {key: value for key, value in rows}
+        self._expires_at = self._clock() + self.ttl
+
+    async def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        if not self.is_fresh():
+            await self.load()
+        return self._values[key] if key in self._values else default
+
+    def put(self, key: str, value: Optional[str]) -> None:
+        """Применить изменение, уже записанное в БД."""
+        self._generation += 1
+        self._values[key] = value
+
+    def invalidate(self) -> None:
+        """Перечитать настройки при следующем обращении."""
+        self._generation += 1
+        self._expires_at = 0.0
+
+    # ─── LISTEN/NOTIFY ───────────────────────────────────────────────────────
+
+    def start_listener(self) -> None:
+        """Слушать уведомления об изменениях настроек с других экземпляров бота."""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop_listener(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        logger.debug(f"Настройка '{payload}' изменена другим экземпляром — перечитываем кэш")
+        self.invalidate()
+
+    async def _listen(self) -> None:
+        from database.session import engine
+
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    raw = await conn.get_raw_connection()
+                    driver_conn = raw.driver_connection
+                    await driver_conn.add_listener(SETTINGS_NOTIFY_CHANNEL, self._on_notify)
+                    # Пока слушали не мы — могли пропустить изменения
+                    self.invalidate()
+                    try:
+                        while not driver_conn.is_closed():
+                            await asyncio.sleep(30)
+                    finally:
+                        if not driver_conn.is_closed():
+                            await driver_conn.remove_listener(SETTINGS_NOTIFY_CHANNEL, self._on_notify)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.error(f"Ошибка LISTEN {SETTINGS_NOTIFY_CHANNEL}: {traceback.format_exc()}")
+            await asyncio.sleep(5)
+
+
+# Глобальный кэш настроек
+settings_cache = SettingsCache()
+
+
+async def start_settings_cache() -> None:
+    """Загрузить настройки при старте и, если включено, подписаться на изменения."""
+    try:
+        await settings_cache.load()
+    except Exception as e:
+        logger.error(f"Ошибка загрузки настроек: {e}")
+    if SETTINGS_LISTEN_NOTIFY:
+        settings_cache.start_listener()
+
 
 async def get_setting(key: str, default: Optional[str] = None) -> Optional[str]:
-    """Получить значение настройки по ключу."""
+    """Получить значение настройки по ключу (из памяти)."""
     try:
-        async with async_session_maker() as session:
-            row = await session.get(BotSetting, key)
-            return row.value if row else default
+        return await settings_cache.get(key, default)
     except Exception as e:
         logger.error(f"Ошибка чтения настройки '{key}': {e}")
         return default
@@ -49,8 +168,15 @@ async def set_setting(key: str, value: Optional[str], updated_by: Optional[int]
                     updated_at=utc_now(),
                     updated_by=updated_by,
                 ))
+            # Уведомление доставляется другим экземплярам после commit
+            await session.execute(
+                text("SELECT pg_notify(:channel, :key)"),
+                {"channel": SETTINGS_NOTIFY_CHANNEL, "key": key},
+            )
             await session.commit()
+        settings_cache.put(key, value)
     except Exception as e:
+        settings_cache.invalidate()
         logger.error(f"Ошибка сохранения настройки '{key}': {e}")
 
 
@@ -0,0 +1,196 @@
+"""
+Поэтапный запуск бота.
+
+На критическом пути остаётся только то, без чего нельзя отвечать
+пользователям: подключение к БД (со схемой) и настройки. Сразу после этого
+запускается polling. Остальная подготовка идёт фоновыми этапами
+(``StartupTracker.background``): сброс застрявших постов, индексы, рассылка
+и т.п. Каждый этап пишет в лог свою длительность. По завершении всех этапов
+в лог выводится сводка со временем запуска и пиковой памятью.
+
+``ImportProfiler`` (включается STARTUP_IMPORT_PROFILE) показывает, какие
+модули дольше всего импортируются при запуске.
+"""
+import asyncio
+import builtins
+import importlib.util
+import logging
+import sys
+import time
+import traceback
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
+
+try:
+    import resource
+except ImportError:  # нет на Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def peak_memory_mb() -> Optional[float]:
+    """Пиковый объём памяти процесса (RSS) в МБ, если платформа его сообщает."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux сообщает в КБ, macOS — в байтах
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class ImportProfiler:
+    """Время импорта модулей, как ``python -X importtime``, но в логе бота.
+
+    Перехватывает ``builtins.__import__`` и для каждого ещё не загруженного
+    модуля запоминает полное время импорта (с вложенными) и собственное
+    (без вложенных импортов). Подмодули, которые импортирует сам importlib
+    (``from pkg import submodule``), учитываются в модуле, который их запросил.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self._clock = clock
+        self.cumulative: dict[str, float] = {}
+        self.self_time: dict[str, float] = {}
+        self.total = 0.0  # время импортов верхнего уровня (без двойного счёта)
+        self._stack: list[list] = []  # [имя, начало, время вложенных импортов]
+        self._original = None
+
+    def install(self) -> "ImportProfiler":
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._import
+        return self
+
+    def uninstall(self) -> None:
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module = name
+        if level:
+            try:
+                module = importlib.util.resolve_name("." * level + name, (globals or {}).get("__package__"))
+            except (ImportError, ValueError):
+                module = None
+        if module is None or module in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+
+        frame = [module, self._clock(), 0.0]
+        self._stack.append(frame)
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            self._stack.pop()
+            elapsed = self._clock() - frame[1]
+            self.cumulative[module] = self.cumulative.get(module, 0.0) + elapsed
+            self.self_time[module] = self.self_time.get(module, 0.0) + elapsed - frame[2]
+            if self._stack:
+                self._stack[-1][2] += elapsed
+            else:
+                self.total += elapsed
+
+    def slowest(self, top: int = 20) -> list[tuple[str, float, float]]:
+        """Самые долгие по собственному времени: (модуль, полное, собственное)."""
+        names = sorted(self.self_time, key=self.self_time.get, reverse=True)[:top]
+        return [(name, self.cumulative[name], self.self_time[name]) for name in names]
+
+    def report(self, top: int = 20) -> str:
+        lines = [f"Импорт модулей: {len(self.cumulative)} шт.; самые долгие (собственное / полное время):"]
+        lines += [
+            f"  {own:6.3f} с / {full:6.3f} с  {name}"
+            for name, full, own in self.slowest(top)
+        ]
+        lines.append(f"Всего на импорт: {self.total:.2f} с")
+        return "\n".join(lines)
+
+
+class StartupTracker:
+    """Замер этапов запуска и ожидание фоновых этапов.
+
+    ``process_started`` — момент старта процесса (по ``clock``); от него
+    отсчитывается время до готовности принимать обновления.
+    """
+
+    def __init__(self, process_started: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.process_started = clock() if process_started is None else process_started
+        self.timings: dict[str, float] = {}
+        self.failed: list[str] = []
+        self.ready_after: Optional[float] = None
+        self._tasks: list[asyncio.Task] = []
+        self._summary: Optional[asyncio.Task] = None
+
+    def elapsed(self) -> float:
+        """Секунд с момента старта процесса."""
+        return self._clock() - self.process_started
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        """Этап критического пути (выполняется до запуска polling)."""
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.timings[name] = self._clock() - started
+            logger.info(f"Запуск: {name} — {self.timings[name]:.2f} с")
+
+    def background(self, name: str, work: Awaitable) -> asyncio.Task:
+        """Выполнить этап в фоне; ошибка этапа логируется и не мешает остальным."""
+        async def run() -> None:
+            started = self._clock()
+            try:
+                await work
+            except Exception:
+                self.failed.append(name)
+                logger.error(f"Запуск (фон): ошибка этапа «{name}»: {traceback.format_exc()}")
+            finally:
+                self.timings[name] = self._clock() - started
+                done = sum(task.done() for task in self._tasks) + 1
+                logger.info(
+                    f"Запуск (фон): {name} — {self.timings[name]:.2f} с "
+                    f"[{done}/{len(self._tasks)}]"
+                )
+
+        task = asyncio.create_task(run())
+        self._tasks.append(task)
+        return task
+
+    def mark_ready(self) -> float:
+        """Критический путь пройден; вернуть время от старта процесса (секунд)."""
+        self.ready_after = self.elapsed()
+        logger.info(f"Бот готов принимать обновления через {self.ready_after:.2f} с после старта процесса")
+        return self.ready_after
+
+    def pending(self) -> int:
+        """Сколько фоновых этапов ещё выполняется."""
+        return sum(not task.done() for task in self._tasks)
+
+    async def wait_background(self) -> float:
+        """Дождаться фоновых этапов, записать сводку в лог; вернуть полное время запуска."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        total = self.elapsed()
+        memory = peak_memory_mb()
+        slowest = sorted(self.timings.items(), key=lambda item: item[1], reverse=True)[:3]
+        logger.info(
+            f"Запуск завершён за {total:.2f} с (готов к обновлениям через "
+            f"{(self.ready_after or 0):.2f} с); дольше всего: "
+            + ", ".join(f"{name} {seconds:.2f} с" for name, seconds in slowest)
+            + (f"; с ошибками: {', '.join(self.failed)}" if self.failed else "")
+            + (f"; пиковая память {memory:.0f} МБ" if memory is not None else "")
+        )
+        return total
+
+    def summarize_in_background(self) -> asyncio.Task:
+        """Запустить wait_background фоновой задачей (её отменяет ``stop``)."""
+        if self._summary is None:
+            self._summary = asyncio.create_task(self.wait_background())
+        return self._summary
+
+    async def stop(self) -> None:
+        """Отменить незавершённые фоновые этапы и сводку (при остановке бота)."""
+        tasks = [task for task in (*self._tasks, self._summary) if task is not None and not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,82 +1,169 @@
 """
 Сервис для работы с Telemetr API
+
+Все запросы идут через одну долгоживущую aiohttp-сессию (keep-alive, не
+больше TELEMETR_MAX_CONNECTIONS соединений) и общий темп TELEMETR_RATE
+запросов в секунду. Ответ 426 (квота исчерпана) приостанавливает все запросы
+на TELEMETR_QUOTA_BACKOFF_SECONDS с удвоением при повторах.
+
+Кэши:
+ - internal_id канала (resolve_telegram_id / search_channel) не меняется —
+   хранится до перезапуска;
+ - статистика канала (get_channel_stats) — TELEMETR_STATS_TTL_SECONDS.
 """
 import logging
-from typing import Optional
+import time
+from typing import Callable, Optional
 import aiohttp
 
-from config import TELEMETR_API_TOKEN, TELEMETR_API_URL
+from config import (
+    TELEMETR_API_TOKEN, TELEMETR_API_URL, TELEMETR_MAX_CONNECTIONS, TELEMETR_RATE,
+    TELEMETR_STATS_TTL_SECONDS, TELEMETR_QUOTA_BACKOFF_SECONDS, TELEMETR_QUOTA_BACKOFF_MAX_SECONDS,
+)
+from services.rate_limiter import TokenBucket
 
 
 logger = logging.getLogger(__name__)
 
+# Предел числа закэшированных internal_id / результатов поиска / статистики
+MAX_ID_CACHE = 10_000
+
 
 class TelemetrService:
     """Сервис для получения аналитики каналов через Telemetr API"""
-    
-    def __init__(self, api_token: str = TELEMETR_API_TOKEN):
+
+    def __init__(self, api_token: str = TELEMETR_API_TOKEN, clock: Callable[[], float] = time.monotonic):
         self.api_token = api_token
         self.base_url = TELEMETR_API_URL
-    
+        self._clock = clock
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._bucket = TokenBucket(TELEMETR_RATE, max(1.0, TELEMETR_RATE), clock=clock)
+        # Глобальная пауза после 426
+        self._blocked_until = 0.0
+        self._backoff = TELEMETR_QUOTA_BACKOFF_SECONDS
+        # telegram_id → internal_id, username → найденный канал
+        self._resolved: dict[int, str] = {}
+        self._searched: dict[str, dict] = {}
+        # internal_id → (истекает в, статистика)
+        self.stats_ttl = TELEMETR_STATS_TTL_SECONDS
+        self._stats: dict[str, tuple[float, dict]] = {}
+        # Число запросов к API (расход квоты)
+        self.requests_made = 0
+        self.quota_hits = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=TELEMETR_MAX_CONNECTIONS, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=30),
+                headers={
+                    "x-api-key": self.api_token,
+                    "accept": "application/json",
+                },
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Закрыть HTTP-сессию (при остановке бота)."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def quota_blocked_for(self) -> float:
+        """Сколько секунд ещё действует пауза после 426 (0 — запросы разрешены)."""
+        return max(0.0, self._blocked_until - self._clock())
+
+    def _on_quota_exceeded(self) -> None:
+        self.quota_hits += 1
+        self._blocked_until = self._clock() + self._backoff
+        logger.warning(f"Telemetr API quota reached — запросы приостановлены на {self._backoff:.0f} с")
+        self._backoff = min(self._backoff * 2, TELEMETR_QUOTA_BACKOFF_MAX_SECONDS)
+
     async def _request(self, endpoint: str, params: dict = None) -> Optional[dict]:
         """Выполнить запрос к API"""
         if not self.api_token:
             logger.warning("Telemetr API token not configured")
             return None
-        
+        if self.quota_blocked_for() > 0:
+            logger.debug(f"Telemetr API: квота исчерпана, запрос {endpoint} пропущен")
+            return None
+
         try:
-            headers = {
-                "x-api-key": self.api_token,
-                "accept": "application/json"
-            }
-            
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(
-                    f"{self.base_url}{endpoint}",
-                    headers=headers,
-                    params=params
-                ) as resp:
-                    if resp.status == 200:
-                        return await resp.json()
-                    elif resp.status == 426:
-                        logger.warning("Telemetr API quota reached")
-                    else:
-                        logger.error(f"Telemetr API error: {resp.status}")
-                    return None
+            await self._bucket.acquire()
+            self.requests_made += 1
+            async with self._get_session().get(f"{self.base_url}{endpoint}", params=params) as resp:
+                if resp.status == 200:
+                    self._backoff = TELEMETR_QUOTA_BACKOFF_SECONDS
+                    return await resp.json()
+                elif resp.status == 426:
+                    self._on_quota_exceeded()
+                else:
+                    logger.error(f"Telemetr API error: {resp.status}")
+                return None
         except Exception as e:
             logger.error(f"Telemetr API request failed: {e}")
             return None
-    
+
     async def resolve_telegram_id(self, telegram_id: int) -> Optional[str]:
         """Конвертировать Telegram ID в internal_id Telemetr"""
+        cached = self._resolved.get(telegram_id)
+        if cached is not None:
+            return cached
+
         clean_id = abs(telegram_id)
         if clean_id > 1000000000000:
             clean_id = clean_id - 1000000000000
-        
+
         data = await self._request("/v1/utils/resolve_telegram_id", {"telegram_id": clean_id})
         if data and "internal_id" in data:
+            if len(self._resolved) >= MAX_ID_CACHE:
+                self._resolved.clear()
+            self._resolved[telegram_id] = data["internal_id"]
             return data["internal_id"]
         return None
-    
+
     async def search_channel(self, username: str) -> Optional[dict]:
         """Найти канал по username"""
-        data = await self._request("/v1/channels/search", {"term": username.lstrip("@"), "limit": 1})
+        term = username.lstrip("@")
+        cached = self._searched.get(term.lower())
+        if cached is not None:
+            return cached
+
+        data = await self._request("/v1/channels/search", {"term": term, "limit": 1})
         if data and isinstance(data, list) and len(data) > 0:
+            if len(self._searched) >= MAX_ID_CACHE:
+                self._searched.clear()
+            self._searched[term.lower()] = data[0]
             return data[0]
         return None
-    
+
     async def get_channel_stats(self, internal_id: str) -> Optional[dict]:
-        """Получить статистику канала по internal_id"""
+        """Получить статистику канала по internal_id (с кэшем на TELEMETR_STATS_TTL_SECONDS)"""
+        cached = self._stats.get(internal_id)
+        if cached is not None and cached[0] > self._clock():
+            return cached[1]
+
         data = await self._request("/v1/channel/stats", {"internal_id": internal_id})
         if data and isinstance(data, list) and len(data) > 0:
-            return data[0]
+            data = data[0]
+        if data is not None and self.stats_ttl > 0:
+            if len(self._stats) >= MAX_ID_CACHE:
+                self._stats.clear()
+            self._stats[internal_id] = (self._clock() + self.stats_ttl, data)
         return data
-    
-    async def get_full_stats(self, telegram_id: int = None, username: str = None) -> Optional[dict]:
+
+    async def get_full_stats(
+        self,
+        telegram_id: int = None,
+        username: str = None,
+        internal_id: str = None,
+    ) -> Optional[dict]:
         """
         Получить полную статистику канала.
-        
+
+        Если ``internal_id`` уже известен (сохранён в Channel.telemetr_id),
+        канал не ищется в Telemetr повторно.
+
         Возвращает:
         {
             "internal_id": "xxx",
@@ -88,26 +175,24 @@ class TelemetrService:
             "title": "Название канала"
         }
         """
-        internal_id = None
-        
-        if telegram_id:
+        if not internal_id and telegram_id:
             internal_id = await self.resolve_telegram_id(telegram_id)
-        
+
         if not internal_id and username:
             channel = await self.search_channel(username)
             if channel:
                 internal_id = channel.get("internal_id")
-        
+
         if not internal_id:
             logger.warning(f"Could not find channel in Telemetr: tg_id={telegram_id}, username={username}")
             return None
-        
+
         stats = await self.get_channel_stats(internal_id)
         if not stats:
             return None
-        
+
         avg_post_views = stats.get("avg_post_views", {})
-        
+
         return {
             "internal_id": internal_id,
             "title": stats.get("title", ""),
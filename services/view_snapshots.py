@@ -0,0 +1,155 @@
+"""
+Хранение и чтение снимков просмотров постов (post_view_snapshots).
+
+Таблица секционирована по месяцам recorded_at, и её размер ограничен
+прореживанием:
+ - за последние SNAPSHOT_HOURLY_DAYS дней остаётся не больше одной точки
+   в час на пост (последняя в часе);
+ - для более старых данных — одна точка в день.
+Просмотры только растут, поэтому последняя точка интервала — его максимум.
+
+Ежедневная задача ``maintain_view_snapshots`` создаёт секции на месяцы
+вперёд и прореживает снимки: в первый раз — за всю историю (в том числе
+перенесённую из старой таблицы), затем — только последние
+COMPACT_LOOKBACK_DAYS дней дневной зоны. Читатели получают ряды (время, просмотры) через
+``fetch_view_series``, а не ORM-объекты.
+"""
+import bisect
+import logging
+import traceback
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from config import SNAPSHOT_HOURLY_DAYS
+from database import async_session_maker
+from database.models import PostViewSnapshot
+from services.settings import get_setting, set_setting
+from utils.helpers import utc_now
+
+logger = logging.getLogger(__name__)
+
+# Ряд просмотров поста: [(recorded_at, views), ...] по возрастанию времени
+ViewSeries = list[tuple[datetime, int]]
+
+# На сколько месяцев вперёд держать готовые секции
+PARTITION_MONTHS_AHEAD = 2
+# Сколько дней дневной зоны просматривать при прореживании: более старые
+# данные уже прорежены предыдущими запусками
+COMPACT_LOOKBACK_DAYS = 31
+# Отметка в bot_settings: полное прореживание всей истории уже выполнено
+FULL_COMPACTION_DONE_KEY = "view_snapshots_full_compaction_done"
+# Нижняя граница полного прореживания (раньше снимков нет)
+_HISTORY_START = datetime(1970, 1, 1)
+
+# Функция создаётся миграцией v5 (database/migrations.py)
+_ENSURE_PARTITIONS_SQL = text("SELECT ensure_post_view_snapshot_partitions(:from_ts, :to_ts)")
+
+# Оставляем последнюю точку в каждом часе (в часовой зоне) или дне (в дневной)
+_COMPACT_SQL = text("""
+    DELETE FROM post_view_snapshots s
+    USING (
+        SELECT scheduled_post_id, recorded_at,
+               ROW_NUMBER() OVER (
+                   PARTITION BY scheduled_post_id,
+                                date_trunc(CASE WHEN recorded_at < :daily_before THEN 'day' ELSE 'hour' END,
+                                           recorded_at)
+                   ORDER BY recorded_at DESC
+               ) AS rn
+        FROM post_view_snapshots
+        WHERE recorded_at >= :since AND recorded_at < :hourly_before
+    ) d
+    WHERE d.rn > 1
+      AND s.scheduled_post_id = d.scheduled_post_id
+      AND s.recorded_at = d.recorded_at
+""")
+
+
+async def fetch_view_series(session, post_ids: Iterable[int]) -> dict[int, ViewSeries]:
+    """Ряды просмотров для постов: {post_id: [(recorded_at, views), ...]}.
+
+    Одна строка на пост (array_agg), без загрузки ORM-объектов.
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return {}
+    order = PostViewSnapshot.recorded_at
+    rows = (await session.execute(
+        select(
+            PostViewSnapshot.scheduled_post_id,
+            func.array_agg(aggregate_order_by(PostViewSnapshot.recorded_at, order)),
+            func.array_agg(aggregate_order_by(PostViewSnapshot.views, order)),
+        )
+        .where(PostViewSnapshot.scheduled_post_id.in_(post_ids))
+        .group_by(PostViewSnapshot.scheduled_post_id)
+    )).all()
+    return {
+        post_id: list(zip(times, (views or 0 for views in counts)))
+        for post_id, times, counts in rows
+    }
+
+
+def views_at(series: ViewSeries, moment: datetime) -> Optional[int]:
+    """Просмотры в последней точке ряда не позже ``moment`` (None — точек нет)."""
+    index = bisect.bisect_right(series, moment, key=lambda point: point[0])
+    return series[index - 1][1] if index else None
+
+
+def _month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+async def ensure_partitions(now: Optional[datetime] = None) -> int:
+    """Создать секции с текущего месяца на PARTITION_MONTHS_AHEAD вперёд."""
+    now = now or utc_now()
+    to_ts = _month_start(now)
+    for _ in range(PARTITION_MONTHS_AHEAD):
+        to_ts = _month_start(to_ts + timedelta(days=32))
+    async with async_session_maker() as session:
+        created = (await session.execute(
+            _ENSURE_PARTITIONS_SQL, {"from_ts": _month_start(now), "to_ts": to_ts}
+        )).scalar() or 0
+        await session.commit()
+    if created:
+        logger.info(f"post_view_snapshots: создано секций — {created}")
+    return created
+
+
+def compaction_bounds(now: datetime, hourly_days: int = SNAPSHOT_HOURLY_DAYS, full: bool = False) -> dict:
+    """Границы прореживания: часовая зона [daily_before, hourly_before), дневная — до daily_before.
+
+    ``full`` — дневная зона целиком, а не только последние COMPACT_LOOKBACK_DAYS дней.
+    """
+    hourly_before = now.replace(minute=0, second=0, microsecond=0)
+    daily_before = (now - timedelta(days=hourly_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        "since": _HISTORY_START if full else daily_before - timedelta(days=COMPACT_LOOKBACK_DAYS),
+        "daily_before": daily_before,
+        "hourly_before": hourly_before,
+    }
+
+
+async def compact_snapshots(now: Optional[datetime] = None, full: bool = False) -> int:
+    """Проредить снимки (``full`` — за всю историю); вернуть число удалённых строк."""
+    params = compaction_bounds(now or utc_now(), full=full)
+    async with async_session_maker() as session:
+        result = await session.execute(_COMPACT_SQL, params)
+        await session.commit()
+    removed = result.rowcount or 0
+    if removed:
+        logger.info(f"post_view_snapshots: прорежено снимков — {removed}")
+    return removed
+
+
+async def maintain_view_snapshots() -> None:
+    """Задача планировщика: секции на будущие месяцы + прореживание."""
+    try:
+        await ensure_partitions()
+        full = await get_setting(FULL_COMPACTION_DONE_KEY) is None
+        await compact_snapshots(full=full)
+        if full:
+            await set_setting(FULL_COMPACTION_DONE_KEY, utc_now().isoformat())
+    except Exception:
+        logger.error(f"Ошибка обслуживания post_view_snapshots: {traceback.format_exc()}")
@@ -0,0 +1,135 @@
+"""
+Unit tests for services/ad_index.py
+
+No database connection is opened:
+  - lookup: known ad posts resolved, organic posts and unknown channels ignored
+  - add_post / remove_post: the index follows publication and deletion
+  - reload: rebuilt from the database, previous content replaced,
+    add_post / remove_post made while the query runs are kept
+"""
+import sys
+import os
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+import services.ad_index as ad_index_module
+from services.ad_index import AdMessageIndex, AdPost
+
+
+class _FakeSession:
+    def __init__(self, results, during_query=None):
+        self.results = list(results)
+        self.during_query = during_query
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params=None):
+        if self.during_query is not None:
+            self.during_query()
+            self.during_query = None
+        result = MagicMock()
+        result.all.return_value = self.results.pop(0)
+        return result
+
+
+def _row(**fields):
+    row = MagicMock()
+    for name, value in fields.items():
+        setattr(row, name, value)
+    return row
+
+
+# ─── lookup ───────────────────────────────────────────────────────────────────
+
+class TestLookup:
+    def test_known_post(self):
+        index = AdMessageIndex()
+        posted_at = datetime(2024, 1, 1, 12)
+        index.add_post(11, 7, -100, 5, order_id=3, posted_at=posted_at)
+        assert index.lookup(-100, 5) == AdPost(11, 7, 3, posted_at)
+
+    def test_organic_post_in_known_channel(self):
+        index = AdMessageIndex()
+        index.add_post(11, 7, -100, 5)
+        assert index.lookup(-100, 6) is None
+
+    def test_unknown_channel(self):
+        index = AdMessageIndex()
+        index.add_post(11, 7, -100, 5)
+        assert index.lookup(-200, 5) is None
+
+
+# ─── add_post / remove_post ───────────────────────────────────────────────────
+
+class TestAddRemove:
+    def test_remove_post(self):
+        index = AdMessageIndex()
+        index.add_post(11, 7, -100, 5)
+        index.remove_post(7, 5)
+        assert index.lookup(-100, 5) is None
+        assert len(index) == 0
+
+    def test_remove_unknown_is_noop(self):
+        index = AdMessageIndex()
+        index.remove_post(7, 5)
+        index.remove_post(7, None)
+        assert len(index) == 0
+
+
+# ─── reload ───────────────────────────────────────────────────────────────────
+
+class TestReload:
+    @pytest.mark.asyncio
+    async def test_rebuilds_from_database(self):
+        index = AdMessageIndex()
+        index.add_post(99, 1, -1, 1)
+        session = _FakeSession([
+            [_row(id=7, telegram_id=-100)],
+            [_row(id=11, channel_id=7, message_id=5, order_id=None, posted_at=None)],
+        ])
+        with patch.object(ad_index_module, "async_session_maker", lambda: session):
+            await index.reload()
+        assert index.loaded is True
+        assert index.lookup(-100, 5).post_id == 11
+        assert index.lookup(-1, 1) is None
+
+    @pytest.mark.asyncio
+    async def test_failure_keeps_previous_content(self):
+        index = AdMessageIndex()
+        index.add_post(11, 7, -100, 5)
+
+        def broken():
+            raise RuntimeError("db down")
+
+        with patch.object(ad_index_module, "async_session_maker", broken):
+            await index.reload()
+        assert index.loaded is False
+        assert index.lookup(-100, 5) is not None
+
+    @pytest.mark.asyncio
+    async def test_changes_during_query_are_kept(self):
+        index = AdMessageIndex()
+        index.add_post(11, 7, -100, 5)
+
+        def publish_and_delete():
+            # Публикация и удаление, пришедшие, пока reload ждёт БД
+            index.add_post(12, 8, -200, 6)
+            index.remove_post(7, 5)
+
+        session = _FakeSession([
+            [_row(id=7, telegram_id=-100)],
+            [_row(id=11, channel_id=7, message_id=5, order_id=None, posted_at=None)],
+        ], during_query=publish_and_delete)
+        with patch.object(ad_index_module, "async_session_maker", lambda: session):
+            await index.reload()
+        assert index.lookup(-200, 6).post_id == 12
+        assert index.lookup(-100, 5) is None
+        assert index._journals == []
@@ -0,0 +1,193 @@
+"""
+Unit tests for the update broadcast engine in services/broadcast.py
+
+Bot API and database are mocked:
+  - recipients claimed in chunks, each chunk's results written with one UPDATE
+  - a resumed broadcast counts earlier deliveries and sends only the rest
+  - RetryAfter slows the adaptive limiter and the message is retried;
+    users who blocked the bot are marked blocked
+  - sends bounded by BROADCAST_CONCURRENCY
+  - stopping mid-chunk returns unsent recipients to pending
+  - send_update_broadcast starts the engine in the background
+"""
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.dialects import postgresql
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+import services.broadcast as broadcast
+from services.broadcast import BroadcastEngine, _results_statement
+
+
+class _FakeDb:
+    """Курсор рассылки: порции на UPDATE … RETURNING, итоги — в ``results``."""
+
+    def __init__(self, chunks=(), counts=None):
+        self.chunks = [list(c) for c in chunks]
+        self.counts = counts or {}
+        self.results: dict[int, str] = {}
+        self.statements = []
+
+    def session(self):
+        return _FakeSession(self)
+
+    def results_statement(self, version, rows, now):
+        self.results.update({telegram_id: status for telegram_id, status, _ in rows})
+        return _results_statement(version, rows, now)
+
+
+class _FakeSession:
+    def __init__(self, db):
+        self.db = db
+        self.commit = AsyncMock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params=None):
+        compiled = statement.compile(dialect=postgresql.dialect())
+        sql = str(compiled)
+        self.db.statements.append(sql)
+        result = MagicMock()
+        if "GROUP BY broadcast_deliveries.status" in sql:
+            result.all.return_value = list(self.db.counts.items())
+        elif "RETURNING broadcast_deliveries.telegram_id" in sql:
+            result.scalars.return_value.all.return_value = self.db.chunks.pop(0) if self.db.chunks else []
+        elif sql.startswith("SELECT count(*)"):
+            result.scalar_one.return_value = 0
+        return result
+
+
+def _bot(side_effect=None):
+    bot = MagicMock()
+    bot.send_message = AsyncMock(side_effect=side_effect)
+    return bot
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limit():
+    with patch.object(broadcast.telegram_rate_limiter, "acquire_global", new=AsyncMock()), \
+         patch.object(broadcast, "set_setting", new=AsyncMock()) as set_setting, \
+         patch.object(broadcast.notification_dispatcher, "notify_admins"):
+        yield set_setting
+
+
+async def _run(db, bot, engine=None):
+    engine = engine or BroadcastEngine(concurrency=4, chunk_size=3, rate=1000)
+    with patch.object(broadcast, "async_session_maker", db.session), \
+         patch.object(broadcast, "_results_statement", db.results_statement):
+        progress = await engine.run(bot, "2.0", "notes")
+    return engine, progress
+
+
+# ─── BroadcastEngine.run ──────────────────────────────────────────────────────
+
+class TestBroadcastRun:
+    @pytest.mark.asyncio
+    async def test_all_recipients_sent_and_version_saved(self, no_rate_limit):
+        db = _FakeDb(chunks=[[1, 2, 3], [4, 5]], counts={"pending": 5})
+        bot = _bot()
+        _, progress = await _run(db, bot)
+        assert bot.send_message.await_count == 5
+        assert db.results == {i: "sent" for i in range(1, 6)}
+        assert len([s for s in db.statements if "AS outcome" in s]) == 2
+        assert progress.sent == 5 and progress.total == 5
+        no_rate_limit.assert_awaited_once_with(broadcast.LAST_BROADCAST_VERSION_KEY, "2.0")
+        assert any(s.startswith("DELETE FROM broadcast_deliveries") for s in db.statements)
+
+    @pytest.mark.asyncio
+    async def test_resume_counts_earlier_deliveries(self):
+        db = _FakeDb(chunks=[[9]], counts={"sent": 7, "blocked": 1, "pending": 1})
+        bot = _bot()
+        _, progress = await _run(db, bot)
+        assert bot.send_message.await_count == 1
+        assert progress.done == 9
+        assert progress.total == 9
+
+    @pytest.mark.asyncio
+    async def test_retry_after_and_blocked(self):
+        calls = {}
+
+        async def send_message(chat_id, text, parse_mode):
+            calls[chat_id] = calls.get(chat_id, 0) + 1
+            if chat_id == 1 and calls[chat_id] == 1:
+                raise TelegramRetryAfter(method=MagicMock(), message="flood", retry_after=0)
+            if chat_id == 2:
+                raise TelegramForbiddenError(method=MagicMock(), message="blocked")
+
+        bot = MagicMock()
+        bot.send_message = send_message
+        engine = BroadcastEngine(concurrency=1, chunk_size=5, rate=1000)
+        db = _FakeDb(chunks=[[1, 2]], counts={"pending": 2})
+        _, progress = await _run(db, bot, engine)
+        assert db.results == {1: "sent", 2: "blocked"}
+        assert calls[1] == 2
+        assert engine.limiter.rate < 1000
+
+    @pytest.mark.asyncio
+    async def test_concurrency_bounded(self):
+        active = 0
+        peak = 0
+
+        async def send_message(chat_id, text, parse_mode):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+        bot = MagicMock()
+        bot.send_message = send_message
+        engine = BroadcastEngine(concurrency=3, chunk_size=10, rate=1000)
+        db = _FakeDb(chunks=[list(range(1, 11))], counts={"pending": 10})
+        await _run(db, bot, engine)
+        assert peak == 3
+
+
+# ─── Lifecycle ────────────────────────────────────────────────────────────────
+
+class TestBroadcastLifecycle:
+    @pytest.mark.asyncio
+    async def test_stop_returns_unsent_to_pending(self):
+        started = asyncio.Event()
+
+        async def send_message(chat_id, text, parse_mode):
+            if chat_id == 2:
+                started.set()
+                await asyncio.sleep(10)
+
+        bot = MagicMock()
+        bot.send_message = send_message
+        engine = BroadcastEngine(concurrency=1, chunk_size=3, rate=1000)
+        db = _FakeDb(chunks=[[1, 2, 3]], counts={"pending": 3})
+        with patch.object(broadcast, "async_session_maker", db.session), \
+             patch.object(broadcast, "_results_statement", db.results_statement):
+            engine.start(bot, "2.0", "notes")
+            await asyncio.wait_for(started.wait(), timeout=1)
+            await engine.stop()
+        assert db.results == {1: "sent", 2: "pending", 3: "pending"}
+        assert not engine.running
+
+    @pytest.mark.asyncio
+    async def test_send_update_broadcast_does_not_wait(self):
+        with patch.object(broadcast, "get_setting", new=AsyncMock(return_value="0.9")), \
+             patch.object(broadcast.broadcast_engine, "start") as start:
+            await broadcast.send_update_broadcast(MagicMock())
+        start.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_same_version_skipped(self):
+        with patch.object(broadcast, "get_setting", new=AsyncMock(return_value=broadcast.UPDATE_VERSION)), \
+             patch.object(broadcast.broadcast_engine, "start") as start:
+            await broadcast.send_update_broadcast(MagicMock())
+        start.assert_not_called()
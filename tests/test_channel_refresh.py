@@ -0,0 +1,254 @@
+"""
+Unit tests for channel refresh and reach recomputation in services/channel_collector.py
+
+Bot API and database are mocked:
+  - channels are polled concurrently, never above CHANNEL_REFRESH_CONCURRENCY
+  - Telemetr sync: stored ids reused, one UPDATE per run, latency and quota reported
+  - subscribers and reach are written with one bulk UPDATE each
+  - inaccessible channels are skipped, 429 responses retried once
+  - reach / ERR: one UPDATE … FROM over a ROW_NUMBER() window, incremental
+    mode limited to channels with analytics changed since the previous run
+"""
+import sys
+import os
+import asyncio
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.dialects import postgresql
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+import services.channel_collector as collector
+from services.channel_collector import refresh_all_channels
+
+
+def _channel(channel_id):
+    row = MagicMock()
+    row.id = channel_id
+    row.telegram_id = -1000 - channel_id
+    row.name = f"ch{channel_id}"
+    return row
+
+
+class _FakeSession:
+    """Отдаёт каналы на SELECT, строки пересчёта охвата — на оконный UPDATE."""
+
+    def __init__(self, channels=(), analytics=()):
+        self.channels = list(channels)
+        self.analytics = list(analytics)
+        self.statements = []
+        self.commit = AsyncMock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params=None):
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+        self.statements.append(sql)
+        result = MagicMock()
+        if "row_number()" in sql:
+            result.all.return_value = self.analytics
+        elif sql.startswith("SELECT"):
+            result.all.return_value = self.channels
+        else:
+            result.all.return_value = []
+        return result
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limit():
+    with patch.object(collector.telegram_rate_limiter, "acquire_global", new=AsyncMock()):
+        yield
+
+
+def _updates(session):
+    return [sql for sql in session.statements if sql.startswith("UPDATE channels")]
+
+
+# ─── refresh_all_channels ─────────────────────────────────────────────────────
+
+class TestRefreshAllChannels:
+    @pytest.mark.asyncio
+    async def test_concurrency_bounded(self):
+        active = 0
+        peak = 0
+
+        async def member_count(chat_id):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return 100
+
+        bot = MagicMock()
+        bot.get_chat_member_count = member_count
+        session = _FakeSession(channels=[_channel(i) for i in range(1, 13)])
+        with patch.object(collector, "async_session_maker", lambda: session), \
+                patch.object(collector, "CHANNEL_REFRESH_CONCURRENCY", 4):
+            updated = await refresh_all_channels(bot)
+        assert updated == 12
+        assert peak == 4
+
+    @pytest.mark.asyncio
+    async def test_single_bulk_update_per_kind(self):
+        bot = MagicMock()
+        bot.get_chat_member_count = AsyncMock(return_value=500)
+        analytics = [(1, 200, 10.0, 2), (2, 50, 0, 1)]
+        session = _FakeSession(channels=[_channel(1), _channel(2), _channel(3)], analytics=analytics)
+        with patch.object(collector, "async_session_maker", lambda: session):
+            await refresh_all_channels(bot)
+        updates = _updates(session)
+        assert len(updates) == 2
+        assert any("subscribers=fresh.subscribers" in sql for sql in updates)
+        assert any("avg_reach=reach.avg_reach" in sql for sql in updates)
+
+    @pytest.mark.asyncio
+    async def test_inaccessible_channel_skipped(self):
+        async def member_count(chat_id):
+            if chat_id == _channel(2).telegram_id:
+                raise TelegramForbiddenError(method=MagicMock(), message="kicked")
+            return 10
+
+        bot = MagicMock()
+        bot.get_chat_member_count = member_count
+        session = _FakeSession(channels=[_channel(1), _channel(2)])
+        with patch.object(collector, "async_session_maker", lambda: session):
+            assert await refresh_all_channels(bot) == 1
+
+    @pytest.mark.asyncio
+    async def test_retry_after_retried_once(self):
+        bot = MagicMock()
+        bot.get_chat_member_count = AsyncMock(side_effect=[
+            TelegramRetryAfter(method=MagicMock(), message="flood", retry_after=1), 42,
+        ])
+        session = _FakeSession(channels=[_channel(1)])
+        with patch.object(collector, "async_session_maker", lambda: session), \
+                patch.object(collector.asyncio, "sleep", new=AsyncMock()) as sleep:
+            assert await refresh_all_channels(bot) == 1
+        sleep.assert_awaited_once_with(1)
+
+
+# ─── reach / ERR ──────────────────────────────────────────────────────────────
+
+def _sql(statement):
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+class TestReachStatement:
+    def test_single_update_from_window(self):
+        sql = _sql(collector._reach_update_statement())
+        assert sql.startswith("UPDATE channels SET")
+        assert "PARTITION BY post_analytics.channel_id ORDER BY post_analytics.recorded_at DESC" in sql
+        assert "ranked.rn <=" in sql
+        assert "GROUP BY ranked.channel_id" in sql
+        assert "post_analytics_1.recorded_at >" not in sql
+
+    def test_incremental_filters_changed_channels(self):
+        sql = _sql(collector._reach_update_statement(since=datetime(2024, 1, 1)))
+        assert "post_analytics_1.recorded_at >" in sql
+
+
+class TestRecomputeReach:
+    @pytest.mark.asyncio
+    async def test_returns_metrics_per_channel(self):
+        session = _FakeSession(analytics=[(1, 200, 6.67, 2)])
+        with patch.object(collector, "async_session_maker", lambda: session):
+            result = await collector.recompute_channel_reach()
+        assert result == {1: {"avg_reach": 200, "err_percent": 6.67, "records_used": 2}}
+        assert len(session.statements) == 1
+        session.commit.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_single_channel_without_analytics(self):
+        session = _FakeSession()
+        with patch.object(collector, "async_session_maker", lambda: session):
+            assert await collector.update_channel_reach_from_analytics(5) == {"records_used": 0}
+
+    @pytest.mark.asyncio
+    async def test_incremental_uses_previous_run(self):
+        recomputer = collector.ReachRecomputer()
+        with patch.object(collector, "recompute_channel_reach", new=AsyncMock(return_value={})) as recompute:
+            await recomputer.run()
+            first_run = recomputer.last_run
+            await recomputer.run()
+            await recomputer.run(incremental=False)
+        assert recompute.await_args_list[0].kwargs["since"] is None
+        assert recompute.await_args_list[1].kwargs["since"] == first_run
+        assert recompute.await_args_list[2].kwargs["since"] is None
+
+    @pytest.mark.asyncio
+    async def test_failure_keeps_previous_mark(self):
+        recomputer = collector.ReachRecomputer()
+        recomputer.last_run = datetime(2024, 1, 1)
+        with patch.object(collector, "recompute_channel_reach", new=AsyncMock(side_effect=RuntimeError("db"))):
+            assert await recomputer.run() == 0
+        assert recomputer.last_run == datetime(2024, 1, 1)
+
+
+# ─── sync_all_channels_from_telemetr ──────────────────────────────────────────
+
+def _tm_channel(channel_id, telemetr_id=None):
+    row = _channel(channel_id)
+    row.username = f"ch{channel_id}"
+    row.telemetr_id = telemetr_id
+    return row
+
+
+class _FakeTelemetr:
+    def __init__(self, stats_by_id):
+        self.api_token = "token"
+        self.stats_by_id = stats_by_id
+        self.requests_made = 0
+        self.quota_hits = 0
+        self.calls = []
+
+    def quota_blocked_for(self):
+        return 0.0
+
+    async def get_full_stats(self, telegram_id=None, username=None, internal_id=None):
+        self.calls.append(internal_id)
+        self.requests_made += 1 if internal_id else 2
+        return self.stats_by_id.get(telegram_id)
+
+
+class TestTelemetrSync:
+    @pytest.mark.asyncio
+    async def test_bulk_update_and_report(self):
+        channels = [_tm_channel(1, "stored"), _tm_channel(2), _tm_channel(3)]
+        fake = _FakeTelemetr({
+            channels[0].telegram_id: {"internal_id": "stored", "subscribers": 10, "avg_views_24h": 5},
+            channels[1].telegram_id: {"internal_id": "new", "err_percent": 3.5},
+        })
+        session = _FakeSession(channels=channels)
+        with patch.object(collector, "async_session_maker", lambda: session), \
+                patch("services.telemetr.telemetr_service", fake):
+            report = await collector.sync_all_channels_from_telemetr()
+        assert fake.calls.count("stored") == 1
+        assert report["channels"] == 3
+        assert report["updated"] == 2
+        assert report["not_found"] == 1
+        assert report["requests"] == 5
+        assert report["seconds"] >= 0
+        updates = _updates(session)
+        assert len(updates) == 1
+        assert "nullif(telemetr.avg_24h" in updates[0]
+        session.commit.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_no_token_no_queries(self):
+        fake = _FakeTelemetr({})
+        fake.api_token = ""
+        session = _FakeSession()
+        with patch.object(collector, "async_session_maker", lambda: session), \
+                patch("services.telemetr.telemetr_service", fake):
+            report = await collector.sync_all_channels_from_telemetr()
+        assert report["updated"] == 0
+        assert session.statements == []
@@ -1,17 +1,19 @@
 """
 Unit tests for the crosspost signature formatting logic in services/crosspost.py
 
-Covers the pure text-composition behaviour inside crosspost_post_to_max without
+Covers the pure text-composition behaviour of build_crosspost_text without
 hitting the network or database:
   - Signature appended correctly for plain-text signature
   - Signature formatted as Markdown link when "text | url" pattern used
-  - Early-return (False) when no text content and no signature
-  - can_crosspost_today logic with mocked limit/count helpers
+  - Empty text when no content and no signature (media-only posts are not queued)
+  - CrosspostGovernor: DB count read once per UTC day, reservations within the limit,
+    a failed read retried instead of counted as zero
   - get_crosspost_daily_limit parsing: valid int, 0 (unlimited), invalid value fallback
   - is_crosspost_enabled: various truthy/falsy string values
 """
 import sys
 import os
+from datetime import date
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -21,10 +23,10 @@ from unittest.mock import AsyncMock, MagicMock, patch
 from services import crosspost as crosspost_mod
 from services.crosspost import (
     DEFAULT_DAILY_LIMIT,
-    can_crosspost_today,
+    CrosspostGovernor,
+    build_crosspost_text,
     get_crosspost_daily_limit,
     is_crosspost_enabled,
-    crosspost_post_to_max,
 )
 
 
@@ -40,6 +42,15 @@ def _make_post(content="Hello World", signature=None, post_id=1):
     return post
 
 
+@pytest.fixture(autouse=True)
+def governor():
+    """Свежий счётчик на каждый тест; «сегодня» в БД — ни одного кросспоста."""
+    fresh = CrosspostGovernor()
+    with patch.object(crosspost_mod, "crosspost_governor", fresh), \
+         patch("services.crosspost.get_daily_crosspost_count", new=AsyncMock(return_value=0)):
+        yield fresh
+
+
 # ─── is_crosspost_enabled ─────────────────────────────────────────────────────
 
 class TestIsCrosspostEnabled:
@@ -97,201 +108,81 @@ class TestGetCrosspostDailyLimit:
             assert await get_crosspost_daily_limit() == 1000
 
 
-# ─── can_crosspost_today ──────────────────────────────────────────────────────
+# ─── build_crosspost_text ─────────────────────────────────────────────────────
 
-class TestCanCrosspostToday:
-    @pytest.mark.asyncio
-    async def test_returns_true_when_limit_is_zero(self):
-        with patch("services.crosspost.get_crosspost_daily_limit", new=AsyncMock(return_value=0)):
-            result = await can_crosspost_today()
-        assert result is True
-
-    @pytest.mark.asyncio
-    async def test_returns_true_when_count_below_limit(self):
-        with patch("services.crosspost.get_crosspost_daily_limit", new=AsyncMock(return_value=10)), \
-             patch("services.crosspost.get_daily_crosspost_count", new=AsyncMock(return_value=5)):
-            result = await can_crosspost_today()
-        assert result is True
-
-    @pytest.mark.asyncio
-    async def test_returns_false_when_count_equals_limit(self):
-        with patch("services.crosspost.get_crosspost_daily_limit", new=AsyncMock(return_value=10)), \
-             patch("services.crosspost.get_daily_crosspost_count", new=AsyncMock(return_value=10)):
-            result = await can_crosspost_today()
-        assert result is False
-
-    @pytest.mark.asyncio
-    async def test_returns_false_when_count_exceeds_limit(self):
-        with patch("services.crosspost.get_crosspost_daily_limit", new=AsyncMock(return_value=10)), \
-             patch("services.crosspost.get_daily_crosspost_count", new=AsyncMock(return_value=15)):
-            result = await can_crosspost_today()
-        assert result is False
+class TestBuildCrosspostText:
+    def test_plain_signature_appended(self):
+        text = build_crosspost_text(_make_post(content="Ad content", signature="My Signature"))
+        assert text == "Ad content\n\nMy Signature"
 
+    def test_pipe_signature_formatted_as_markdown_link(self):
+        text = build_crosspost_text(_make_post(content="Ad content", signature="My Channel | https://t.me/mychannel"))
+        assert "[My Channel](https://t.me/mychannel)" in text
 
-# ─── crosspost_post_to_max: early-return cases ───────────────────────────────
-
-class TestCrosspostPostToMaxEarlyReturn:
-    @pytest.mark.asyncio
-    async def test_returns_false_when_disabled(self):
-        post = _make_post()
-        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=False)):
-            result = await crosspost_post_to_max(post, MagicMock())
-        assert result is False
-
-    @pytest.mark.asyncio
-    async def test_returns_false_when_daily_limit_reached(self):
-        post = _make_post()
-        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.can_crosspost_today", new=AsyncMock(return_value=False)):
-            result = await crosspost_post_to_max(post, MagicMock())
-        assert result is False
-
-    @pytest.mark.asyncio
-    async def test_returns_false_when_no_chat_id(self):
-        post = _make_post()
-        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.can_crosspost_today", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.get_max_crosspost_chat_id", new=AsyncMock(return_value=None)):
-            result = await crosspost_post_to_max(post, MagicMock())
-        assert result is False
-
-    @pytest.mark.asyncio
-    async def test_returns_false_when_content_empty_and_no_signature(self):
-        post = _make_post(content="", signature=None)
-        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.can_crosspost_today", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.get_max_crosspost_chat_id", new=AsyncMock(return_value=12345)):
-            result = await crosspost_post_to_max(post, MagicMock())
-        assert result is False
-
-    @pytest.mark.asyncio
-    async def test_returns_false_when_content_none_and_no_signature(self):
-        post = _make_post(content=None, signature=None)
-        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.can_crosspost_today", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.get_max_crosspost_chat_id", new=AsyncMock(return_value=12345)):
-            result = await crosspost_post_to_max(post, MagicMock())
-        assert result is False
-
-
-# ─── crosspost_post_to_max: signature formatting ─────────────────────────────
-
-class TestCrosspostSignatureFormatting:
-    """
-    These tests intercept max_bot.send_message to capture the actual text
-    that would be sent, verifying signature composition logic.
-    """
-
-    def _setup_patching(self):
-        return {
-            "is_crosspost_enabled": AsyncMock(return_value=True),
-            "can_crosspost_today": AsyncMock(return_value=True),
-            "get_max_crosspost_chat_id": AsyncMock(return_value=99999),
-        }
-
-    def _make_max_bot(self, message_id=42):
-        bot = MagicMock()
-        sent_msg = MagicMock()
-        sent_msg.message_id = message_id
-        bot.send_message = AsyncMock(return_value=sent_msg)
-        return bot
-
-    @pytest.mark.asyncio
-    async def test_plain_signature_appended(self):
-        post = _make_post(content="Ad content", signature="My Signature")
-        max_bot = self._make_max_bot()
+    def test_pipe_with_non_http_url_falls_back_to_plain(self):
+        text = build_crosspost_text(_make_post(content="Content", signature="Label | not_a_url"))
+        # Should include the full signature as plain text, not as a link
+        assert "Label | not_a_url" in text
+        assert "[Label]" not in text
 
-        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.can_crosspost_today", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.get_max_crosspost_chat_id", new=AsyncMock(return_value=99999)), \
-             patch("services.crosspost.utc_now", return_value=MagicMock()):
-            await crosspost_post_to_max(post, max_bot)
+    def test_no_signature_sends_content_only(self):
+        assert build_crosspost_text(_make_post(content="Just content")) == "Just content"
 
-        sent_text = max_bot.send_message.call_args[1]["text"]
-        assert "Ad content" in sent_text
-        assert "My Signature" in sent_text
+    def test_only_signature_when_no_content(self):
+        text = build_crosspost_text(_make_post(content="", signature="Channel | https://t.me/ch"))
+        assert text == "[Channel](https://t.me/ch)"
 
-    @pytest.mark.asyncio
-    async def test_pipe_signature_formatted_as_markdown_link(self):
-        post = _make_post(content="Ad content", signature="My Channel | https://t.me/mychannel")
-        max_bot = self._make_max_bot()
+    @pytest.mark.parametrize("content", ["", None])
+    def test_empty_when_no_content_and_no_signature(self, content):
+        assert build_crosspost_text(_make_post(content=content)) == ""
 
-        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.can_crosspost_today", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.get_max_crosspost_chat_id", new=AsyncMock(return_value=99999)), \
-             patch("services.crosspost.utc_now", return_value=MagicMock()):
-            await crosspost_post_to_max(post, max_bot)
 
-        sent_text = max_bot.send_message.call_args[1]["text"]
-        assert "[My Channel](https://t.me/mychannel)" in sent_text
+# ─── CrosspostGovernor ────────────────────────────────────────────────────────
 
-    @pytest.mark.asyncio
-    async def test_pipe_with_non_http_url_falls_back_to_plain(self):
-        post = _make_post(content="Content", signature="Label | not_a_url")
-        max_bot = self._make_max_bot()
+class _Today:
+    def __init__(self):
+        self.value = date(2025, 1, 1)
 
-        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.can_crosspost_today", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.get_max_crosspost_chat_id", new=AsyncMock(return_value=99999)), \
-             patch("services.crosspost.utc_now", return_value=MagicMock()):
-            await crosspost_post_to_max(post, max_bot)
+    def __call__(self):
+        return self.value
 
-        sent_text = max_bot.send_message.call_args[1]["text"]
-        # Should include the full signature as plain text, not as a link
-        assert "Label | not_a_url" in sent_text
-        assert "[Label]" not in sent_text
 
+class TestCrosspostGovernor:
     @pytest.mark.asyncio
-    async def test_no_signature_sends_content_only(self):
-        post = _make_post(content="Just content", signature=None)
-        max_bot = self._make_max_bot()
-
-        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.can_crosspost_today", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.get_max_crosspost_chat_id", new=AsyncMock(return_value=99999)), \
-             patch("services.crosspost.utc_now", return_value=MagicMock()):
-            await crosspost_post_to_max(post, max_bot)
-
-        sent_text = max_bot.send_message.call_args[1]["text"]
-        assert sent_text == "Just content"
+    async def test_db_count_read_once_per_day(self):
+        today = _Today()
+        gov = CrosspostGovernor(today=today)
+        count = AsyncMock(side_effect=[4, 0])
+        with patch("services.crosspost.get_daily_crosspost_count", new=count):
+            assert await gov.count_today() == 4
+            assert await gov.try_acquire(10) is True
+            assert await gov.count_today() == 5
+            today.value = date(2025, 1, 2)
+            assert await gov.count_today() == 0
+        assert count.await_count == 2
 
     @pytest.mark.asyncio
-    async def test_only_signature_sent_when_no_content(self):
-        post = _make_post(content="", signature="Channel | https://t.me/ch")
-        max_bot = self._make_max_bot()
-
-        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.can_crosspost_today", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.get_max_crosspost_chat_id", new=AsyncMock(return_value=99999)), \
-             patch("services.crosspost.utc_now", return_value=MagicMock()):
-            await crosspost_post_to_max(post, max_bot)
-
-        sent_text = max_bot.send_message.call_args[1]["text"]
-        assert "[Channel](https://t.me/ch)" == sent_text
+    async def test_failed_seed_not_cached(self):
+        gov = CrosspostGovernor(today=_Today())
+        count = AsyncMock(side_effect=[RuntimeError("db down"), 7])
+        with patch("services.crosspost.get_daily_crosspost_count", new=count):
+            with pytest.raises(RuntimeError):
+                await gov.try_acquire(10)
+            assert await gov.count_today() == 7
+        assert count.await_count == 2
 
     @pytest.mark.asyncio
-    async def test_max_post_id_set_on_success(self):
-        post = _make_post(content="Content")
-        max_bot = self._make_max_bot(message_id=777)
-
-        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.can_crosspost_today", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.get_max_crosspost_chat_id", new=AsyncMock(return_value=99999)), \
-             patch("services.crosspost.utc_now", return_value=MagicMock()):
-            result = await crosspost_post_to_max(post, max_bot)
-
-        assert result is True
-        assert post.max_post_id == "777"
+    async def test_limit_enforced_and_release(self):
+        gov = CrosspostGovernor(today=_Today())
+        with patch("services.crosspost.get_daily_crosspost_count", new=AsyncMock(return_value=1)):
+            assert await gov.try_acquire(2) is True
+            assert await gov.try_acquire(2) is False
+            gov.release()
+            assert await gov.try_acquire(2) is True
 
     @pytest.mark.asyncio
-    async def test_returns_false_on_send_exception(self):
-        post = _make_post(content="Content")
-        max_bot = MagicMock()
-        max_bot.send_message = AsyncMock(side_effect=Exception("Network error"))
-
-        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.can_crosspost_today", new=AsyncMock(return_value=True)), \
-             patch("services.crosspost.get_max_crosspost_chat_id", new=AsyncMock(return_value=99999)):
-            result = await crosspost_post_to_max(post, max_bot)
-
-        assert result is False
+    async def test_zero_limit_unbounded(self):
+        gov = CrosspostGovernor(today=_Today())
+        with patch("services.crosspost.get_daily_crosspost_count", new=AsyncMock(return_value=100)):
+            assert await gov.try_acquire(0) is True
+            assert await gov.count_today() == 101
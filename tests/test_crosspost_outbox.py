@@ -0,0 +1,221 @@
+"""
+Unit tests for the crosspost outbox (services/crosspost_outbox.py, enqueue_crosspost)
+
+Database and Max API are mocked:
+  - enqueue_crosspost: one INSERT … ON CONFLICT DO NOTHING inside a SAVEPOINT
+  - a batch is claimed with one UPDATE … FOR UPDATE SKIP LOCKED … RETURNING
+  - results written with one UPDATE per table, sends bounded by concurrency
+  - failed sends rescheduled with doubling delay, marked failed after the last attempt
+  - nothing claimed while the Max bot is not running or today's count is unavailable
+"""
+import sys
+import os
+import asyncio
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.dialects import postgresql
+
+import services.crosspost_outbox as outbox
+from services.crosspost import CrosspostConfig, CrosspostGovernor, enqueue_crosspost
+from services.crosspost_outbox import CrosspostOutboxWorker, retry_delay
+
+
+def _sql(statement):
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+class _FakeSession:
+    """Возвращает заранее заданные строки на UPDATE … RETURNING."""
+
+    def __init__(self, claimed=()):
+        self.claimed = list(claimed)
+        self.statements = []
+        self.params = []
+        self.commit = AsyncMock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @asynccontextmanager
+    async def begin_nested(self):
+        self.statements.append("SAVEPOINT")
+        yield
+
+    async def execute(self, statement, params=None):
+        compiled = statement.compile(dialect=postgresql.dialect())
+        self.statements.append(str(compiled))
+        self.params.append(compiled.params)
+        result = MagicMock()
+        result.all.return_value = self.claimed if "RETURNING" in str(compiled) else []
+        return result
+
+
+def _config(enabled=True, daily_limit=0, chat_id=555):
+    return AsyncMock(return_value=CrosspostConfig(enabled, daily_limit, chat_id))
+
+
+def _max_bot(side_effect=None):
+    bot = MagicMock()
+    bot.send_message = AsyncMock(side_effect=side_effect, return_value=MagicMock(message_id=900))
+    return bot
+
+
+@pytest.fixture(autouse=True)
+def governor():
+    fresh = CrosspostGovernor()
+    with patch.object(outbox, "crosspost_governor", fresh), \
+         patch("services.crosspost.get_daily_crosspost_count", new=AsyncMock(return_value=0)):
+        yield fresh
+
+
+async def _run_batch(worker, session, config=None):
+    with patch.object(outbox, "async_session_maker", lambda: session), \
+         patch.object(outbox, "get_crosspost_config", new=config or _config()):
+        return await worker.process_batch()
+
+
+# ─── enqueue_crosspost ────────────────────────────────────────────────────────
+
+class TestEnqueue:
+    @pytest.mark.asyncio
+    async def test_inserted_in_savepoint(self):
+        post = MagicMock(id=7, content="Ad", signature=None)
+        session = _FakeSession()
+        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=True)):
+            assert await enqueue_crosspost(session, post) is True
+        assert session.statements[0] == "SAVEPOINT"
+        assert session.statements[1].startswith("INSERT INTO crosspost_outbox")
+        assert "ON CONFLICT (scheduled_post_id) DO NOTHING" in session.statements[1]
+
+    @pytest.mark.asyncio
+    async def test_disabled_or_media_only_not_queued(self):
+        session = _FakeSession()
+        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=False)):
+            assert await enqueue_crosspost(session, MagicMock(id=1, content="x", signature=None)) is False
+        with patch("services.crosspost.is_crosspost_enabled", new=AsyncMock(return_value=True)):
+            assert await enqueue_crosspost(session, MagicMock(id=1, content="", signature=None)) is False
+        assert session.statements == []
+
+
+# ─── Statements ───────────────────────────────────────────────────────────────
+
+class TestStatements:
+    def test_claim_skips_locked_rows(self):
+        from datetime import datetime
+        sql = _sql(outbox._claim_statement(datetime(2025, 1, 1), 20))
+        assert sql.startswith("UPDATE crosspost_outbox SET attempts=")
+        assert "FOR UPDATE SKIP LOCKED" in sql
+        assert "RETURNING crosspost_outbox.id" in sql
+
+    def test_retry_delay_doubles(self):
+        assert retry_delay(1, base=30) == 30
+        assert retry_delay(2, base=30) == 60
+        assert retry_delay(4, base=30) == 240
+
+
+# ─── process_batch ────────────────────────────────────────────────────────────
+
+class TestProcessBatch:
+    @pytest.mark.asyncio
+    async def test_sent_rows_written_in_bulk(self):
+        worker = CrosspostOutboxWorker(batch_size=10)
+        bot = _max_bot()
+        worker._get_bot = lambda: bot
+        session = _FakeSession(claimed=[(1, 11, "a", 1), (2, 12, "b", 1)])
+        assert await _run_batch(worker, session) == 2
+        assert bot.send_message.await_count == 2
+        updates = [s for s in session.statements if s.startswith("UPDATE")]
+        assert len(updates) == 3  # захват, crosspost_outbox, scheduled_posts
+        assert updates[2].startswith("UPDATE scheduled_posts SET max_post_id=")
+
+    @pytest.mark.asyncio
+    async def test_concurrency_bounded(self):
+        active = 0
+        peak = 0
+
+        async def send_message(chat_id, text):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return MagicMock(message_id=1)
+
+        bot = MagicMock()
+        bot.send_message = send_message
+        worker = CrosspostOutboxWorker(concurrency=2)
+        worker._get_bot = lambda: bot
+        session = _FakeSession(claimed=[(i, 10 + i, "t", 1) for i in range(6)])
+        await _run_batch(worker, session)
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    async def test_failure_rescheduled_then_failed(self, governor):
+        worker = CrosspostOutboxWorker(max_attempts=3)
+        worker._get_bot = lambda: _max_bot(side_effect=RuntimeError("max down"))
+        session = _FakeSession(claimed=[(1, 11, "a", 1), (2, 12, "b", 3)])
+        with patch.object(outbox.notification_dispatcher, "notify_admins") as notify:
+            await _run_batch(worker, session)
+        outcome = session.params[1]
+        statuses = [v for k, v in outcome.items() if v in ("pending", "failed")]
+        assert statuses == ["pending", "failed"]
+        notify.assert_called_once()
+        assert await governor.count_today() == 0
+        assert not any(s.startswith("UPDATE scheduled_posts") for s in session.statements)
+
+    @pytest.mark.asyncio
+    async def test_daily_limit_skips(self):
+        worker = CrosspostOutboxWorker()
+        bot = _max_bot()
+        worker._get_bot = lambda: bot
+        session = _FakeSession(claimed=[(1, 11, "a", 1), (2, 12, "b", 1)])
+        await _run_batch(worker, session, config=_config(daily_limit=1))
+        assert bot.send_message.await_count == 1
+        assert "skipped" in session.params[1].values()
+
+    @pytest.mark.asyncio
+    async def test_no_bot_nothing_claimed(self):
+        worker = CrosspostOutboxWorker()
+        session = _FakeSession(claimed=[(1, 11, "a", 1)])
+        assert await _run_batch(worker, session) == 0
+        assert session.statements == []
+
+    @pytest.mark.asyncio
+    async def test_count_unavailable_nothing_claimed(self):
+        worker = CrosspostOutboxWorker()
+        worker._get_bot = lambda: _max_bot()
+        session = _FakeSession(claimed=[(1, 11, "a", 1)])
+        with patch("services.crosspost.get_daily_crosspost_count", new=AsyncMock(side_effect=RuntimeError("db down"))):
+            with pytest.raises(RuntimeError):
+                await _run_batch(worker, session)
+        assert session.statements == []
+
+    @pytest.mark.asyncio
+    async def test_empty_queue(self):
+        worker = CrosspostOutboxWorker()
+        worker._get_bot = lambda: _max_bot()
+        session = _FakeSession()
+        assert await _run_batch(worker, session) == 0
+        assert len(session.statements) == 1
+
+
+# ─── Lifecycle ────────────────────────────────────────────────────────────────
+
+class TestWorkerLoop:
+    @pytest.mark.asyncio
+    async def test_wake_triggers_batch(self):
+        worker = CrosspostOutboxWorker(poll_seconds=60)
+        worker.process_batch = AsyncMock(return_value=0)
+        worker.start(lambda: None)
+        await asyncio.sleep(0)
+        worker.wake()
+        await asyncio.sleep(0.01)
+        await worker.stop()
+        assert worker.process_batch.await_count == 2
@@ -0,0 +1,78 @@
+"""
+Unit tests for services/metrics.get_dashboard_snapshot
+
+The database session is mocked; the generated SQL is compiled for PostgreSQL:
+  - the whole dashboard is fetched in a single round-trip
+  - order counters and revenue come from the daily_order_stats rollup
+    with FILTER (WHERE …) aggregates instead of scanning orders
+  - NULL aggregates are normalised to 0 / 0.0
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import MagicMock, patch
+from sqlalchemy.dialects import postgresql
+
+import services.metrics as metrics
+from services.metrics_cache import metrics_cache
+
+
+class _FakeSession:
+    def __init__(self, mapping):
+        self.mapping = mapping
+        self.statements = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        row = MagicMock()
+        row._mapping = self.mapping
+        result = MagicMock()
+        result.one.return_value = row
+        return result
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    metrics_cache.invalidate()
+    yield
+    metrics_cache.invalidate()
+
+
+# ─── get_dashboard_snapshot ───────────────────────────────────────────────────
+
+class TestDashboardSnapshot:
+    @pytest.mark.asyncio
+    async def test_single_query_with_filter_aggregates(self):
+        session = _FakeSession({"total_orders": 0})
+        with patch.object(metrics, "async_session_maker", lambda: session):
+            await metrics.get_dashboard_snapshot()
+        assert len(session.statements) == 1
+        sql = str(session.statements[0].compile(dialect=postgresql.dialect()))
+        assert sql.count("FILTER (WHERE") >= 7
+        assert "FROM orders" not in sql
+        for table in ("daily_order_stats", "managers", "channels", "clients"):
+            assert f"FROM {table}" in sql
+
+    @pytest.mark.asyncio
+    async def test_values_normalised(self):
+        session = _FakeSession({
+            "total_orders": 7,
+            "pending_orders": None,
+            "revenue_today": None,
+            "total_revenue": 1500,
+        })
+        with patch.object(metrics, "async_session_maker", lambda: session):
+            snapshot = await metrics.get_dashboard_snapshot()
+        assert snapshot["total_orders"] == 7
+        assert snapshot["pending_orders"] == 0
+        assert snapshot["revenue_today"] == 0.0
+        assert isinstance(snapshot["total_revenue"], float)
@@ -0,0 +1,70 @@
+"""
+Unit tests for the connection-pool instrumentation in database/session.py
+
+No database connection is opened:
+  - PoolMetrics: wait accounting, slow waits, timeouts, snapshot format
+  - get_pool_stats: exposes pool size/overflow plus wait statistics
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW
+from database.session import PoolMetrics, get_pool_stats, engine, InstrumentedAsyncPool
+
+
+# ─── PoolMetrics ──────────────────────────────────────────────────────────────
+
+class TestPoolMetrics:
+    def test_empty_snapshot(self):
+        snap = PoolMetrics().snapshot()
+        assert snap == {
+            "checkouts": 0,
+            "avg_wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+            "slow_waits": 0,
+            "timeouts": 0,
+        }
+
+    def test_average_and_max(self):
+        metrics = PoolMetrics()
+        metrics.record_wait(0.002)
+        metrics.record_wait(0.004)
+        snap = metrics.snapshot()
+        assert snap["checkouts"] == 2
+        assert snap["avg_wait_ms"] == pytest.approx(3.0)
+        assert snap["max_wait_ms"] == pytest.approx(4.0)
+        assert snap["slow_waits"] == 0
+
+    def test_slow_wait_counted(self):
+        metrics = PoolMetrics()
+        metrics.record_wait(PoolMetrics.SLOW_WAIT_SECONDS + 0.01)
+        assert metrics.snapshot()["slow_waits"] == 1
+
+    def test_timeouts_counted(self):
+        metrics = PoolMetrics()
+        metrics.record_timeout()
+        metrics.record_timeout()
+        assert metrics.snapshot()["timeouts"] == 2
+
+
+# ─── get_pool_stats ───────────────────────────────────────────────────────────
+
+class TestGetPoolStats:
+    def test_engine_uses_instrumented_pool(self):
+        assert isinstance(engine.sync_engine.pool, InstrumentedAsyncPool)
+
+    def test_reports_configured_limits(self):
+        stats = get_pool_stats()
+        assert stats["size"] == DB_POOL_SIZE
+        assert stats["max_overflow"] == DB_MAX_OVERFLOW
+        assert stats["overflow"] >= 0
+        assert stats["checked_out"] >= 0
+
+    def test_includes_wait_statistics(self):
+        stats = get_pool_stats()
+        for key in ("checkouts", "avg_wait_ms", "max_wait_ms", "slow_waits", "timeouts"):
+            assert key in stats
@@ -0,0 +1,179 @@
+"""
+Unit tests for services/metrics_cache.py
+
+Pure in-memory logic, no database:
+  - TTL expiry with an injected clock
+  - single-flight: concurrent identical requests share one computation
+  - invalidation by tag, full invalidation, stale results not stored
+  - None results are not cached
+  - cached_metric keys entries by function arguments
+"""
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import patch
+
+from services.metrics_cache import MetricsCache, cached_metric
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _counter(value="v"):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return value
+
+    return compute, calls
+
+
+# ─── TTL ──────────────────────────────────────────────────────────────────────
+
+class TestTTL:
+    @pytest.mark.asyncio
+    async def test_hit_within_ttl(self):
+        cache = MetricsCache(ttl=60, clock=FakeClock())
+        compute, calls = _counter()
+        assert await cache.get_or_compute(("k",), compute) == "v"
+        assert await cache.get_or_compute(("k",), compute) == "v"
+        assert len(calls) == 1
+        assert cache.hits == 1
+
+    @pytest.mark.asyncio
+    async def test_recomputed_after_ttl(self):
+        clock = FakeClock()
+        cache = MetricsCache(ttl=60, clock=clock)
+        compute, calls = _counter()
+        await cache.get_or_compute(("k",), compute)
+        clock.now = 61
+        await cache.get_or_compute(("k",), compute)
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_zero_ttl_disables_cache(self):
+        cache = MetricsCache(ttl=0, clock=FakeClock())
+        compute, calls = _counter()
+        await cache.get_or_compute(("k",), compute)
+        await cache.get_or_compute(("k",), compute)
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_none_not_cached(self):
+        cache = MetricsCache(ttl=60, clock=FakeClock())
+        compute, calls = _counter(None)
+        await cache.get_or_compute(("k",), compute)
+        await cache.get_or_compute(("k",), compute)
+        assert len(calls) == 2
+
+
+# ─── single-flight ────────────────────────────────────────────────────────────
+
+class TestSingleFlight:
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_computation(self):
+        cache = MetricsCache(ttl=60)
+        gate = asyncio.Event()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await gate.wait()
+            return 42
+
+        waiters = [asyncio.create_task(cache.get_or_compute(("k",), compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        gate.set()
+        assert await asyncio.gather(*waiters) == [42] * 5
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_error_propagates_and_is_not_cached(self):
+        cache = MetricsCache(ttl=60)
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            raise RuntimeError("db down")
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute(("k",), compute)
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute(("k",), compute)
+        assert len(calls) == 2
+
+
+# ─── invalidate ───────────────────────────────────────────────────────────────
+
+class TestInvalidate:
+    @pytest.mark.asyncio
+    async def test_invalidate_by_tag(self):
+        cache = MetricsCache(ttl=60, clock=FakeClock())
+        orders, order_calls = _counter()
+        analytics, analytics_calls = _counter()
+        await cache.get_or_compute(("sales",), orders, frozenset({"orders"}))
+        await cache.get_or_compute(("posts",), analytics, frozenset({"analytics"}))
+
+        assert cache.invalidate("orders") == 1
+        await cache.get_or_compute(("sales",), orders, frozenset({"orders"}))
+        await cache.get_or_compute(("posts",), analytics, frozenset({"analytics"}))
+        assert len(order_calls) == 2
+        assert len(analytics_calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_invalidate_all(self):
+        cache = MetricsCache(ttl=60, clock=FakeClock())
+        compute, calls = _counter()
+        await cache.get_or_compute(("a",), compute, frozenset({"orders"}))
+        await cache.get_or_compute(("b",), compute)
+        assert cache.invalidate() == 2
+
+    @pytest.mark.asyncio
+    async def test_result_started_before_invalidation_not_stored(self):
+        cache = MetricsCache(ttl=60)
+        gate = asyncio.Event()
+
+        async def compute():
+            await gate.wait()
+            return "stale"
+
+        task = asyncio.create_task(cache.get_or_compute(("k",), compute, frozenset({"orders"})))
+        await asyncio.sleep(0)
+        cache.invalidate("orders")
+        gate.set()
+        assert await task == "stale"
+        fresh, calls = _counter("fresh")
+        assert await cache.get_or_compute(("k",), fresh) == "fresh"
+        assert len(calls) == 1
+
+
+# ─── cached_metric ────────────────────────────────────────────────────────────
+
+class TestDecorator:
+    @pytest.mark.asyncio
+    async def test_keyed_by_arguments(self):
+        cache = MetricsCache(ttl=60, clock=FakeClock())
+        calls = []
+
+        @cached_metric("orders")
+        async def metric(period="month"):
+            calls.append(period)
+            return {"period": period}
+
+        with patch("services.metrics_cache.metrics_cache", cache):
+            await metric("day")
+            await metric("day")
+            await metric("week")
+            await metric(period="week")
+        assert calls == ["day", "week", "week"]
+        assert metric.__wrapped__ is not None
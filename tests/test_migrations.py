@@ -0,0 +1,138 @@
+"""
+Unit tests for database/migrations.py
+
+No database connection is opened:
+  - MIGRATIONS: versions are ordered, indexes are built concurrently
+  - get_schema_version: missing schema_version table means version 0
+  - apply_migrations: only pending steps run, failures stop later steps,
+    best-effort steps tolerate failing statements
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.exc import ProgrammingError
+
+from database.migrations import (
+    MIGRATIONS,
+    LATEST_VERSION,
+    _index_name,
+    apply_migrations,
+    get_schema_version,
+)
+
+
+def _executed(conn) -> list[str]:
+    return [str(c.args[0]) for c in conn.execute.await_args_list]
+
+
+# ─── MIGRATIONS ───────────────────────────────────────────────────────────────
+
+class TestMigrationList:
+    def test_versions_strictly_increasing_from_one(self):
+        versions = [step["version"] for step in MIGRATIONS]
+        assert versions == list(range(1, len(MIGRATIONS) + 1))
+        assert LATEST_VERSION == versions[-1]
+
+    def test_every_step_has_description_and_statements(self):
+        for step in MIGRATIONS:
+            assert step["description"]
+            assert step["statements"]
+
+    def test_indexes_built_concurrently(self):
+        for step in MIGRATIONS:
+            for statement in step["statements"]:
+                if "CREATE INDEX" in statement or "CREATE UNIQUE INDEX" in statement:
+                    assert "CONCURRENTLY IF NOT EXISTS" in statement, statement
+
+    def test_analytics_deduplicated_before_unique_index(self):
+        step = next(s for s in MIGRATIONS if any("uq_post_analytics_scheduled_post" in st for st in s["statements"]))
+        statements = step["statements"]
+        unique_at = next(i for i, st in enumerate(statements) if "CREATE UNIQUE INDEX" in st)
+        assert any(st.startswith("DELETE FROM post_analytics") for st in statements[:unique_at])
+        assert not step.get("best_effort")
+
+    def test_snapshots_partitioned_and_legacy_copied(self):
+        step = next(s for s in MIGRATIONS if any("PARTITION BY RANGE" in st for st in s["statements"]))
+        sql = "\n".join(step["statements"])
+        assert sql.index("RENAME TO post_view_snapshots_legacy") < sql.index("PARTITION BY RANGE (recorded_at)")
+        assert "DROP TABLE post_view_snapshots_legacy" in sql
+
+    def test_index_name_parsed(self):
+        assert _index_name(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_a ON t(c)"
+        ) == "idx_a"
+        assert _index_name(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_b ON t(c)"
+        ) == "uq_b"
+        assert _index_name("ALTER TABLE t ADD COLUMN c INTEGER") is None
+
+
+# ─── get_schema_version ───────────────────────────────────────────────────────
+
+class TestGetSchemaVersion:
+    @pytest.mark.asyncio
+    async def test_returns_stored_version(self):
+        result = MagicMock()
+        result.scalar.return_value = 5
+        conn = MagicMock()
+        conn.execute = AsyncMock(return_value=result)
+        assert await get_schema_version(conn) == 5
+
+    @pytest.mark.asyncio
+    async def test_missing_table_is_zero(self):
+        conn = MagicMock()
+        conn.execute = AsyncMock(side_effect=ProgrammingError("SELECT", {}, Exception("no table")))
+        assert await get_schema_version(conn) == 0
+
+
+# ─── apply_migrations ─────────────────────────────────────────────────────────
+
+STEPS = [
+    {"version": 1, "description": "one", "best_effort": True, "statements": ["S1a", "S1b"]},
+    {"version": 2, "description": "two", "statements": ["S2"]},
+    {"version": 3, "description": "three", "statements": ["S3"]},
+]
+
+
+class TestApplyMigrations:
+    @pytest.mark.asyncio
+    async def test_applies_only_pending_steps(self):
+        conn = MagicMock()
+        conn.execute = AsyncMock()
+        with patch("database.migrations.MIGRATIONS", STEPS):
+            version = await apply_migrations(conn, 1)
+        executed = _executed(conn)
+        assert version == 3
+        assert "S1a" not in executed
+        assert "S2" in executed and "S3" in executed
+        assert executed.index("S2") < executed.index("S3")
+
+    @pytest.mark.asyncio
+    async def test_failed_step_stops_later_steps(self):
+        async def execute(statement, params=None):
+            if str(statement) == "S2":
+                raise RuntimeError("boom")
+
+        conn = MagicMock()
+        conn.execute = AsyncMock(side_effect=execute)
+        with patch("database.migrations.MIGRATIONS", STEPS):
+            version = await apply_migrations(conn, 0)
+        assert version == 1
+        assert "S3" not in _executed(conn)
+
+    @pytest.mark.asyncio
+    async def test_best_effort_step_tolerates_errors(self):
+        async def execute(statement, params=None):
+            if str(statement) == "S1a":
+                raise RuntimeError("column missing")
+
+        conn = MagicMock()
+        conn.execute = AsyncMock(side_effect=execute)
+        with patch("database.migrations.MIGRATIONS", STEPS):
+            version = await apply_migrations(conn, 0)
+        assert version == 3
+        assert "S1b" in _executed(conn)
@@ -0,0 +1,197 @@
+"""
+Unit tests for services/notifications.py
+
+Covers the notification dispatcher without a real Telegram bot:
+  - coalesce: digest building, order preservation, per-recipient grouping
+  - _split_lines: long digests split under the Telegram message limit
+  - NotificationDispatcher: concurrent delivery, retry with backoff,
+    no retry for permanent errors, enqueue returns immediately,
+    a slow chat does not hold back later notifications to other chats
+"""
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from aiogram.exceptions import TelegramForbiddenError
+
+from services.notifications import (
+    Notification,
+    NotificationDispatcher,
+    coalesce,
+    _split_lines,
+)
+
+
+def _published(chat_id, post_id):
+    return Notification(
+        chat_id,
+        text=f"✅ Пост #{post_id} опубликован!",
+        digest_key="post_published",
+        digest_title="Опубликовано постов: {count}",
+        digest_line=f"• #{post_id}",
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limit():
+    with patch("services.notifications.telegram_rate_limiter.acquire", new=AsyncMock()):
+        yield
+
+
+# ─── coalesce ─────────────────────────────────────────────────────────────────
+
+class TestCoalesce:
+    def test_single_item_unchanged(self):
+        item = _published(1, 10)
+        assert coalesce([item]) == [item]
+
+    def test_same_key_merged_into_digest(self):
+        result = coalesce([_published(1, i) for i in range(20)])
+        assert len(result) == 1
+        text = result[0].kwargs["text"]
+        assert text.startswith("Опубликовано постов: 20")
+        assert "• #0" in text and "• #19" in text
+
+    def test_different_recipients_not_merged(self):
+        result = coalesce([_published(1, 1), _published(2, 2), _published(1, 3)])
+        assert [n.chat_id for n in result] == [1, 2]
+        assert "Опубликовано постов: 2" in result[0].kwargs["text"]
+        assert result[1].kwargs["text"] == "✅ Пост #2 опубликован!"
+
+    def test_plain_notifications_keep_order(self):
+        a = Notification(1, text="a")
+        b = Notification(1, text="b")
+        result = coalesce([a, _published(1, 1), b, _published(1, 2)])
+        assert result[0] is a
+        assert "Опубликовано постов: 2" in result[1].kwargs["text"]
+        assert result[2] is b
+
+    def test_digest_keeps_parse_mode(self):
+        items = [
+            Notification(1, text="x", parse_mode="Markdown", digest_key="k", digest_line="l1"),
+            Notification(1, text="y", parse_mode="Markdown", digest_key="k", digest_line="l2"),
+        ]
+        result = coalesce(items)
+        assert result[0].kwargs["parse_mode"] == "Markdown"
+
+
+# ─── _split_lines ─────────────────────────────────────────────────────────────
+
+class TestSplitLines:
+    def test_short_digest_single_chunk(self):
+        assert _split_lines(["a", "b"], "H") == ["H\na\nb"]
+
+    def test_long_digest_split(self):
+        lines = ["x" * 40 for _ in range(10)]
+        chunks = _split_lines(lines, "Header", limit=100)
+        assert len(chunks) > 1
+        assert all(len(c) <= 100 for c in chunks)
+        assert all(c.startswith("Header") for c in chunks)
+        assert sum(c.count("x" * 40) for c in chunks) == 10
+
+
+# ─── NotificationDispatcher ───────────────────────────────────────────────────
+
+class TestDispatcher:
+    @pytest.mark.asyncio
+    async def test_delivers_to_all_recipients(self):
+        bot = MagicMock()
+        bot.send_message = AsyncMock()
+        dispatcher = NotificationDispatcher(coalesce_window=0.01)
+        dispatcher.start(bot)
+        with patch("services.notifications.ADMIN_IDS", [1, 2, 3]):
+            dispatcher.notify_admins("hello")
+        await dispatcher.stop()
+        chat_ids = sorted(c.kwargs["chat_id"] for c in bot.send_message.call_args_list)
+        assert chat_ids == [1, 2, 3]
+
+    @pytest.mark.asyncio
+    async def test_enqueue_does_not_send_inline(self):
+        bot = MagicMock()
+        bot.send_message = AsyncMock()
+        dispatcher = NotificationDispatcher(coalesce_window=0.01)
+        dispatcher.send(1, "queued")
+        bot.send_message.assert_not_called()
+        dispatcher.start(bot)
+        await dispatcher.stop()
+        bot.send_message.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_retries_transient_errors(self):
+        bot = MagicMock()
+        bot.send_message = AsyncMock(side_effect=[RuntimeError("net"), RuntimeError("net"), None])
+        dispatcher = NotificationDispatcher(max_retries=3)
+        dispatcher._bot = bot
+        with patch("services.notifications.asyncio.sleep", new=AsyncMock()) as sleep:
+            ok = await dispatcher._send_with_retry(Notification(1, text="t"))
+        assert ok is True
+        assert bot.send_message.await_count == 3
+        assert [c.args[0] for c in sleep.await_args_list] == [1.0, 2.0]
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_max_retries(self):
+        bot = MagicMock()
+        bot.send_message = AsyncMock(side_effect=RuntimeError("down"))
+        dispatcher = NotificationDispatcher(max_retries=2)
+        dispatcher._bot = bot
+        with patch("services.notifications.asyncio.sleep", new=AsyncMock()):
+            ok = await dispatcher._send_with_retry(Notification(1, text="t"))
+        assert ok is False
+        assert bot.send_message.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_forbidden_not_retried(self):
+        bot = MagicMock()
+        bot.send_message = AsyncMock(
+            side_effect=TelegramForbiddenError(method=MagicMock(), message="bot was blocked")
+        )
+        dispatcher = NotificationDispatcher(max_retries=3)
+        dispatcher._bot = bot
+        ok = await dispatcher._send_with_retry(Notification(1, text="t"))
+        assert ok is False
+        assert bot.send_message.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_same_chat_delivered_in_order(self):
+        sent = []
+        bot = MagicMock()
+
+        async def send_message(chat_id, text, **kwargs):
+            await asyncio.sleep(0)
+            sent.append(text)
+
+        bot.send_message = send_message
+        dispatcher = NotificationDispatcher()
+        dispatcher._bot = bot
+        dispatcher._dispatch([Notification(1, text=str(i)) for i in range(5)])
+        await dispatcher._drain()
+        assert sent == ["0", "1", "2", "3", "4"]
+
+    @pytest.mark.asyncio
+    async def test_slow_chat_does_not_block_next_batches(self):
+        release = asyncio.Event()
+        sent = []
+        bot = MagicMock()
+
+        async def send_message(chat_id, text, **kwargs):
+            if chat_id == 1:
+                await release.wait()
+            sent.append((chat_id, text))
+
+        bot.send_message = send_message
+        dispatcher = NotificationDispatcher(coalesce_window=0.01)
+        dispatcher.start(bot)
+        dispatcher.send(1, "slow")
+        await asyncio.sleep(0.05)
+        dispatcher.send(2, "next batch")
+        dispatcher.send(1, "after slow")
+        await asyncio.sleep(0.05)
+        assert sent == [(2, "next batch")]
+        release.set()
+        await dispatcher.stop()
+        assert sent == [(2, "next batch"), (1, "slow"), (1, "after slow")]
@@ -0,0 +1,199 @@
+"""
+Unit tests for services/publish_scheduler.py
+
+Covers the in-memory heap logic without touching the database:
+  - notify: ordering, ignoring posts without scheduled_time
+  - _pop_due: removes only entries whose time has come
+  - _seconds_until_next: empty queue, future and overdue posts
+  - background loop: fires the callback once a post becomes due,
+    puts due entries back and retries when the callback fails or is skipped
+  - reload: entries notified while the query runs are merged, not lost
+"""
+import sys
+import os
+import asyncio
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import services.publish_scheduler as publish_scheduler_module
+from services.publish_scheduler import PublishScheduler
+from utils.helpers import utc_now
+
+
+# ─── notify ───────────────────────────────────────────────────────────────────
+
+class TestNotify:
+    def test_next_due_is_earliest(self):
+        sched = PublishScheduler()
+        now = utc_now()
+        sched.notify(1, now + timedelta(hours=2))
+        sched.notify(2, now + timedelta(minutes=5))
+        sched.notify(3, now + timedelta(hours=1))
+        assert sched.next_due() == now + timedelta(minutes=5)
+
+    def test_none_time_ignored(self):
+        sched = PublishScheduler()
+        sched.notify(1, None)
+        assert sched.next_due() is None
+
+    def test_new_head_sets_wakeup(self):
+        sched = PublishScheduler()
+        now = utc_now()
+        sched.notify(1, now + timedelta(hours=1))
+        sched._wakeup.clear()
+        sched.notify(2, now + timedelta(hours=2))
+        assert not sched._wakeup.is_set()
+        sched.notify(3, now + timedelta(minutes=1))
+        assert sched._wakeup.is_set()
+
+
+# ─── _pop_due / _seconds_until_next ───────────────────────────────────────────
+
+class TestDueEntries:
+    def test_pop_due_removes_only_past_entries(self):
+        sched = PublishScheduler()
+        now = utc_now()
+        sched.notify(1, now - timedelta(minutes=2))
+        sched.notify(2, now - timedelta(seconds=1))
+        sched.notify(3, now + timedelta(hours=1))
+        assert [post_id for _, post_id in sched._pop_due()] == [1, 2]
+        assert sched.next_due() == now + timedelta(hours=1)
+
+    def test_seconds_until_next_empty(self):
+        assert PublishScheduler()._seconds_until_next() is None
+
+    def test_seconds_until_next_overdue_is_zero(self):
+        sched = PublishScheduler()
+        sched.notify(1, utc_now() - timedelta(minutes=10))
+        assert sched._seconds_until_next() == 0
+
+    def test_seconds_until_next_future(self):
+        sched = PublishScheduler()
+        sched.notify(1, utc_now() + timedelta(minutes=10))
+        assert 590 < sched._seconds_until_next() <= 600
+
+
+# ─── background loop ──────────────────────────────────────────────────────────
+
+class TestRunLoop:
+    @pytest.mark.asyncio
+    async def test_callback_fires_when_post_due(self):
+        sched = PublishScheduler()
+        fired = asyncio.Event()
+
+        async def callback():
+            fired.set()
+
+        sched.start(callback)
+        try:
+            sched.notify(1, utc_now() + timedelta(milliseconds=50))
+            await asyncio.wait_for(fired.wait(), timeout=2)
+            assert sched.next_due() is None
+        finally:
+            await sched.stop()
+
+    @pytest.mark.asyncio
+    async def test_callback_not_fired_for_future_post(self):
+        sched = PublishScheduler()
+        calls = []
+
+        async def callback():
+            calls.append(1)
+
+        sched.start(callback)
+        try:
+            sched.notify(1, utc_now() + timedelta(hours=1))
+            await asyncio.sleep(0.05)
+            assert calls == []
+        finally:
+            await sched.stop()
+
+    @pytest.mark.asyncio
+    async def test_skipped_run_is_retried(self):
+        sched = PublishScheduler(retry_delay=0.01)
+        results = [False, True]
+        calls = []
+
+        async def callback():
+            calls.append(1)
+            return results.pop(0)
+
+        sched.start(callback)
+        try:
+            sched.notify(1, utc_now())
+            await asyncio.sleep(0.2)
+            assert len(calls) == 2
+            assert sched.next_due() is None
+        finally:
+            await sched.stop()
+
+    @pytest.mark.asyncio
+    async def test_failed_run_puts_entries_back(self):
+        sched = PublishScheduler(retry_delay=60)
+        due = utc_now()
+        calls = []
+
+        async def callback():
+            calls.append(1)
+            raise RuntimeError("publish failed")
+
+        sched.start(callback)
+        try:
+            sched.notify(1, due)
+            await asyncio.sleep(0.05)
+            assert calls == [1]
+            assert sched._heap == [(due, 1)]
+        finally:
+            await sched.stop()
+
+
+# ─── reload ───────────────────────────────────────────────────────────────────
+
+class _FakeSession:
+    def __init__(self, rows, during_query=None):
+        self.rows = rows
+        self.during_query = during_query
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params=None):
+        if self.during_query is not None:
+            self.during_query()
+        result = MagicMock()
+        result.all.return_value = self.rows
+        return result
+
+
+class TestReload:
+    @pytest.mark.asyncio
+    async def test_replaces_heap_with_database_rows(self):
+        sched = PublishScheduler()
+        now = utc_now()
+        sched.notify(99, now + timedelta(days=1))
+        session = _FakeSession([(now + timedelta(hours=1), 1)])
+        with patch.object(publish_scheduler_module, "async_session_maker", lambda: session):
+            await sched.reload()
+        assert sched._heap == [(now + timedelta(hours=1), 1)]
+
+    @pytest.mark.asyncio
+    async def test_notify_during_query_is_kept(self):
+        sched = PublishScheduler()
+        now = utc_now()
+        # Пост одобрен, пока reload ждёт ответа БД
+        session = _FakeSession(
+            [(now + timedelta(hours=1), 1)],
+            during_query=lambda: sched.notify(2, now + timedelta(minutes=5)),
+        )
+        with patch.object(publish_scheduler_module, "async_session_maker", lambda: session):
+            await sched.reload()
+        assert sched.next_due() == now + timedelta(minutes=5)
+        assert sorted(post_id for _, post_id in sched._heap) == [1, 2]
+        assert sched._journals == []
@@ -0,0 +1,173 @@
+"""
+Unit tests for services/rate_limiter.py
+
+Covers the token-bucket arithmetic with a fake clock (no real sleeping):
+  - TokenBucket.try_acquire: burst capacity, wait time, refill over time
+  - TokenBucket.acquire: waits for a token when the bucket is empty
+  - TelegramRateLimiter: per-chat buckets for groups vs private chats,
+    pruning of idle buckets
+  - AdaptiveRateLimiter: halves the rate and pauses on RetryAfter, recovers on success
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import patch
+
+import services.rate_limiter as rl_mod
+from services.rate_limiter import (
+    AdaptiveRateLimiter,
+    TokenBucket,
+    TelegramRateLimiter,
+    GROUP_CHAT_BURST,
+    PRIVATE_CHAT_RATE,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+# ─── TokenBucket.try_acquire ──────────────────────────────────────────────────
+
+class TestTokenBucketTryAcquire:
+    def test_starts_full(self):
+        bucket = TokenBucket(rate=1, capacity=3, clock=FakeClock())
+        assert bucket.try_acquire() == 0
+        assert bucket.try_acquire() == 0
+        assert bucket.try_acquire() == 0
+
+    def test_returns_wait_time_when_empty(self):
+        bucket = TokenBucket(rate=2, capacity=1, clock=FakeClock())
+        assert bucket.try_acquire() == 0
+        assert bucket.try_acquire() == pytest.approx(0.5)
+
+    def test_refills_over_time(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, capacity=1, clock=clock)
+        bucket.try_acquire()
+        clock.advance(1.0)
+        assert bucket.try_acquire() == 0
+
+    def test_refill_capped_at_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=10, capacity=2, clock=clock)
+        clock.advance(100)
+        assert bucket.try_acquire() == 0
+        assert bucket.try_acquire() == 0
+        assert bucket.try_acquire() > 0
+
+    def test_is_full(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, capacity=2, clock=clock)
+        assert bucket.is_full()
+        bucket.try_acquire()
+        assert not bucket.is_full()
+        clock.advance(1)
+        assert bucket.is_full()
+
+
+# ─── TokenBucket.acquire ──────────────────────────────────────────────────────
+
+class TestTokenBucketAcquire:
+    @pytest.mark.asyncio
+    async def test_sleeps_until_token_available(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=4, capacity=1, clock=clock)
+        sleeps = []
+
+        async def fake_sleep(seconds):
+            sleeps.append(seconds)
+            clock.advance(seconds)
+
+        with patch("services.rate_limiter.asyncio.sleep", new=fake_sleep):
+            await bucket.acquire()
+            await bucket.acquire()
+
+        assert sleeps == [pytest.approx(0.25)]
+
+
+# ─── TelegramRateLimiter ──────────────────────────────────────────────────────
+
+class TestTelegramRateLimiter:
+    def test_group_bucket_uses_group_rate(self):
+        limiter = TelegramRateLimiter(global_rate=30, group_rate_per_min=20, clock=FakeClock())
+        bucket = limiter._bucket_for(-1001234567890)
+        assert bucket.rate == pytest.approx(20 / 60)
+        assert bucket.capacity == GROUP_CHAT_BURST
+
+    def test_private_bucket_uses_private_rate(self):
+        limiter = TelegramRateLimiter(global_rate=30, group_rate_per_min=20, clock=FakeClock())
+        bucket = limiter._bucket_for(123456)
+        assert bucket.rate == PRIVATE_CHAT_RATE
+        assert bucket.capacity == 1
+
+    def test_same_chat_reuses_bucket(self):
+        limiter = TelegramRateLimiter(clock=FakeClock())
+        assert limiter._bucket_for(42) is limiter._bucket_for(42)
+
+    def test_evicts_least_recently_used_bucket(self, monkeypatch):
+        monkeypatch.setattr(rl_mod, "MAX_CHAT_BUCKETS", 2)
+        limiter = TelegramRateLimiter(clock=FakeClock())
+        first = limiter._bucket_for(1)
+        limiter._bucket_for(2)
+        assert limiter._bucket_for(1) is first  # чат 1 снова использован
+        limiter._bucket_for(3)
+        # Дольше всех не использовался чат 2 — его ведро удалено
+        assert list(limiter._chats) == [1, 3]
+
+    @pytest.mark.asyncio
+    async def test_acquire_takes_chat_and_global_tokens(self):
+        clock = FakeClock()
+        limiter = TelegramRateLimiter(global_rate=5, group_rate_per_min=60, clock=clock)
+        await limiter.acquire(-100)
+        assert limiter._bucket_for(-100).try_acquire(GROUP_CHAT_BURST) > 0
+        assert limiter._global.try_acquire(5) > 0
+
+
+# ─── AdaptiveRateLimiter ──────────────────────────────────────────────────────
+
+class TestAdaptiveRateLimiter:
+    def test_retry_after_halves_rate_with_floor(self):
+        limiter = AdaptiveRateLimiter(max_rate=20, min_rate=4, clock=FakeClock())
+        limiter.on_retry_after(1)
+        assert limiter.rate == 10
+        limiter.on_retry_after(1)
+        limiter.on_retry_after(1)
+        assert limiter.rate == 4
+
+    def test_success_recovers_up_to_max(self):
+        limiter = AdaptiveRateLimiter(max_rate=4, min_rate=1, increase=1.0, clock=FakeClock())
+        limiter.on_retry_after(1)
+        assert limiter.rate == 2
+        limiter.on_success()
+        assert limiter.rate == pytest.approx(2.5)
+        for _ in range(100):
+            limiter.on_success()
+        assert limiter.rate == 4
+
+    @pytest.mark.asyncio
+    async def test_acquire_waits_for_pause_without_burst(self):
+        clock = FakeClock()
+        limiter = AdaptiveRateLimiter(max_rate=10, clock=clock)
+        sleeps = []
+
+        async def fake_sleep(seconds):
+            sleeps.append(seconds)
+            clock.advance(seconds)
+
+        limiter.on_retry_after(3)
+        with patch("services.rate_limiter.asyncio.sleep", new=fake_sleep):
+            await limiter.acquire()
+        assert sleeps[0] == pytest.approx(3)
+        # После паузы запас токенов не накоплен: первая отправка ждёт токен
+        assert sum(sleeps) == pytest.approx(3 + 1 / 5)
@@ -0,0 +1,152 @@
+"""
+Unit tests for services/rollups.py
+
+The database session is mocked:
+  - day_ranges: merging dirty days into contiguous [start, end) ranges
+  - RollupRefresher.mark_*: dirty-day tracking from timestamps
+  - confirmed orders without paid_at: revenue bucketed by created_at
+  - flush: one refresh per range, commit, metric-cache invalidation,
+    days re-queued when the refresh fails
+"""
+import sys
+import os
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import services.rollups as rollups
+from services.rollups import RollupRefresher, day_ranges
+
+
+class _FakeSession:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+        self.commit = AsyncMock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params=None):
+        if self.fail:
+            raise RuntimeError("db down")
+        self.calls.append((str(statement), params))
+        return MagicMock()
+
+
+def _refreshes(session, table):
+    return [params for sql, params in session.calls if sql.strip().startswith(f"INSERT INTO {table}")]
+
+
+# ─── day_ranges ───────────────────────────────────────────────────────────────
+
+class TestDayRanges:
+    def test_empty(self):
+        assert day_ranges([]) == []
+
+    def test_contiguous_days_merged(self):
+        days = [date(2024, 1, 3), date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 2)]
+        assert day_ranges(days) == [(date(2024, 1, 1), date(2024, 1, 4))]
+
+    def test_gaps_split_ranges(self):
+        days = [date(2024, 1, 1), date(2024, 1, 5)]
+        assert day_ranges(days) == [
+            (date(2024, 1, 1), date(2024, 1, 2)),
+            (date(2024, 1, 5), date(2024, 1, 6)),
+        ]
+
+
+# ─── mark_order / mark_post ───────────────────────────────────────────────────
+
+class TestMark:
+    def test_order_marks_created_and_paid_days(self):
+        refresher = RollupRefresher()
+        refresher.mark_order(datetime(2024, 1, 1, 23, 0), datetime(2024, 1, 3, 1, 0))
+        assert refresher._order_days == {date(2024, 1, 1), date(2024, 1, 3)}
+        assert refresher._wakeup.is_set()
+
+    def test_confirmed_order_without_paid_at_marks_created_day(self):
+        refresher = RollupRefresher()
+        refresher.mark_order(datetime(2024, 1, 1, 23, 0), None)
+        assert refresher._order_days == {date(2024, 1, 1)}
+
+    def test_none_ignored(self):
+        refresher = RollupRefresher()
+        refresher.mark_order(None, None)
+        refresher.mark_post(None)
+        assert not refresher._order_days and not refresher._post_days
+        assert not refresher._wakeup.is_set()
+
+    def test_post_marks_publish_day(self):
+        refresher = RollupRefresher()
+        refresher.mark_post(datetime(2024, 2, 10, 12, 0))
+        assert refresher._post_days == {date(2024, 2, 10)}
+
+
+# ─── _REFRESH_ORDERS_SQL ──────────────────────────────────────────────────────
+
+class TestPaidBranch:
+    def _paid_branch(self):
+        return str(rollups._REFRESH_ORDERS_SQL).split("UNION ALL")[1]
+
+    def test_buckets_by_created_at_when_paid_at_is_null(self):
+        assert "CAST(COALESCE(o.paid_at, o.created_at) AS DATE)" in self._paid_branch()
+
+    def test_filters_by_created_at_when_paid_at_is_null(self):
+        branch = self._paid_branch()
+        assert "COALESCE(o.paid_at, o.created_at) >= :start" in branch
+        assert "COALESCE(o.paid_at, o.created_at) < :end" in branch
+        assert "o.paid_at >= :start" not in branch
+
+    def test_bounds_use_same_fallback(self):
+        assert "COALESCE(paid_at, created_at)" in str(rollups._BOUNDS_SQL)
+
+
+# ─── flush ────────────────────────────────────────────────────────────────────
+
+class TestFlush:
+    @pytest.mark.asyncio
+    async def test_refreshes_only_marked_days(self):
+        refresher = RollupRefresher()
+        refresher.mark_order(datetime(2024, 1, 1, 10), datetime(2024, 1, 2, 10))
+        refresher.mark_post(datetime(2024, 1, 5, 10))
+        session = _FakeSession()
+        with patch.object(rollups, "async_session_maker", lambda: session), \
+                patch.object(rollups, "invalidate_metrics") as invalidate:
+            await refresher.flush()
+
+        order_refreshes = _refreshes(session, "daily_order_stats")
+        post_refreshes = _refreshes(session, "daily_post_stats")
+        assert [(p["start_day"], p["end_day"]) for p in order_refreshes] == [
+            (date(2024, 1, 1), date(2024, 1, 3)),
+        ]
+        assert [(p["start_day"], p["end_day"]) for p in post_refreshes] == [
+            (date(2024, 1, 5), date(2024, 1, 6)),
+        ]
+        assert order_refreshes[0]["start"] == datetime(2024, 1, 1)
+        session.commit.assert_awaited_once()
+        assert invalidate.call_count == 2
+        assert not refresher._order_days and not refresher._post_days
+
+    @pytest.mark.asyncio
+    async def test_nothing_marked_no_query(self):
+        refresher = RollupRefresher()
+        session = _FakeSession()
+        with patch.object(rollups, "async_session_maker", lambda: session):
+            await refresher.flush()
+        assert session.calls == []
+
+    @pytest.mark.asyncio
+    async def test_failed_refresh_requeues_days(self):
+        refresher = RollupRefresher()
+        refresher.mark_order(datetime(2024, 1, 1, 10))
+        with patch.object(rollups, "async_session_maker", lambda: _FakeSession(fail=True)):
+            with pytest.raises(RuntimeError):
+                await refresher.flush()
+        assert refresher._order_days == {date(2024, 1, 1)}
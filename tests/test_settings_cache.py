@@ -0,0 +1,161 @@
+"""
+Unit tests for the settings cache in services/settings.py
+
+The database session is mocked:
+  - all bot_settings rows loaded with one query, later reads served from memory
+  - the cache is reloaded after SETTINGS_CACHE_TTL_SECONDS or invalidate()
+  - set_setting updates the cache and sends NOTIFY; a failed write invalidates
+  - concurrent loads share one query; a load overtaken by a change is not trusted
+  - get_manager_group_chat_id: value from the cache, env fallback
+"""
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import services.settings as settings
+from services.settings import SettingsCache, SETTINGS_NOTIFY_CHANNEL
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class _FakeSession:
+    def __init__(self, rows=(), fail=False, delay=0.0):
+        self.rows = list(rows)
+        self.fail = fail
+        self.delay = delay
+        self.statements = []
+        self.added = []
+        self.commit = AsyncMock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params=None):
+        if self.fail:
+            raise RuntimeError("db down")
+        self.statements.append((str(statement), params))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        result = MagicMock()
+        result.all.return_value = self.rows
+        return result
+
+    async def get(self, model, key):
+        return None
+
+    def add(self, obj):
+        self.added.append(obj)
+
+
+@pytest.fixture
+def fresh_cache():
+    cache = SettingsCache(ttl=60, clock=_Clock())
+    with patch.object(settings, "settings_cache", cache):
+        yield cache
+
+
+# ─── SettingsCache ────────────────────────────────────────────────────────────
+
+class TestSettingsCache:
+    @pytest.mark.asyncio
+    async def test_reads_served_from_memory(self, fresh_cache):
+        session = _FakeSession(rows=[("payment_link", "https://pay"), ("empty", None)])
+        with patch.object(settings, "async_session_maker", lambda: session):
+            assert await settings.get_setting("payment_link") == "https://pay"
+            assert await settings.get_setting("missing", "dflt") == "dflt"
+            assert await settings.get_setting("empty", "dflt") is None
+        assert len(session.statements) == 1
+
+    @pytest.mark.asyncio
+    async def test_reloaded_after_ttl(self, fresh_cache):
+        session = _FakeSession(rows=[("k", "v")])
+        with patch.object(settings, "async_session_maker", lambda: session):
+            await settings.get_setting("k")
+            fresh_cache._clock.now += 61
+            await settings.get_setting("k")
+        assert len(session.statements) == 2
+
+    @pytest.mark.asyncio
+    async def test_concurrent_loads_share_query(self, fresh_cache):
+        session = _FakeSession(rows=[("k", "v")], delay=0.01)
+        with patch.object(settings, "async_session_maker", lambda: session):
+            results = await asyncio.gather(*(settings.get_setting("k") for _ in range(5)))
+        assert results == ["v"] * 5
+        assert len(session.statements) == 1
+
+    @pytest.mark.asyncio
+    async def test_load_overtaken_by_change_not_trusted(self, fresh_cache):
+        session = _FakeSession(rows=[("k", "old")], delay=0.01)
+        with patch.object(settings, "async_session_maker", lambda: session):
+            load = asyncio.ensure_future(fresh_cache.load())
+            await asyncio.sleep(0)
+            fresh_cache.put("k", "new")
+            await load
+        assert fresh_cache._values["k"] == "new"
+        assert not fresh_cache.is_fresh()
+
+    @pytest.mark.asyncio
+    async def test_db_error_returns_default(self, fresh_cache):
+        with patch.object(settings, "async_session_maker", lambda: _FakeSession(fail=True)):
+            assert await settings.get_setting("k", "dflt") == "dflt"
+
+
+# ─── set_setting ──────────────────────────────────────────────────────────────
+
+class TestSetSetting:
+    @pytest.mark.asyncio
+    async def test_updates_cache_and_notifies(self, fresh_cache):
+        load_session = _FakeSession(rows=[("k", "old")])
+        with patch.object(settings, "async_session_maker", lambda: load_session):
+            await fresh_cache.load()
+        write_session = _FakeSession()
+        with patch.object(settings, "async_session_maker", lambda: write_session):
+            await settings.set_setting("k", "new", updated_by=1)
+            assert await settings.get_setting("k") == "new"
+        sql, params = write_session.statements[0]
+        assert "pg_notify" in sql
+        assert params == {"channel": SETTINGS_NOTIFY_CHANNEL, "key": "k"}
+        write_session.commit.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_failed_write_invalidates(self, fresh_cache):
+        with patch.object(settings, "async_session_maker", lambda: _FakeSession(rows=[("k", "v")])):
+            await fresh_cache.load()
+        with patch.object(settings, "async_session_maker", lambda: _FakeSession(fail=True)):
+            await settings.set_setting("k", "new")
+        assert not fresh_cache.is_fresh()
+
+    def test_notify_invalidates(self, fresh_cache):
+        fresh_cache._expires_at = fresh_cache._clock() + 60
+        fresh_cache._on_notify(None, 1, SETTINGS_NOTIFY_CHANNEL, "k")
+        assert not fresh_cache.is_fresh()
+
+
+# ─── get_manager_group_chat_id ────────────────────────────────────────────────
+
+class TestManagerGroupChatId:
+    @pytest.mark.asyncio
+    async def test_value_from_cache(self, fresh_cache):
+        session = _FakeSession(rows=[(settings.MANAGER_GROUP_CHAT_ID_KEY, "-100500")])
+        with patch.object(settings, "async_session_maker", lambda: session):
+            assert await settings.get_manager_group_chat_id() == -100500
+
+    @pytest.mark.asyncio
+    async def test_env_fallback(self, fresh_cache):
+        with patch.object(settings, "async_session_maker", lambda: _FakeSession()), \
+                patch("config.MANAGER_GROUP_CHAT_ID", -42):
+            assert await settings.get_manager_group_chat_id() == -42
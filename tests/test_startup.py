@@ -0,0 +1,178 @@
+"""
+Unit tests for services/startup.py
+
+Covers the staged startup tracker with a fake clock:
+  - critical-path stages timed and logged
+  - background stages run concurrently, failures recorded without stopping others
+  - readiness time measured from process start
+  - wait_background reports the total startup time; stop cancels unfinished stages
+  - ImportProfiler splits import time into own and cumulative per module
+  - importing the services package does not load the rarely used subsystems
+"""
+import sys
+import os
+import asyncio
+import subprocess
+import textwrap
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from services.startup import ImportProfiler, StartupTracker
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+# ─── Critical path ────────────────────────────────────────────────────────────
+
+class TestCriticalPath:
+    @pytest.mark.asyncio
+    async def test_stage_timed(self):
+        clock = _Clock()
+        tracker = StartupTracker(process_started=98.0, clock=clock)
+        async with tracker.stage("db"):
+            clock.now += 1.5
+        assert tracker.timings["db"] == pytest.approx(1.5)
+
+    @pytest.mark.asyncio
+    async def test_stage_timed_on_error(self):
+        tracker = StartupTracker(clock=_Clock())
+        with pytest.raises(RuntimeError):
+            async with tracker.stage("db"):
+                raise RuntimeError("db down")
+        assert "db" in tracker.timings
+
+    def test_ready_measured_from_process_start(self):
+        clock = _Clock()
+        tracker = StartupTracker(process_started=97.5, clock=clock)
+        assert tracker.mark_ready() == pytest.approx(2.5)
+        assert tracker.ready_after == pytest.approx(2.5)
+
+
+# ─── Background stages ────────────────────────────────────────────────────────
+
+class TestBackground:
+    @pytest.mark.asyncio
+    async def test_stages_run_concurrently(self):
+        gate = asyncio.Event()
+        order = []
+
+        async def slow():
+            await gate.wait()
+            order.append("slow")
+
+        async def fast():
+            order.append("fast")
+            gate.set()
+
+        tracker = StartupTracker(clock=_Clock())
+        tracker.background("slow", slow())
+        tracker.background("fast", fast())
+        assert tracker.pending() == 2
+        await tracker.wait_background()
+        assert order == ["fast", "slow"]
+        assert tracker.pending() == 0
+
+    @pytest.mark.asyncio
+    async def test_failure_recorded_others_complete(self):
+        done = []
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        async def fine():
+            done.append(True)
+
+        tracker = StartupTracker(clock=_Clock())
+        tracker.background("broken", broken())
+        tracker.background("fine", fine())
+        await tracker.wait_background()
+        assert tracker.failed == ["broken"]
+        assert done == [True]
+        assert set(tracker.timings) == {"broken", "fine"}
+
+    @pytest.mark.asyncio
+    async def test_total_time_reported(self):
+        clock = _Clock()
+        tracker = StartupTracker(process_started=90.0, clock=clock)
+
+        async def work():
+            clock.now += 4
+
+        tracker.background("work", work())
+        assert await tracker.wait_background() == pytest.approx(14.0)
+
+
+    @pytest.mark.asyncio
+    async def test_stop_cancels_pending_stages_and_summary(self):
+        gate = asyncio.Event()
+        tracker = StartupTracker(clock=_Clock())
+        tracker.background("hang", gate.wait())
+        summary = tracker.summarize_in_background()
+        await asyncio.sleep(0)
+        await tracker.stop()
+        assert summary.cancelled()
+        assert tracker.pending() == 0
+
+
+# ─── Import profile ───────────────────────────────────────────────────────────
+
+class TestImportProfiler:
+    def test_own_and_cumulative_time(self, tmp_path, monkeypatch):
+        (tmp_path / "prof_outer.py").write_text("import time\nimport prof_inner\ntime.sleep(0.02)\n")
+        (tmp_path / "prof_inner.py").write_text("import time\ntime.sleep(0.05)\n")
+        monkeypatch.syspath_prepend(str(tmp_path))
+        profiler = ImportProfiler().install()
+        try:
+            __import__("prof_outer")
+        finally:
+            profiler.uninstall()
+            sys.modules.pop("prof_outer", None)
+            sys.modules.pop("prof_inner", None)
+        assert profiler.self_time["prof_inner"] >= 0.05
+        assert 0.02 <= profiler.self_time["prof_outer"] < 0.05
+        assert profiler.cumulative["prof_outer"] >= 0.07
+        assert profiler.total == pytest.approx(profiler.cumulative["prof_outer"])
+        assert profiler.slowest(1)[0][0] == "prof_inner"
+        assert "prof_inner" in profiler.report()
+
+    def test_loaded_modules_not_counted(self):
+        profiler = ImportProfiler().install()
+        try:
+            __import__("os")
+        finally:
+            profiler.uninstall()
+        assert profiler.cumulative == {}
+
+    def test_failed_import_still_unwinds(self):
+        profiler = ImportProfiler().install()
+        try:
+            with pytest.raises(ImportError):
+                __import__("prof_missing_module")
+        finally:
+            profiler.uninstall()
+        assert "prof_missing_module" in profiler.cumulative
+        assert profiler._stack == []
+
+
+class TestLazyServices:
+    def test_subsystems_loaded_on_first_use(self):
+        code = textwrap.dedent("""
+            import sys
+            import services
+            heavy = ("services.ai_trainer", "services.diagnostics", "services.error_library")
+            assert not [m for m in heavy if m in sys.modules]
+            from services import run_diagnostics
+            assert "services.diagnostics" in sys.modules
+            assert "services.ai_trainer" not in sys.modules
+        """)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
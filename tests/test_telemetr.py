@@ -0,0 +1,169 @@
+"""
+Unit tests for services/telemetr.py
+
+HTTP is mocked at the session level:
+  - one long-lived aiohttp session is reused across requests
+  - resolve_telegram_id / search_channel results cached without expiry
+  - get_channel_stats cached for TELEMETR_STATS_TTL_SECONDS
+  - HTTP 426 pauses all requests, backoff doubles and resets after success
+  - get_full_stats: a stored internal_id skips the channel lookup
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+import services.telemetr as telemetr
+from services.telemetr import TelemetrService
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Response:
+    def __init__(self, status, payload=None):
+        self.status = status
+        self.payload = payload
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def json(self):
+        return self.payload
+
+
+class _FakeHttp:
+    """Отдаёт ответы по очереди и запоминает запрошенные endpoint'ы."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+        self.closed = False
+
+    def get(self, url, params=None):
+        self.calls.append((url, params))
+        return self.responses.pop(0)
+
+
+def _service(*responses, clock=None):
+    service = TelemetrService(api_token="token", clock=clock or _Clock())
+    http = _FakeHttp(*responses)
+    service._session = http
+    service._bucket.acquire = AsyncMock()
+    return service, http
+
+
+# ─── Session ──────────────────────────────────────────────────────────────────
+
+class TestSession:
+    @pytest.mark.asyncio
+    async def test_session_created_once(self):
+        service = TelemetrService(api_token="token")
+        first = service._get_session()
+        assert service._get_session() is first
+        await service.close()
+        assert first.closed
+        assert service._session is None
+
+    @pytest.mark.asyncio
+    async def test_no_token_no_request(self):
+        service = TelemetrService(api_token="")
+        with patch.object(telemetr.aiohttp, "ClientSession") as session_cls:
+            assert await service._request("/v1/channel/stats") is None
+        session_cls.assert_not_called()
+
+
+# ─── Caches ───────────────────────────────────────────────────────────────────
+
+class TestCaches:
+    @pytest.mark.asyncio
+    async def test_resolve_cached(self):
+        service, http = _service(_Response(200, {"internal_id": "abc"}))
+        assert await service.resolve_telegram_id(-1001234) == "abc"
+        assert await service.resolve_telegram_id(-1001234) == "abc"
+        assert len(http.calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_resolve_not_cached(self):
+        service, http = _service(_Response(500), _Response(200, {"internal_id": "abc"}))
+        assert await service.resolve_telegram_id(-1001234) is None
+        assert await service.resolve_telegram_id(-1001234) == "abc"
+        assert len(http.calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_search_cached_case_insensitive(self):
+        service, http = _service(_Response(200, [{"internal_id": "x"}]))
+        assert (await service.search_channel("@MyChannel"))["internal_id"] == "x"
+        assert (await service.search_channel("mychannel"))["internal_id"] == "x"
+        assert http.calls[0][1]["term"] == "MyChannel"
+        assert len(http.calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_stats_cached_until_ttl(self):
+        clock = _Clock()
+        service, http = _service(
+            _Response(200, [{"title": "a"}]), _Response(200, [{"title": "b"}]), clock=clock,
+        )
+        assert (await service.get_channel_stats("x"))["title"] == "a"
+        assert (await service.get_channel_stats("x"))["title"] == "a"
+        clock.now += service.stats_ttl + 1
+        assert (await service.get_channel_stats("x"))["title"] == "b"
+        assert len(http.calls) == 2
+
+
+# ─── Quota ────────────────────────────────────────────────────────────────────
+
+class TestQuota:
+    @pytest.mark.asyncio
+    async def test_426_blocks_all_requests(self):
+        clock = _Clock()
+        service, http = _service(_Response(426), clock=clock)
+        assert await service._request("/a") is None
+        assert service.quota_blocked_for() > 0
+        assert await service._request("/b") is None
+        assert len(http.calls) == 1
+        assert service.quota_hits == 1
+
+    @pytest.mark.asyncio
+    async def test_backoff_doubles_and_resets(self):
+        clock = _Clock()
+        service, http = _service(_Response(426), _Response(426), _Response(200, {}), clock=clock)
+        base = telemetr.TELEMETR_QUOTA_BACKOFF_SECONDS
+        await service._request("/a")
+        assert service.quota_blocked_for() == pytest.approx(base)
+        clock.now += base
+        await service._request("/a")
+        assert service.quota_blocked_for() == pytest.approx(min(base * 2, telemetr.TELEMETR_QUOTA_BACKOFF_MAX_SECONDS))
+        clock.now += 10 * telemetr.TELEMETR_QUOTA_BACKOFF_MAX_SECONDS
+        await service._request("/a")
+        assert service._backoff == base
+
+    @pytest.mark.asyncio
+    async def test_requests_counted(self):
+        service, _ = _service(_Response(200, {}), _Response(404))
+        await service._request("/a")
+        await service._request("/b")
+        assert service.requests_made == 2
+
+
+# ─── get_full_stats ───────────────────────────────────────────────────────────
+
+class TestFullStats:
+    @pytest.mark.asyncio
+    async def test_stored_internal_id_skips_lookup(self):
+        service, http = _service(_Response(200, [{"members_count": 7, "avg_post_views": {}}]))
+        stats = await service.get_full_stats(telegram_id=-1001234, username="ch", internal_id="abc")
+        assert stats["internal_id"] == "abc"
+        assert stats["subscribers"] == 7
+        assert [url for url, _ in http.calls] == [f"{service.base_url}/v1/channel/stats"]
@@ -0,0 +1,144 @@
+"""
+Unit tests for PostViewBuffer in services/channel_collector.py
+
+The database session is mocked:
+  - add: keeps the maximum views / reactions / forwards per message,
+    drops updates of non-ad posts without touching the database
+  - flush: a bounded number of statements regardless of update count,
+    analytics written with one ON CONFLICT upsert, snapshots throttled per post, data returned to the buffer when the
+    write fails
+"""
+import sys
+import os
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.dialects import postgresql
+
+import services.channel_collector as collector
+from services.ad_index import AdMessageIndex
+from services.channel_collector import PostViewBuffer
+
+
+class _FakeSession:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.statements = []
+        self.commit = AsyncMock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params=None):
+        if self.fail:
+            raise RuntimeError("db down")
+        self.statements.append((statement, params))
+        result = MagicMock()
+        result.all.return_value = []
+        return result
+
+
+@pytest.fixture(autouse=True)
+def ad_index():
+    index = AdMessageIndex()
+    for message_id, post_id in ((1, 11), (2, 12)):
+        index.add_post(post_id, 7, -100, message_id, posted_at=datetime(2024, 1, 1, 12))
+    with patch.object(collector, "ad_message_index", index), \
+            patch.object(collector, "invalidate_metrics"), \
+            patch.object(collector.rollup_refresher, "mark_post"):
+        yield index
+
+
+# ─── add ──────────────────────────────────────────────────────────────────────
+
+class TestAdd:
+    def test_keeps_maximum(self):
+        buf = PostViewBuffer()
+        buf.add(-100, 1, views=10, reactions=3, forwards=0)
+        buf.add(-100, 1, views=8, reactions=5, forwards=1)
+        assert buf._pending[(-100, 1)] == [10, 5, 1]
+
+    def test_separate_messages(self):
+        buf = PostViewBuffer()
+        buf.add(-100, 1, 10)
+        buf.add(-100, 2, 20)
+        assert len(buf._pending) == 2
+
+    def test_non_ad_post_dropped(self):
+        buf = PostViewBuffer()
+        assert buf.add(-100, 5, 10) is False
+        assert buf.add(-200, 1, 10) is False
+        assert buf._pending == {}
+
+
+# ─── flush ────────────────────────────────────────────────────────────────────
+
+class TestFlush:
+    @pytest.mark.asyncio
+    async def test_statement_count_independent_of_updates(self):
+        buf = PostViewBuffer()
+        for views in range(100):
+            buf.add(-100, 1, views)
+            buf.add(-100, 2, views)
+        session = _FakeSession()
+        with patch.object(collector, "async_session_maker", lambda: session):
+            written = await buf.flush()
+        assert written == 2
+        # upsert, last-snapshot lookup, snapshot INSERT
+        assert len(session.statements) == 3
+        session.commit.assert_awaited_once()
+        snapshot_rows = session.statements[-1][1]
+        assert sorted(r["views"] for r in snapshot_rows) == [99, 99]
+        assert buf._pending == {}
+
+    @pytest.mark.asyncio
+    async def test_analytics_written_with_single_upsert(self):
+        buf = PostViewBuffer()
+        buf.add(-100, 1, 10)
+        session = _FakeSession()
+        with patch.object(collector, "async_session_maker", lambda: session):
+            await buf.flush()
+        sql = str(session.statements[0][0].compile(dialect=postgresql.dialect()))
+        assert sql.startswith("INSERT INTO post_analytics")
+        assert "ON CONFLICT (scheduled_post_id) DO UPDATE" in sql
+        assert "greatest(post_analytics.views, excluded.views)" in sql
+
+    @pytest.mark.asyncio
+    async def test_post_removed_before_flush_skipped(self, ad_index):
+        buf = PostViewBuffer()
+        buf.add(-100, 1, 10)
+        ad_index.remove_post(7, 1)
+        session = _FakeSession()
+        with patch.object(collector, "async_session_maker", lambda: session):
+            assert await buf.flush() == 0
+        assert session.statements == []
+
+    @pytest.mark.asyncio
+    async def test_snapshot_throttled_after_first_flush(self):
+        buf = PostViewBuffer()
+        buf.add(-100, 1, 10)
+        first = _FakeSession()
+        with patch.object(collector, "async_session_maker", lambda: first):
+            await buf.flush()
+        buf.add(-100, 1, 20)
+        second = _FakeSession()
+        with patch.object(collector, "async_session_maker", lambda: second):
+            await buf.flush()
+        # Снимок свежий: только upsert
+        assert len(second.statements) == 1
+
+    @pytest.mark.asyncio
+    async def test_failure_returns_data_to_buffer(self):
+        buf = PostViewBuffer()
+        buf.add(-100, 1, 10, 2, 1)
+        with patch.object(collector, "async_session_maker", lambda: _FakeSession(fail=True)):
+            with pytest.raises(RuntimeError):
+                await buf.flush()
+        buf.add(-100, 1, 5)
+        assert buf._pending[(-100, 1)] == [10, 2, 1]
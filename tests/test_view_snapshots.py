@@ -0,0 +1,157 @@
+"""
+Unit tests for services/view_snapshots.py
+
+The database session is mocked:
+  - fetch_view_series: one aggregated query, rows turned into (ts, views) series
+  - views_at: last point at or before a moment
+  - compaction_bounds: hourly zone for SNAPSHOT_HOURLY_DAYS, daily zone before it
+  - maintain_view_snapshots: full-history compaction once, then the lookback window
+  - ensure_partitions: current month plus PARTITION_MONTHS_AHEAD
+"""
+import sys
+import os
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.dialects import postgresql
+
+import services.view_snapshots as view_snapshots
+from services.view_snapshots import (
+    PARTITION_MONTHS_AHEAD,
+    compaction_bounds,
+    ensure_partitions,
+    fetch_view_series,
+    maintain_view_snapshots,
+    views_at,
+)
+
+
+class _FakeSession:
+    def __init__(self, rows=(), scalar=0):
+        self.rows = list(rows)
+        self.scalar = scalar
+        self.statements = []
+        self.commit = AsyncMock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params=None):
+        self.statements.append((statement, params))
+        result = MagicMock()
+        result.all.return_value = self.rows
+        result.scalar.return_value = self.scalar
+        return result
+
+
+# ─── fetch_view_series ────────────────────────────────────────────────────────
+
+class TestFetchViewSeries:
+    @pytest.mark.asyncio
+    async def test_rows_become_series(self):
+        t1, t2 = datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 11)
+        session = _FakeSession(rows=[(11, [t1, t2], [5, None])])
+        series = await fetch_view_series(session, [11, 12])
+        assert series == {11: [(t1, 5), (t2, 0)]}
+        assert len(session.statements) == 1
+        sql = str(session.statements[0][0].compile(dialect=postgresql.dialect()))
+        assert "array_agg" in sql
+        assert "GROUP BY post_view_snapshots.scheduled_post_id" in sql
+
+    @pytest.mark.asyncio
+    async def test_no_posts_no_query(self):
+        session = _FakeSession()
+        assert await fetch_view_series(session, []) == {}
+        assert session.statements == []
+
+
+# ─── views_at ─────────────────────────────────────────────────────────────────
+
+class TestViewsAt:
+    SERIES = [
+        (datetime(2024, 1, 1, 10), 100),
+        (datetime(2024, 1, 1, 11), 150),
+        (datetime(2024, 1, 2, 10), 400),
+    ]
+
+    def test_last_point_not_after_moment(self):
+        assert views_at(self.SERIES, datetime(2024, 1, 1, 12)) == 150
+
+    def test_exact_moment_included(self):
+        assert views_at(self.SERIES, datetime(2024, 1, 2, 10)) == 400
+
+    def test_before_first_point(self):
+        assert views_at(self.SERIES, datetime(2024, 1, 1, 9)) is None
+
+    def test_empty_series(self):
+        assert views_at([], datetime(2024, 1, 1)) is None
+
+
+# ─── compaction_bounds ────────────────────────────────────────────────────────
+
+class TestCompactionBounds:
+    def test_zones(self):
+        bounds = compaction_bounds(datetime(2024, 3, 20, 15, 42), hourly_days=7)
+        assert bounds["hourly_before"] == datetime(2024, 3, 20, 15)
+        assert bounds["daily_before"] == datetime(2024, 3, 13)
+        assert bounds["since"] < bounds["daily_before"]
+
+    def test_full_range(self):
+        now = datetime(2024, 3, 20, 15, 42)
+        assert compaction_bounds(now, full=True)["since"] < datetime(2000, 1, 1)
+        assert compaction_bounds(now)["since"] > datetime(2024, 1, 1)
+
+
+# ─── maintain_view_snapshots ──────────────────────────────────────────────────
+
+class TestMaintain:
+    @pytest.mark.asyncio
+    async def test_full_compaction_once(self):
+        settings = {}
+
+        async def get_setting(key, default=None):
+            return settings.get(key, default)
+
+        async def set_setting(key, value):
+            settings[key] = value
+
+        with patch.object(view_snapshots, "ensure_partitions", new=AsyncMock()), \
+             patch.object(view_snapshots, "compact_snapshots", new=AsyncMock(return_value=0)) as compact, \
+             patch.object(view_snapshots, "get_setting", get_setting), \
+             patch.object(view_snapshots, "set_setting", set_setting):
+            await maintain_view_snapshots()
+            await maintain_view_snapshots()
+        assert [c.kwargs["full"] for c in compact.await_args_list] == [True, False]
+
+    @pytest.mark.asyncio
+    async def test_failed_full_compaction_retried(self):
+        set_setting = AsyncMock()
+        with patch.object(view_snapshots, "ensure_partitions", new=AsyncMock()), \
+             patch.object(view_snapshots, "compact_snapshots", new=AsyncMock(side_effect=RuntimeError("db"))), \
+             patch.object(view_snapshots, "get_setting", new=AsyncMock(return_value=None)), \
+             patch.object(view_snapshots, "set_setting", set_setting):
+            await maintain_view_snapshots()
+        set_setting.assert_not_awaited()
+
+
+# ─── ensure_partitions ────────────────────────────────────────────────────────
+
+class TestEnsurePartitions:
+    @pytest.mark.asyncio
+    async def test_range_covers_months_ahead(self):
+        session = _FakeSession(scalar=1)
+        with patch.object(view_snapshots, "async_session_maker", lambda: session):
+            created = await ensure_partitions(datetime(2024, 11, 15, 8))
+        assert created == 1
+        params = session.statements[0][1]
+        assert params["from_ts"] == datetime(2024, 11, 1)
+        # Два месяца вперёд через границу года
+        assert PARTITION_MONTHS_AHEAD == 2
+        assert params["to_ts"] == datetime(2025, 1, 1)
+        session.commit.assert_awaited_once()